@@ -0,0 +1 @@
+"""Benchmarks for the DeepCell Label backend."""
@@ -0,0 +1,110 @@
+"""
+Benchmarks the size and time to compress payloads with each codec.
+
+Compresses labeled frames like the ones sent in edit responses,
+and a zlib compressed OME TIFF like the ones in project and export zips.
+deflate* deflates the TIFF again as the zips did before TIFFs were always stored.
+
+Run from the backend folder with
+
+    python -m benchmarks.bench_compression
+"""
+
+import argparse
+import io
+import timeit
+import zipfile
+
+import numpy as np
+import tifffile
+from skimage.segmentation import expand_labels
+
+from deepcell_label.compression import Codec, read_member
+
+
+def make_labels(size, cells, seed=0):
+    """Makes a frame with about cells round cells that touch like a dense segmentation."""
+    rng = np.random.default_rng(seed)
+    labels = np.zeros((size, size), dtype=np.int32)
+    points = rng.integers(0, size, size=(cells, 2))
+    labels[points[:, 0], points[:, 1]] = np.arange(1, cells + 1)
+    radius = max(1, int(size / np.sqrt(cells) / 2))
+    return expand_labels(labels, radius)
+
+
+def make_tiff(labels):
+    """Writes the frame to a zlib compressed OME TIFF like Loader and Export."""
+    f = io.BytesIO()
+    tifffile.imwrite(f, labels, ome=True, compression='zlib')
+    return f.getvalue()
+
+
+class DeflateAgain(object):
+    """Deflates every member like the zips did before Codec, including TIFFs."""
+
+    name = 'deflate*'
+    level = None
+
+    def write(self, zf, name, data):
+        zf.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+
+
+def write_zip(codec, name, data):
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        codec.write(zf, name, data)
+    return f
+
+
+def read_zip(f, name):
+    with zipfile.ZipFile(f) as zf:
+        return read_member(zf, name)
+
+
+def best_time(fn, args, repeat):
+    """Returns the fastest time in seconds to call fn with args."""
+    return min(timeit.repeat(lambda: fn(*args), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    codecs = [
+        Codec('stored'),
+        Codec('deflate', 1),
+        Codec('deflate', 6),
+        Codec('deflate', 9),
+        Codec('zstd', 1),
+        Codec('zstd', 3),
+        Codec('zstd', 9),
+        Codec('lz4'),
+    ]
+    # TIFFs are always stored, so only compare with deflating them again
+    tiff_codecs = [Codec('stored'), DeflateAgain()]
+    print(
+        f'{"payload":>22} {"codec":>10} {"level":>5}'
+        f' {"bytes":>10} {"ratio":>7} {"write (ms)":>11} {"read (ms)":>10}'
+    )
+    for size, cells in [(512, 200), (2048, 2000), (4096, 8000)]:
+        labels = make_labels(size, cells)
+        payloads = [
+            (f'labeled.dat {size}', 'labeled.dat', labels.tobytes(), codecs),
+            (f'y.ome.tiff {size}', 'y.ome.tiff', make_tiff(labels), tiff_codecs),
+        ]
+        for label, name, data, payload_codecs in payloads:
+            for codec in payload_codecs:
+                f = write_zip(codec, name, data)
+                write = best_time(write_zip, (codec, name, data), args.repeat)
+                read = best_time(read_zip, (f, name), args.repeat)
+                nbytes = len(f.getvalue())
+                print(
+                    f'{label:>22} {codec.name:>10} {str(codec.level):>5}'
+                    f' {nbytes:>10} {len(data) / nbytes:>6.1f}x'
+                    f' {write * 1000:>11.2f} {read * 1000:>10.2f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
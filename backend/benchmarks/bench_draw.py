@@ -0,0 +1,68 @@
+"""
+Benchmarks rasterizing brush strokes for the draw action.
+
+Compares draw_stroke with the previous approach of stamping
+skimage.draw.disk into a full-frame mask for each point in the trace.
+
+Run from the backend folder with
+
+    python -m benchmarks.bench_draw
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import skimage.draw
+
+from deepcell_label.label import draw_stroke
+
+
+def stamp_disks(trace, radius, shape):
+    """Draws the stroke the way action_draw did before draw_stroke."""
+    mask = np.zeros(shape, dtype=bool)
+    for x, y in trace:
+        mask[skimage.draw.disk((y, x), radius, shape=shape)] = True
+    return mask
+
+
+def make_trace(length, shape, step, seed=0):
+    """Makes a random walk trace with length points that moves step pixels at a time."""
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    moves = rng.integers(-step, step + 1, size=(length, 2))
+    trace = np.cumsum(moves, axis=0) + (width // 2, height // 2)
+    return np.clip(trace, 0, (width - 1, height - 1)).tolist()
+
+
+def best_time(fn, args, repeat):
+    """Returns the fastest time in seconds to call fn with args."""
+    return min(timeit.repeat(lambda: fn(*args), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f'{"frame":>10} {"points":>7} {"step":>5} {"radius":>7}'
+        f' {"disks (ms)":>11} {"stroke (ms)":>12} {"speedup":>8}'
+    )
+    for size in [512, 2048]:
+        shape = (size, size)
+        for length, step in [(10, 1), (1000, 1), (200, 10), (5000, 1)]:
+            for radius in [2, 10, 50]:
+                trace = make_trace(length, shape, step)
+                stroke_args = (trace, radius, shape)
+                disks = best_time(stamp_disks, stroke_args, args.repeat)
+                stroke = best_time(draw_stroke, stroke_args, args.repeat)
+                print(
+                    f'{size:>5}x{size:<4} {length:>7} {step:>5} {radius:>7}'
+                    f' {disks * 1000:>11.2f} {stroke * 1000:>12.2f}'
+                    f' {disks / stroke:>7.1f}x'
+                )
+
+
+if __name__ == '__main__':
+    main()
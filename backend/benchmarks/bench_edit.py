@@ -0,0 +1,336 @@
+"""
+Benchmarks each Edit action on synthetic frames.
+
+Times sending an edit zip through Edit, like the /api/edit route,
+for every action and write mode on frames of each size and density,
+and measures the peak memory allocated during the edit with tracemalloc.
+
+Run from the backend folder with
+
+    python -m benchmarks.bench_edit --save baseline.json
+
+and compare later runs with the saved results with
+
+    python -m benchmarks.bench_edit --compare baseline.json
+
+which exits with status 1 when a case is slower or uses more memory
+than the baseline by more than the --tolerance.
+"""
+
+import argparse
+import io
+import json
+import statistics
+import sys
+import timeit
+import tracemalloc
+import zipfile
+
+import numpy as np
+from scipy import ndimage
+from skimage.segmentation import expand_labels
+
+from deepcell_label.label import Edit
+
+SIZES = [256, 512, 1024, 2048, 4096]
+# Fraction of the frame covered by cells and whether the cells overlap
+DENSITIES = {
+    'sparse': (0.1, False),
+    'dense': (0.9, False),
+    'overlap': (0.9, True),
+}
+MODES = ['overlap', 'overwrite', 'exclude']
+CELL_RADIUS = 10
+
+
+def make_frame(size, density, seed=0):
+    """
+    Makes a labeled frame with round cells, its cells, and a raw image.
+
+    Args:
+        size: height and width of the frame
+        density: key in DENSITIES
+
+    Returns:
+        dictionary with labels, cells, and raw arrays
+    """
+    coverage, overlap = DENSITIES[density]
+    rng = np.random.default_rng(seed)
+    num_cells = max(1, int(coverage * size * size / (np.pi * CELL_RADIUS**2)))
+    labels = np.zeros((size, size), dtype=np.int32)
+    points = rng.integers(0, size, size=(num_cells, 2))
+    labels[points[:, 0], points[:, 1]] = np.arange(1, num_cells + 1)
+    labels = expand_labels(labels, CELL_RADIUS)
+    cells = [{'value': v, 'cell': v} for v in np.unique(labels[labels > 0]).tolist()]
+
+    if overlap:
+        # Grow each cell into its neighbors and encode the shared pixels with new values
+        grown = ndimage.grey_dilation(labels, size=(5, 5))
+        shared = (grown != labels) & (labels != 0)
+        pairs = np.stack([labels[shared], grown[shared]], axis=1)
+        pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        new_values = np.arange(len(pairs)) + labels.max() + 1
+        labels[shared] = new_values[inverse.ravel()]
+        for value, (a, b) in zip(new_values.tolist(), pairs.tolist()):
+            cells += [{'value': value, 'cell': a}, {'value': value, 'cell': b}]
+
+    blurred = ndimage.gaussian_filter((labels > 0).astype(np.float32), 2)
+    noise = rng.normal(0, 0.1, size=labels.shape)
+    raw = np.clip((blurred + noise) * 200, 0, 255).astype(np.uint8)
+    return {'labels': labels, 'cells': cells, 'raw': raw}
+
+
+def center_cell(frame):
+    """Returns the cell nearest to the center of the frame and its bounding box."""
+    labels = frame['labels']
+    ys, xs = np.nonzero(labels)
+    height, width = labels.shape
+    nearest = np.argmin((ys - height // 2) ** 2 + (xs - width // 2) ** 2)
+    value = labels[ys[nearest], xs[nearest]]
+    cell = min(c['cell'] for c in frame['cells'] if c['value'] == value)
+    values = [c['value'] for c in frame['cells'] if c['cell'] == cell]
+    bbox = ndimage.find_objects(np.isin(labels, values).astype(np.int32))[0]
+    return cell, bbox
+
+
+def draw_args(frame):
+    """Draws a stroke with 100 points across the middle of the frame."""
+    height, width = frame['labels'].shape
+    xs = np.linspace(width // 4, 3 * width // 4, 100).astype(int)
+    ys = np.full(100, height // 2)
+    trace = np.stack([xs, ys], axis=1).tolist()
+    cell, _ = center_cell(frame)
+    return {'trace': json.dumps(trace), 'brush_size': 5, 'cell': cell}
+
+
+def erase_args(frame):
+    return {**draw_args(frame), 'erase': True}
+
+
+def cell_args(frame):
+    cell, _ = center_cell(frame)
+    return {'cell': cell}
+
+
+def seed_args(frame):
+    cell, (rows, cols) = center_cell(frame)
+    return {'cell': cell, 'x': (cols.start + cols.stop) // 2, 'y': rows.start}
+
+
+def flood_args(frame):
+    """Floods the background from the top left corner."""
+    cell, _ = center_cell(frame)
+    labels = frame['labels']
+    ys, xs = np.nonzero(labels == 0)
+    return {'foreground': cell, 'background': 0, 'x': int(xs[0]), 'y': int(ys[0])}
+
+
+def watershed_args(frame):
+    """Splits the center cell between its top left and bottom right corners."""
+    cell, (rows, cols) = center_cell(frame)
+    labels = frame['labels']
+    values = [c['value'] for c in frame['cells'] if c['cell'] == cell]
+    ys, xs = np.nonzero(np.isin(labels[rows, cols], values))
+    first, last = np.argmin(ys + xs), np.argmax(ys + xs)
+    new_cell = max(c['cell'] for c in frame['cells']) + 1
+    return {
+        'cell': cell,
+        'new_cell': new_cell,
+        'x1': int(xs[first] + cols.start),
+        'y1': int(ys[first] + rows.start),
+        'x2': int(xs[last] + cols.start),
+        'y2': int(ys[last] + rows.start),
+    }
+
+
+def watershed_many_args(frame):
+    """Splits the center cell into three cells from seeds along its diagonal."""
+    args = watershed_args(frame)
+    x1, y1, x2, y2 = args['x1'], args['y1'], args['x2'], args['y2']
+    seeds = [
+        {'x': x1, 'y': y1, 'cell': args['cell']},
+        {'x': (x1 + x2) // 2, 'y': (y1 + y2) // 2, 'cell': args['new_cell']},
+        {'x': x2, 'y': y2, 'cell': args['new_cell'] + 1},
+    ]
+    return {'cell': args['cell'], 'seeds': seeds}
+
+
+def threshold_args(frame):
+    """Thresholds a box with an eighth of the width and height of the frame."""
+    cell, _ = center_cell(frame)
+    height, width = frame['labels'].shape
+    return {
+        'cell': cell,
+        'x1': width // 2,
+        'y1': height // 2,
+        'x2': width // 2 + width // 8,
+        'y2': height // 2 + height // 8,
+    }
+
+
+def threshold_many_args(frame):
+    """Thresholds 50 boxes with twice the size of a cell."""
+    height, width = frame['labels'].shape
+    rng = np.random.default_rng(0)
+    size = 4 * CELL_RADIUS
+    ys = rng.integers(0, height - size, 50)
+    xs = rng.integers(0, width - size, 50)
+    start = max(c['cell'] for c in frame['cells']) + 1
+    boxes = [
+        {'x1': x, 'y1': y, 'x2': x + size, 'y2': y + size, 'cell': start + i}
+        for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist()))
+    ]
+    return {'boxes': boxes}
+
+
+def radius_args(frame):
+    """Erodes or dilates every cell by 2 pixels."""
+    return {'radius': 2}
+
+
+def no_args(frame):
+    return {}
+
+
+def min_size_args(frame):
+    """Removes the parts of cells smaller than a quarter of a cell."""
+    return {'min_size': int(np.pi * CELL_RADIUS**2 / 4)}
+
+
+# Arguments for each action, or several variants of an action
+ACTIONS = {
+    'draw': draw_args,
+    'draw_erase': erase_args,
+    'trim_pixels': seed_args,
+    'flood': flood_args,
+    'watershed': watershed_args,
+    'watershed_many': watershed_many_args,
+    'threshold': threshold_args,
+    'threshold_many': threshold_many_args,
+    'active_contour': cell_args,
+    'erode': cell_args,
+    'dilate': cell_args,
+    'erode_all': radius_args,
+    'dilate_all': radius_args,
+    'fill_holes': no_args,
+    'remove_small_objects': min_size_args,
+}
+
+
+def get_action(name):
+    """Returns the Edit action for a name in ACTIONS like draw_erase."""
+    for action in sorted(list_actions(), key=len, reverse=True):
+        if name == action or name.startswith(action + '_'):
+            return action
+    raise ValueError(f'No action for {name}.')
+
+
+def list_actions():
+    """Returns the names of all Edit actions."""
+    return [name[len('action_') :] for name in dir(Edit) if name.startswith('action_')]
+
+
+def make_zip(frame, action, args, mode):
+    """Returns the bytes of an edit zip like the client sends."""
+    height, width = frame['labels'].shape
+    edit = {
+        'height': height,
+        'width': width,
+        'action': action,
+        'args': args,
+        'writeMode': mode,
+    }
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('edit.json', json.dumps(edit))
+        zf.writestr('labeled.dat', frame['labels'].tobytes())
+        zf.writestr('cells.json', json.dumps(frame['cells']))
+        zf.writestr('raw.dat', frame['raw'].tobytes())
+    return f.getvalue()
+
+
+def run_edit(data):
+    return Edit(io.BytesIO(data))
+
+
+def measure(data, repeat):
+    """Returns the fastest and median seconds and the peak bytes allocated for an edit."""
+    times = timeit.repeat(lambda: run_edit(data), number=1, repeat=repeat)
+    tracemalloc.start()
+    run_edit(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'min': min(times), 'median': statistics.median(times), 'peak': peak}
+
+
+def compare(results, baseline, tolerance):
+    """Prints the changes from the baseline and returns the cases that regressed."""
+    regressions = []
+    print(f'\n{"case":>44} {"time":>8} {"memory":>8}')
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        time_ratio = result['min'] / baseline[case]['min']
+        peak_ratio = result['peak'] / max(baseline[case]['peak'], 1)
+        regressed = time_ratio > tolerance or peak_ratio > tolerance
+        if regressed:
+            regressions.append(case)
+        print(
+            f'{case:>44} {time_ratio:>7.2f}x {peak_ratio:>7.2f}x'
+            f'{"  REGRESSION" if regressed else ""}'
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--densities', nargs='+', default=list(DENSITIES))
+    parser.add_argument('--actions', nargs='+', default=list(ACTIONS))
+    parser.add_argument('--modes', nargs='+', default=MODES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='file to save the results to')
+    parser.add_argument('--compare', help='file with results to compare to')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=1.25,
+        help='ratio to the baseline that counts as a regression',
+    )
+    args = parser.parse_args()
+
+    missing = set(list_actions()) - set(get_action(name) for name in ACTIONS)
+    if missing:
+        print(f'No benchmark arguments for actions {", ".join(sorted(missing))}')
+
+    results = {}
+    print(f'{"case":>44} {"min (ms)":>10} {"median (ms)":>12} {"peak (MB)":>10}')
+    for size in args.sizes:
+        for density in args.densities:
+            frame = make_frame(size, density)
+            for name in args.actions:
+                action = get_action(name)
+                action_args = ACTIONS[name](frame)
+                for mode in args.modes:
+                    case = f'{name}/{mode}/{size}/{density}'
+                    data = make_zip(frame, action, action_args, mode)
+                    result = measure(data, args.repeat)
+                    results[case] = result
+                    print(
+                        f'{case:>44} {result["min"] * 1000:>10.2f}'
+                        f' {result["median"] * 1000:>12.2f}'
+                        f' {result["peak"] / 2**20:>10.1f}'
+                    )
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
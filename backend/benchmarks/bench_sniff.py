@@ -0,0 +1,101 @@
+"""
+Benchmarks detecting the type of every member of a zip of TIFFs.
+
+Builds a zip with a batch_N_feature_M.tif TIFF for each member, like the zips
+load_zip_tiffs loads one TIFF per batch and channel from, and times
+reading the first bytes of each member and asking libmagic for its type,
+as the loaders did before, against Archive.type.
+
+Run from the backend folder with
+
+    python -m benchmarks.bench_sniff
+"""
+
+import argparse
+import io
+import timeit
+import zipfile
+
+import magic
+import numpy as np
+import tifffile
+
+from deepcell_label.loaders import HEADER_SIZE, MAGIC_TYPES, Archive, detect_type
+
+
+def make_zip(members, size, compress_type):
+    """Writes a zip with a TIFF of random labels for each member."""
+    rng = np.random.default_rng(0)
+    features = 2
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w', compress_type) as zf:
+        for i in range(members):
+            tiff = io.BytesIO()
+            tifffile.imwrite(tiff, rng.integers(0, 100, (size, size), np.uint16))
+            name = f'batch_{i // features}_feature_{i % features}.tif'
+            zf.writestr(name, tiff.getvalue())
+    return f
+
+
+def magic_types(f):
+    """Detects the type of each member with libmagic like the loaders did before."""
+    types = {}
+    with zipfile.ZipFile(f) as zf:
+        for name in zf.namelist():
+            with zf.open(name) as member:
+                description = magic.from_buffer(member.read(HEADER_SIZE))
+            types[name] = None
+            for text, file_type in MAGIC_TYPES.items():
+                if text in description:
+                    types[name] = file_type
+    return types
+
+
+def archive_types(f):
+    """Detects the type of each member with Archive.type."""
+    archive = Archive(f)
+    return {name: archive.type(name) for name in archive.names()}
+
+
+def signature_types(f):
+    """Detects the type of each member from its first bytes without the extension."""
+    types = {}
+    with zipfile.ZipFile(f) as zf:
+        for name in zf.namelist():
+            with zf.open(name) as member:
+                types[name] = detect_type(member.read(HEADER_SIZE))
+    return types
+
+
+def best_time(fn, f, repeat):
+    return min(timeit.repeat(lambda: fn(f), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f'{"compression":>11} {"members":>8} {"libmagic (ms)":>14}'
+        f' {"signature (ms)":>15} {"archive (ms)":>15} {"speedup":>8}'
+    )
+    for compression, compress_type in [
+        ('stored', zipfile.ZIP_STORED),
+        ('deflate', zipfile.ZIP_DEFLATED),
+    ]:
+        f = make_zip(args.members, args.size, compress_type)
+        assert magic_types(f) == archive_types(f) == signature_types(f)
+        old = best_time(magic_types, f, args.repeat)
+        signature = best_time(signature_types, f, args.repeat)
+        new = best_time(archive_types, f, args.repeat)
+        print(
+            f'{compression:>11} {args.members:>8} {old * 1000:>14.1f}'
+            f' {signature * 1000:>15.1f} {new * 1000:>15.1f} {old / new:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
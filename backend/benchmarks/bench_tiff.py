@@ -0,0 +1,134 @@
+"""
+Benchmarks the size and time to write and read OME TIFFs with each TiffCodec.
+
+Writes a time lapse of raw images and a time lapse of dense labels
+like the X.ome.tiff and y.ome.tiff in project and export zips,
+with the channel axis moved like Loader and Export do,
+and reads them back whole and one 256x256 region of one frame at a time.
+
+Run from the backend folder with
+
+    python -m benchmarks.bench_tiff
+"""
+
+import argparse
+import io
+import timeit
+
+import numpy as np
+import tifffile
+from scipy import ndimage
+
+from benchmarks.bench_compression import make_labels
+from deepcell_label.tiffs import TiffCodec
+
+
+def make_images(frames, size, seed=0):
+    """Makes noisy uint16 frames of blurred blobs like fluorescence images."""
+    rng = np.random.default_rng(seed)
+    images = np.empty((frames, size, size), np.uint16)
+    for t in range(frames):
+        blobs = ndimage.gaussian_filter(rng.random((size, size)), size / 256) * 4000
+        images[t] = rng.poisson(np.clip(blobs - 1500, 50, None))
+    return images
+
+
+def write(codec, array):
+    f = io.BytesIO()
+    codec.write(f, array, {'axes': 'ZCYX'})
+    return f
+
+
+def read(f):
+    f.seek(0)
+    with tifffile.TiffFile(f) as tiff:
+        return tiff.asarray()
+
+
+def read_region(f):
+    """Reads a 256x256 region from the middle of the first frame."""
+    f.seek(0)
+    with tifffile.TiffFile(f) as tiff:
+        page = tiff.pages[0]
+        height, width = page.shape
+        y, x = height // 2, width // 2
+        if not page.is_tiled:
+            return page.asarray()[y : y + 256, x : x + 256]
+        # Decode only the tiles that overlap the region
+        tile_height, tile_width = page.tilelength, page.tilewidth
+        tiles_across = -(-width // tile_width)
+        keys = [
+            row * tiles_across + column
+            for row in range(y // tile_height, (y + 255) // tile_height + 1)
+            for column in range(x // tile_width, (x + 255) // tile_width + 1)
+        ]
+        segments = tiff.filehandle.read_segments(
+            [page.dataoffsets[key] for key in keys],
+            [page.databytecounts[key] for key in keys],
+            keys,
+        )
+        return [page.decode(data, index)[0] for data, index in segments]
+
+
+def best_time(fn, args, repeat):
+    """Returns the fastest time in seconds to call fn with args."""
+    return min(timeit.repeat(lambda: fn(*args), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--size', type=int, default=2048)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workers = args.workers
+    codecs = [
+        ('strips', TiffCodec('zlib', 6, workers=workers)),
+        ('strips', TiffCodec('zlib', 1, workers=workers)),
+        ('strips', TiffCodec('lzw', None, True, workers=workers)),
+    ]
+    for tile_size in [256, 512]:
+        codecs += [
+            (tile_size, TiffCodec('zlib', 1, False, tile_size, workers)),
+            (tile_size, TiffCodec('zlib', 6, False, tile_size, workers)),
+            (tile_size, TiffCodec('zlib', 1, True, tile_size, workers)),
+            (tile_size, TiffCodec('zlib', 6, True, tile_size, workers)),
+            (tile_size, TiffCodec('lzw', None, False, tile_size, workers)),
+            (tile_size, TiffCodec('lzw', None, True, tile_size, workers)),
+            (tile_size, TiffCodec('zstd', 1, False, tile_size, workers)),
+            (tile_size, TiffCodec('zstd', 3, True, tile_size, workers)),
+        ]
+
+    images = make_images(args.frames * 2, args.size).reshape(
+        (args.frames, 2, args.size, args.size)
+    )
+    labels = np.stack(
+        [make_labels(args.size, args.size, seed) for seed in range(args.frames)]
+    )[:, np.newaxis]
+    payloads = [
+        ('X.ome.tiff', np.moveaxis(np.moveaxis(images, 1, -1), -1, 1)),
+        ('y.ome.tiff', np.moveaxis(labels.transpose(0, 2, 3, 1), -1, 1)),
+    ]
+    print(
+        f'{"payload":>10} {"tiles":>6} {"codec":>5} {"level":>5} {"pred":>5}'
+        f' {"ratio":>6} {"write (ms)":>11} {"read (ms)":>10} {"region (ms)":>12}'
+    )
+    for name, array in payloads:
+        for tiles, codec in codecs:
+            f = write(codec, array)
+            np.testing.assert_array_equal(read(f).reshape(array.shape), array)
+            write_time = best_time(write, (codec, array), args.repeat)
+            read_time = best_time(read, (f,), args.repeat)
+            region_time = best_time(read_region, (f,), args.repeat)
+            ratio = array.nbytes / len(f.getvalue())
+            print(
+                f'{name:>10} {tiles:>6} {codec.name:>5} {str(codec.level):>5}'
+                f' {str(codec.predictor):>5} {ratio:>5.1f}x {write_time * 1000:>11.1f}'
+                f' {read_time * 1000:>10.1f} {region_time * 1000:>12.2f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -35,7 +35,7 @@ def create_app(**config_overrides):
     """Factory to create the Flask application"""
     app = Flask(__name__)
 
-    CORS(app)
+    CORS(app, expose_headers=['X-Frame-Version', 'Server-Timing'])
 
     app.config.from_object(config)
     # apply overrides
@@ -60,11 +60,10 @@ def create_app(**config_overrides):
         dashboard.config.init_from(config.DASHBOARD_CONFIG)
 
         def group_action():
-            """Apply custom grouping for action endpoint"""
-            from flask import request
+            """Group edits by their action"""
+            from deepcell_label.metrics import get_labels
 
-            if request.endpoint == 'label.action':
-                return request.view_args['action_type']
+            return get_labels().get('action')
 
         dashboard.config.group_by = group_action
         dashboard.bind(app)
@@ -2,31 +2,86 @@
 from __future__ import absolute_import, division, print_function
 
 import io
+import json
 import os
 import tempfile
 import timeit
 import traceback
+import zipfile
 
 import boto3
 import requests
-from flask import Blueprint, abort, current_app, jsonify, request, send_file
+from flask import Blueprint, Response, abort, current_app, jsonify, request, send_file
 from werkzeug.exceptions import HTTPException
 
-from deepcell_label.config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, DELETE_TEMP
+from deepcell_label.cache import frame_cache, raw_cache
+from deepcell_label.compression import ZIP_CODECS, Codec
+from deepcell_label.config import (
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    DELETE_TEMP,
+    EDIT_JOB_MAX_WAIT,
+)
 from deepcell_label.export import Export
-from deepcell_label.label import Edit
+from deepcell_label.jobs import (
+    JobQueueFull,
+    JobTimeout,
+    attach_cached_data,
+    cache_job_frame,
+    job_queue,
+    run_edit,
+)
+from deepcell_label.label import BatchEdit, Edit, FrameCacheMiss, StackEdit
 from deepcell_label.loaders import Loader
-from deepcell_label.models import Project
+from deepcell_label.metrics import (
+    finish_request,
+    label_request,
+    render,
+    start_request,
+    timed,
+)
+from deepcell_label.models import S3_TRANSFER, Project
 
 bp = Blueprint('label', __name__)  # pylint: disable=C0103
 
 
+@bp.before_request
+def start_timing():
+    """Starts timing the phases of the request."""
+    if request.endpoint not in ('label.health', 'label.metrics'):
+        start_request()
+
+
+@bp.after_request
+def finish_timing(response):
+    """Adds the phase timings to the response and the metrics."""
+    return finish_request(response, request.endpoint)
+
+
 @bp.route('/health')
 def health():
     """Returns success if the application is ready."""
     return jsonify({'message': 'success'}), 200
 
 
+@bp.route('/metrics')
+def metrics():
+    """Returns histograms of request and phase durations and payload sizes for Prometheus."""
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.errorhandler(FrameCacheMiss)
+def handle_frame_cache_miss(error):
+    """Asks the client to send the full frame when an edited frame is not cached."""
+    return jsonify({'error': str(error)}), 409
+
+
+@bp.errorhandler(JobQueueFull)
+def handle_job_queue_full(error):
+    """Asks the client to try again later when too many jobs are waiting."""
+    return jsonify({'error': str(error)}), 503
+
+
 @bp.errorhandler(Exception)
 def handle_exception(error):
     """Handle all uncaught exceptions"""
@@ -52,7 +107,8 @@ def get_project(project):
     bucket = request.args.get('bucket', default=project.bucket)
     s3 = boto3.client('s3')
     data = io.BytesIO()
-    s3.download_fileobj(bucket, project.key, data)
+    with timed('s3'):
+        s3.download_fileobj(bucket, project.key, data)
     data.seek(0)
     current_app.logger.info(
         f'Loaded project {project.key} from {bucket} in {timeit.default_timer() - start} s.',
@@ -60,6 +116,23 @@ def get_project(project):
     return send_file(data, mimetype='application/zip')
 
 
+def get_project_codec():
+    """
+    Returns the Codec to compress a project zip with from the compression
+    and compressionLevel in the request form, or None to use the default.
+    """
+    if 'compression' not in request.form:
+        return None
+    try:
+        return Codec(
+            request.form['compression'],
+            request.form.get('compressionLevel'),
+            ZIP_CODECS,
+        )
+    except ValueError as error:
+        return abort(400, description=str(error))
+
+
 @bp.route('/api/project', methods=['POST'])
 def create_project():
     """
@@ -75,11 +148,13 @@ def create_project():
         )
     labels_url = request.form['labels'] if 'labels' in request.form else None
     axes = request.form['axes'] if 'axes' in request.form else None
+    codec = get_project_codec()
     with tempfile.NamedTemporaryFile(
         delete=DELETE_TEMP
     ) as image_file, tempfile.NamedTemporaryFile(delete=DELETE_TEMP) as label_file:
         if images_url is not None:
-            image_response = requests.get(images_url)
+            with timed('fetch'):
+                image_response = requests.get(images_url)
             if image_response.status_code != 200:
                 return (
                     image_response.text,
@@ -89,7 +164,8 @@ def create_project():
             image_file.write(image_response.content)
             image_file.seek(0)
         if labels_url is not None:
-            labels_response = requests.get(labels_url)
+            with timed('fetch'):
+                labels_response = requests.get(labels_url)
             if labels_response.status_code != 200:
                 return (
                     labels_response.text,
@@ -100,8 +176,8 @@ def create_project():
             label_file.seek(0)
         else:
             label_file = image_file
-        loader = Loader(image_file, label_file, axes)
-        project = Project.create(loader)
+        with Loader(image_file, label_file, axes, codec) as loader:
+            project = Project.create(loader)
     if not DELETE_TEMP:
         image_file.close()
         label_file.close()
@@ -124,11 +200,12 @@ def create_project_from_dropped_file():
     input_file = request.files.get('images')
     axes = request.form['axes'] if 'axes' in request.form else None
     # axes = request.form['axes'] if 'axes' in request.form else DCL_AXES
+    codec = get_project_codec()
     with tempfile.NamedTemporaryFile(delete=DELETE_TEMP) as f:
         f.write(input_file.read())
         f.seek(0)
-        loader = Loader(f, axes=axes)
-        project = Project.create(loader)
+        with Loader(f, axes=axes, codec=codec) as loader:
+            project = Project.create(loader)
     if not DELETE_TEMP:
         f.close()
         os.remove(f.name)  # Manually close and delete if using Windows
@@ -147,14 +224,153 @@ def edit():
     start = timeit.default_timer()
     if 'labels' not in request.files:
         return abort(400, description='Attach the labeled data to edit in labels.zip.')
+    # Read the uploaded zip in place instead of copying it into memory
     labels_zip = request.files['labels']
+    action = get_async_action(labels_zip)
+    if job_queue.runs(action):
+        label_request(action=action)
+        return submit_edit_job(labels_zip.read(), action)
     edit = Edit(labels_zip)
+    label_request(action=edit.action, write_mode=edit.write_mode)
     current_app.logger.debug(
         'Finished action %s in %s s.',
         edit.action,
         timeit.default_timer() - start,
     )
-    return send_file(edit.response_zip, mimetype='application/zip')
+    return send_edit_response(edit)
+
+
+def get_async_action(labels_zip):
+    """
+    Returns the action in an edit zip when edit.json asks to run it async, or None.
+    Leaves the zip file at its start.
+    """
+    try:
+        if not zipfile.is_zipfile(labels_zip):
+            return None
+        with zipfile.ZipFile(labels_zip) as zf:
+            if 'edit.json' not in zf.namelist():
+                return None
+            edit = json.loads(zf.read('edit.json'))
+    finally:
+        labels_zip.seek(0)
+    return edit.get('action') if edit.get('async') else None
+
+
+def submit_edit_job(data, action):
+    """Runs an edit in the job queue and responds with the id of the job."""
+    job_id = job_queue.submit(
+        run_edit,
+        attach_cached_data(data),
+        name=action,
+        timeout=job_queue.timeouts[action],
+        on_done=cache_job_frame,
+    )
+    current_app.logger.debug('Submitted action %s as job %s.', action, job_id)
+    response = jsonify({'job': job_id, 'status': job_queue.status(job_id)})
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job_id}'
+    return response
+
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Responds with the edited labels of a finished job,
+    or with the status of the job after waiting up to wait seconds for it to finish.
+    Waits at most EDIT_JOB_MAX_WAIT seconds so polls do not hold a web thread.
+    """
+    if job_queue.get(job_id) is None:
+        return abort(404, description=f'job {job_id} not found')
+    wait = min(request.args.get('wait', default=0, type=float), EDIT_JOB_MAX_WAIT)
+    status = job_queue.wait(job_id, wait)
+    if status in ('queued', 'running'):
+        return jsonify({'job': job_id, 'status': status}), 202
+    try:
+        result = job_queue.result(job_id)
+    except JobTimeout as error:
+        return jsonify({'error': str(error)}), 504
+    response = send_file(io.BytesIO(result['response']), mimetype='application/zip')
+    if result['version'] is not None:
+        response.headers['X-Frame-Version'] = result['version']
+    return response
+
+
+@bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancels a job that has not started running."""
+    if job_queue.get(job_id) is None:
+        return abort(404, description=f'job {job_id} not found')
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': f'job {job_id} already started'}), 409
+    return jsonify({'job': job_id, 'status': 'cancelled'})
+
+
+@bp.route('/api/jobs', methods=['GET'])
+def job_stats():
+    """Returns the number of queued, running, and finished jobs."""
+    return jsonify(job_queue.stats())
+
+
+@bp.route('/api/edit/batch', methods=['POST'])
+def edit_batch():
+    """
+    Loads labeled data from a zip, applies a list of edits in order,
+    and responds with a zip with the edited labels.
+
+    When an edit fails, the response still has status 200 with the labels
+    from the edits before it, and batch.json has the error.
+    The failed edit and the edits after it are not applied.
+    """
+    start = timeit.default_timer()
+    if 'labels' not in request.files:
+        return abort(400, description='Attach the labeled data to edit in labels.zip.')
+    labels_zip = request.files['labels']
+    edit = BatchEdit(labels_zip)
+    # The actions in a batch can have different write modes
+    label_request(action='batch')
+    current_app.logger.debug(
+        'Finished %s of %s actions in %s s.',
+        len(edit.timings),
+        len(edit.actions),
+        timeit.default_timer() - start,
+    )
+    return send_edit_response(edit)
+
+
+@bp.route('/api/edit/stack', methods=['POST'])
+def edit_stack():
+    """
+    Loads a stack of labeled frames from a zip, applies an edit to a range of the frames,
+    and responds with a zip with the changed frames.
+    """
+    start = timeit.default_timer()
+    if 'labels' not in request.files:
+        return abort(400, description='Attach the labeled data to edit in labels.zip.')
+    labels_zip = request.files['labels']
+    edit = StackEdit(labels_zip)
+    label_request(action=edit.action, write_mode=edit.edit['writeMode'])
+    current_app.logger.debug(
+        'Finished action %s on %s frames in %s s.',
+        edit.action,
+        edit.stop - edit.start,
+        timeit.default_timer() - start,
+    )
+    return send_edit_response(edit)
+
+
+def send_edit_response(edit):
+    """Sends the response zip of an edit with the version of the cached frame."""
+    response = send_file(edit.response_zip, mimetype='application/zip')
+    if edit.version is not None:
+        response.headers['X-Frame-Version'] = edit.version
+    return response
+
+
+@bp.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Returns the memory use, hits, misses, and evictions of the frame and raw caches."""
+    return jsonify({'frames': frame_cache.stats(), 'raw': raw_cache.stats()})
 
 
 @bp.route('/api/download', methods=['POST'])
@@ -169,7 +385,7 @@ def download_project():
         return abort(400, description='Attach labels.zip to download.')
     labels_zip = request.files['labels']
     id = request.form['id']
-    export = Export(labels_zip)
+    export = Export(labels_zip, get_project_codec())
     data = export.export_zip
     return send_file(data, as_attachment=True, attachment_filename=f'{id}.zip')
 
@@ -188,7 +404,7 @@ def submit_project():
     labels_zip = request.files['labels']
     id = request.form['id']
     bucket = request.form['bucket']
-    export = Export(labels_zip)
+    export = Export(labels_zip, get_project_codec())
     data = export.export_zip
 
     # store npz file object in bucket/path
@@ -197,7 +413,8 @@ def submit_project():
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
     )
-    s3.upload_fileobj(data, bucket, f'{id}.zip')
+    with timed('s3'):
+        s3.upload_fileobj(data, bucket, f'{id}.zip', Config=S3_TRANSFER)
 
     current_app.logger.debug(
         'Uploaded %s to S3 bucket %s in %s s.',
@@ -1,6 +1,9 @@
 """Test for DeepCell Label Blueprints"""
 
+import io
+import json
 import tempfile
+import zipfile
 
 import numpy as np
 import pytest
@@ -9,7 +12,9 @@ from PIL import Image
 from tifffile import TiffWriter
 
 from deepcell_label import models
-from deepcell_label.conftest import DummyLoader
+from deepcell_label.conftest import DummyLoader, make_edit_zip
+from deepcell_label.jobs import job_queue
+from deepcell_label.loaders import Loader
 
 
 # Automatically enable transactions for all tests, without importing any extra fixtures.
@@ -26,8 +31,152 @@ def test_health(client):
 
 
 def test_edit(client):
-    # TODO
-    pass
+    edit = {
+        'height': 1,
+        'width': 2,
+        'action': 'dilate',
+        'args': {'cell': 1},
+        'writeMode': 'overwrite',
+    }
+    labels_zip = make_edit_zip(edit, [1, 0], [{'cell': 1, 'value': 1}])
+    response = client.post(
+        '/api/edit',
+        data={'labels': (labels_zip, 'labels.zip')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 200
+    zf = zipfile.ZipFile(io.BytesIO(response.data))
+    labels = np.frombuffer(zf.read('labeled.dat'), np.int32)
+    np.testing.assert_array_equal(labels, [1, 1])
+    phases = [
+        timing.split(';')[0] for timing in response.headers['Server-Timing'].split(', ')
+    ]
+    assert phases == ['unzip', 'decode', 'action', 'encode', 'zip', 'total']
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    labels = (
+        'endpoint="label.edit",phase="action",action="dilate",write_mode="overwrite"'
+    )
+    assert any(
+        line.startswith(f'deepcell_label_phase_duration_seconds_count{{{labels}}}')
+        for line in lines
+    )
+    labels = 'endpoint="label.edit",action="dilate",write_mode="overwrite"'
+    assert any(
+        line.startswith(f'deepcell_label_request_size_bytes_count{{{labels}}}')
+        for line in lines
+    )
+
+
+def test_edit_batch(client):
+    edit = {
+        'height': 1,
+        'width': 2,
+        'actions': [
+            {'action': 'dilate', 'args': {'cell': 1}},
+            {'action': 'dilate', 'args': {'cell': 1}},
+        ],
+    }
+    labels_zip = make_edit_zip(edit, [1, 0], [{'cell': 1, 'value': 1}])
+    response = client.post(
+        '/api/edit/batch',
+        data={'labels': (labels_zip, 'labels.zip')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 200
+    zf = zipfile.ZipFile(io.BytesIO(response.data))
+    labels = np.frombuffer(zf.read('labeled.dat'), np.int32)
+    np.testing.assert_array_equal(labels, [1, 1])
+    assert len(json.loads(zf.read('batch.json'))['actions']) == 2
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'endpoint="label.edit_batch",action="batch"' in metrics
+
+
+def test_edit_stack(client):
+    edit = {
+        'height': 1,
+        'width': 2,
+        'frames': 2,
+        'action': 'dilate',
+        'args': {'cell': 1},
+    }
+    labels_zip = make_edit_zip(edit, [1, 0, 0, 0], [{'cell': 1, 'value': 1, 't': 0}])
+    response = client.post(
+        '/api/edit/stack',
+        data={'labels': (labels_zip, 'labels.zip')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 200
+    zf = zipfile.ZipFile(io.BytesIO(response.data))
+    labels = np.frombuffer(zf.read('labeled.dat'), np.int32)
+    np.testing.assert_array_equal(labels, [1, 1])
+    assert json.loads(zf.read('frames.json')) == [0]
+
+
+def test_edit_job(client, mocker):
+    mocker.patch.dict(job_queue.timeouts, {'dilate': 10})
+    edit = {
+        'height': 1,
+        'width': 2,
+        'action': 'dilate',
+        'args': {'cell': 1},
+        'async': True,
+    }
+    labels_zip = make_edit_zip(edit, [1, 0], [{'cell': 1, 'value': 1}])
+    response = client.post(
+        '/api/edit',
+        data={'labels': (labels_zip, 'labels.zip')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 202
+    job_id = response.json['job']
+    assert response.headers['Location'].endswith(f'/api/jobs/{job_id}')
+
+    # Polls wait at most EDIT_JOB_MAX_WAIT seconds
+    for _ in range(30):
+        response = client.get(f'/api/jobs/{job_id}?wait=10')
+        if response.status_code != 202:
+            break
+    assert response.status_code == 200
+    zf = zipfile.ZipFile(io.BytesIO(response.data))
+    labels = np.frombuffer(zf.read('labeled.dat'), np.int32)
+    np.testing.assert_array_equal(labels, [1, 1])
+    # The result is removed once sent
+    assert client.get(f'/api/jobs/{job_id}').status_code == 404
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 404
+    assert client.get('/api/jobs').json['workers'] == job_queue.max_workers
+
+
+def test_edit_cached_frame(client):
+    edit = {
+        'height': 1,
+        'width': 2,
+        'action': 'dilate',
+        'args': {'cell': 1},
+        'project': 'test_edit_cached_frame',
+    }
+    labels_zip = make_edit_zip(edit, [1, 0], [{'cell': 1, 'value': 1}])
+    response = client.post(
+        '/api/edit',
+        data={'labels': (labels_zip, 'labels.zip')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 200
+    version = response.headers['X-Frame-Version']
+
+    for sent_version, status_code in [('stale', 409), (version, 200)]:
+        labels_zip = make_edit_zip({**edit, 'version': sent_version})
+        response = client.post(
+            '/api/edit',
+            data={'labels': (labels_zip, 'labels.zip')},
+            content_type='multipart/form-data',
+        )
+        assert response.status_code == status_code
+
+    response = client.get('/api/cache')
+    assert response.json['frames']['items'] >= 1
 
 
 def test_create_project_no_url(client, mocker):
@@ -55,6 +204,24 @@ def test_create_project_dropped_npz(client):
     assert response.status_code == 200
 
 
+def test_create_project_dropped_upload_error(client, mocker):
+    """Deletes the project zip when uploading the project fails."""
+    mocker.patch(
+        'deepcell_label.blueprints.Project.create', side_effect=RuntimeError('S3')
+    )
+    close = mocker.spy(Loader, 'close')
+    with tempfile.NamedTemporaryFile() as f:
+        np.savez(f, X=np.zeros((1, 1, 1, 1)))
+        f.seek(0)
+        data = {'images': (f, 'test.npz')}
+        response = client.post(
+            '/api/project/dropped', data=data, content_type='multipart/form-data'
+        )
+    assert response.status_code == 500
+    close.assert_called_once()
+    assert close.call_args[0][0].project_file.closed
+
+
 def test_create_project_dropped_tiff(client):
     with tempfile.NamedTemporaryFile() as f:
         with TiffWriter(f) as writer:
@@ -0,0 +1,182 @@
+"""Least recently used caches for data reused across requests."""
+from __future__ import absolute_import, division, print_function
+
+import collections
+import hashlib
+import os
+import pickle
+import threading
+
+from deepcell_label.config import (
+    FRAME_CACHE_SIZE,
+    FRAME_CACHE_SPILL_DIR,
+    FRAME_CACHE_SPILL_SIZE,
+    RAW_CACHE_SIZE,
+)
+
+
+class LRUCache(object):
+    """
+    Least recently used cache limited to a total size in bytes.
+
+    When a spill directory is set, evicted items are pickled to disk
+    (up to max_spill_size bytes) and loaded back into memory on a later get.
+    """
+
+    def __init__(self, max_size, spill_dir=None, max_spill_size=0):
+        """
+        Args:
+            max_size (int): bytes of items to keep in memory
+            spill_dir (str): folder to write evicted items to, or None to drop them
+            max_spill_size (int): bytes of evicted items to keep on disk
+        """
+        self.max_size = max_size
+        self.max_spill_size = max_spill_size
+        self.spill_dir = None
+        if spill_dir:
+            # Separate folder per process as each worker has its own cache
+            self.spill_dir = os.path.join(spill_dir, str(os.getpid()))
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+        self.items = collections.OrderedDict()  # key -> (value, size)
+        self.spilled = collections.OrderedDict()  # key -> (path, size)
+        self.size = 0
+        self.spill_size = 0
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+        self.spill_hits = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items or key in self.spilled
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def get(self, key, default=None):
+        """Returns the item for key and marks it as recently used."""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key][0]
+            if key in self.spilled:
+                value, size = self.load_spilled(key)
+                self.spill_hits += 1
+                self.put(key, value, size)
+                return value
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size):
+        """
+        Adds an item to the cache, evicting the least recently used items
+        until the cache fits in max_size.
+
+        Args:
+            key: hashable key for the item
+            value: item to cache
+            size (int): bytes used by the item
+        """
+        with self.lock:
+            self.pop(key)
+            if size > self.max_size:
+                self.spill(key, value, size)
+                return
+            self.items[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                evicted_key, (evicted, evicted_size) = self.items.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+                self.spill(evicted_key, evicted, evicted_size)
+
+    def take(self, key, default=None):
+        """Removes and returns the item for key, counting a hit or a miss like get."""
+        with self.lock:
+            if key in self.items:
+                self.hits += 1
+            elif key in self.spilled:
+                self.spill_hits += 1
+            else:
+                self.misses += 1
+            return self.pop(key, default)
+
+    def pop(self, key, default=None):
+        """Removes and returns the item for key."""
+        with self.lock:
+            if key in self.items:
+                value, size = self.items.pop(key)
+                self.size -= size
+                return value
+            if key in self.spilled:
+                return self.load_spilled(key)[0]
+            return default
+
+    def clear(self):
+        """Removes all items from memory and disk."""
+        with self.lock:
+            for key in list(self.spilled):
+                self.remove_spilled(key)
+            self.items.clear()
+            self.size = 0
+
+    def spill(self, key, value, size):
+        """Writes an evicted item to the spill directory, if any."""
+        if self.spill_dir is None or size > self.max_spill_size:
+            return
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = os.path.join(self.spill_dir, f'{name}.pkl')
+        with open(path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled[key] = (path, size)
+        self.spill_size += size
+        self.spills += 1
+        while self.spill_size > self.max_spill_size:
+            self.remove_spilled(next(iter(self.spilled)))
+
+    def load_spilled(self, key):
+        """Reads a spilled item and removes it from disk."""
+        path, size = self.spilled[key]
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        self.remove_spilled(key)
+        return value, size
+
+    def remove_spilled(self, key):
+        path, size = self.spilled.pop(key)
+        self.spill_size -= size
+        if os.path.exists(path):
+            os.remove(path)
+
+    def stats(self):
+        """Returns a dictionary with the usage of the cache."""
+        with self.lock:
+            return {
+                'items': len(self.items),
+                'size': self.size,
+                'maxSize': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'spilledItems': len(self.spilled),
+                'spillSize': self.spill_size,
+                'spills': self.spills,
+                'spillHits': self.spill_hits,
+            }
+
+
+# Labeled frames being edited, keyed by (project, t, c)
+frame_cache = LRUCache(  # pylint: disable=C0103
+    FRAME_CACHE_SIZE * 2**20,
+    spill_dir=FRAME_CACHE_SPILL_DIR,
+    max_spill_size=FRAME_CACHE_SPILL_SIZE * 2**20,
+)
+
+# Normalized raw frames from project images, keyed by (project, channel, t)
+raw_cache = LRUCache(RAW_CACHE_SIZE * 2**20)  # pylint: disable=C0103
@@ -0,0 +1,83 @@
+"""Tests for cache.py"""
+
+import numpy as np
+
+from deepcell_label.cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_size=3)
+    cache.put('a', 1, 1)
+    cache.put('b', 2, 1)
+    cache.put('c', 3, 1)
+    assert cache.get('a') == 1
+    cache.put('d', 4, 1)
+
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acd'] == [1, 3, 4]
+    stats = cache.stats()
+    assert stats['size'] == 3
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 4
+    assert stats['misses'] == 1
+
+
+def test_take_removes_item():
+    cache = LRUCache(max_size=10)
+    cache.put('a', 1, 4)
+    assert cache.take('a') == 1
+    assert cache.take('a') is None
+    assert 'a' not in cache
+    stats = cache.stats()
+    assert stats['size'] == 0
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_put_replaces_item():
+    cache = LRUCache(max_size=10)
+    cache.put('a', 1, 4)
+    cache.put('a', 2, 6)
+    assert cache.get('a') == 2
+    assert cache.size == 6
+    assert len(cache) == 1
+
+
+def test_does_not_keep_items_larger_than_cache():
+    cache = LRUCache(max_size=3)
+    cache.put('a', 1, 4)
+    assert 'a' not in cache
+    assert cache.size == 0
+
+
+def test_spills_evicted_items(tmp_path):
+    cache = LRUCache(max_size=100, spill_dir=str(tmp_path), max_spill_size=200)
+    a = np.arange(10, dtype=np.int32)
+    b = np.ones(10, dtype=np.int32)
+    cache.put('a', a, a.nbytes)
+    cache.put('b', b, b.nbytes)
+    c = np.zeros(20, dtype=np.int32)
+    cache.put('c', c, c.nbytes)
+
+    assert 'a' in cache
+    assert cache.stats()['spilledItems'] == 2
+    np.testing.assert_array_equal(cache.get('a'), a)
+    assert cache.stats()['spillHits'] == 1
+    # Loading a spilled item evicts c to make room
+    assert cache.stats()['spilledItems'] == 2
+    np.testing.assert_array_equal(cache.get('c'), c)
+
+    cache.clear()
+    assert 'b' not in cache
+    assert not list(tmp_path.glob('*/*.pkl'))
+
+
+def test_drops_spilled_items_over_spill_size(tmp_path):
+    cache = LRUCache(max_size=1, spill_dir=str(tmp_path), max_spill_size=2)
+    cache.put('a', 1, 1)
+    cache.put('b', 2, 1)
+    cache.put('c', 3, 1)
+    cache.put('d', 4, 1)
+    assert 'a' not in cache
+    assert [cache.get(key) for key in 'bcd'] == [2, 3, 4]
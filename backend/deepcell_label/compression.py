@@ -0,0 +1,242 @@
+"""Compresses the members of the zip files sent between the client and the server."""
+from __future__ import absolute_import, division, print_function
+
+import shutil
+import time
+import zipfile
+
+import imagecodecs
+
+from deepcell_label.metrics import timed
+
+# Members compressed with codecs that zip files do not support
+# are stored uncompressed in the zip with a suffix for their codec
+SUFFIXES = {'zstd': '.zst', 'lz4': '.lz4'}
+ENCODERS = {'zstd': imagecodecs.zstd_encode, 'lz4': imagecodecs.lz4f_encode}
+DECODERS = {'zstd': imagecodecs.zstd_decode, 'lz4': imagecodecs.lz4f_decode}
+LZ4F_MAGIC = b'\x04\x22\x4d\x18'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Bytes of the frame headers with the decoded size
+FRAME_HEADER_SIZE = 18
+
+CODECS = ['stored', 'deflate', 'zstd', 'lz4']
+# Codecs that any zip reader can open
+ZIP_CODECS = ['stored', 'deflate']
+
+# Already compressed files that are always stored
+COMPRESSED_EXTENSIONS = ('.tif', '.tiff', '.png', '.npz', '.zip', '.zst', '.lz4')
+
+
+class Codec(object):
+    """Writes members to a zip file with a compression codec and level."""
+
+    def __init__(self, name='deflate', level=None, valid_codecs=None):
+        """
+        Args:
+            name (str): one of stored, deflate, zstd, or lz4
+            level (int): compression level for the codec, or None for its default
+            valid_codecs (list): codecs allowed for the zip, defaults to all codecs
+
+        Raises:
+            ValueError: when the codec is not allowed or the level is not an integer
+        """
+        valid_codecs = CODECS if valid_codecs is None else valid_codecs
+        if name not in valid_codecs:
+            raise ValueError(
+                f'Invalid compression {name}. Choose from {", ".join(valid_codecs)}.'
+            )
+        if level is not None:
+            try:
+                level = int(level)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid compression level {level}.')
+            if name == 'deflate' and not 0 <= level <= 9:
+                raise ValueError(f'Invalid compression level {level} for deflate.')
+        self.name = name
+        self.level = level
+
+    def __repr__(self):
+        return f'Codec({self.name!r}, {self.level!r})'
+
+    def stores(self, name):
+        """Returns whether a member is stored without compression."""
+        return self.name == 'stored' or name.lower().endswith(COMPRESSED_EXTENSIONS)
+
+    def write(self, zf, name, data):
+        """
+        Writes data to a member of a zip file.
+
+        Already compressed files like TIFFs are always stored without compression.
+        zstd and lz4 members are named with a .zst or .lz4 suffix.
+
+        Args:
+            zf (zipfile.ZipFile): zip file open for writing
+            name (str): name of the member
+            data (bytes or str): contents of the member
+        """
+        with timed('zip'):
+            if self.stores(name):
+                zf.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+            elif self.name == 'deflate':
+                zf.writestr(
+                    name,
+                    data,
+                    compress_type=zipfile.ZIP_DEFLATED,
+                    compresslevel=self.level,
+                )
+            else:
+                if isinstance(data, str):
+                    data = data.encode('utf-8')
+                encoded = ENCODERS[self.name](data, level=self.level)
+                zf.writestr(
+                    name + SUFFIXES[self.name],
+                    encoded,
+                    compress_type=zipfile.ZIP_STORED,
+                )
+
+    def write_file(self, zf, name, f, chunk_size=2**20):
+        """
+        Writes the contents of a file object to a member of a zip file.
+
+        Stored members, like TIFFs, are copied in chunks
+        instead of reading the whole file into memory.
+
+        Args:
+            zf (zipfile.ZipFile): zip file open for writing
+            name (str): name of the member
+            f: seekable binary file object to write from its start
+            chunk_size (int): bytes to copy at a time
+        """
+        f.seek(0)
+        if not self.stores(name):
+            self.write(zf, name, f.read())
+            return
+        with timed('zip'):
+            info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.external_attr = 0o600 << 16
+            # Lets the zip use ZIP64 for members larger than 4 GB
+            info.file_size = f.seek(0, 2)
+            f.seek(0)
+            with zf.open(info, 'w') as member:
+                shutil.copyfileobj(f, member, chunk_size)
+
+
+def has_member(zf, name):
+    """Returns whether the zip file has a member, with or without a codec suffix."""
+    names = zf.namelist()
+    return name in names or any(name + suffix in names for suffix in SUFFIXES.values())
+
+
+def read_member(zf, name):
+    """
+    Reads a member of a zip file, decompressing members with a codec suffix.
+
+    Raises:
+        KeyError: when the zip file does not have the member
+    """
+    names = zf.namelist()
+    if name in names:
+        return zf.read(name)
+    for codec, suffix in SUFFIXES.items():
+        if name + suffix in names:
+            return DECODERS[codec](zf.read(name + suffix))
+    raise KeyError(f'There is no item named {name!r} in the archive')
+
+
+def read_member_into(zf, name, out, chunk_size=2**20):
+    """
+    Decompresses a member of a zip file straight into a writable buffer,
+    like a preallocated numpy array, without a copy of the whole member.
+
+    Args:
+        zf (zipfile.ZipFile): zip file open for reading
+        name (str): name of the member, with or without a codec suffix
+        out: writable C-contiguous buffer with the size of the decompressed member
+        chunk_size (int): bytes to decompress at a time for zip compressed members
+
+    Raises:
+        KeyError: when the zip file does not have the member
+        ValueError: when the member does not have the size of the buffer
+    """
+    view = memoryview(out).cast('B')
+    names = zf.namelist()
+    if name in names:
+        size = zf.getinfo(name).file_size
+        if size != view.nbytes:
+            raise ValueError(
+                f'{name} has {size} bytes instead of the expected {view.nbytes} bytes.'
+            )
+        with zf.open(name) as f:
+            offset = 0
+            while offset < size:
+                read = f.readinto(view[offset : offset + chunk_size])
+                if not read:
+                    raise ValueError(f'{name} ended after {offset} bytes.')
+                offset += read
+        return
+    for codec, suffix in SUFFIXES.items():
+        if name + suffix in names:
+            data = zf.read(name + suffix)
+            if codec == 'lz4' and lz4f_content_size(data) != view.nbytes:
+                # lz4 stops at the end of a buffer that is too small instead of failing,
+                # so decode frames without the expected size in their header on their own
+                decoded = DECODERS[codec](data)
+                if len(decoded) == view.nbytes:
+                    view[:] = decoded
+            else:
+                try:
+                    decoded = DECODERS[codec](data, out=view)
+                except Exception as error:
+                    raise ValueError(f'Could not decode {name}: {error}')
+            if len(decoded) != view.nbytes:
+                raise ValueError(
+                    f'{name} has {len(decoded)} bytes instead of the expected {view.nbytes} bytes.'
+                )
+            return
+    raise KeyError(f'There is no item named {name!r} in the archive')
+
+
+def member_size(zf, name):
+    """
+    Returns the decompressed size of a member from the zip or codec frame header,
+    without decompressing it, or None when a codec frame does not have its size.
+
+    Raises:
+        KeyError: when the zip file does not have the member
+    """
+    names = zf.namelist()
+    if name in names:
+        return zf.getinfo(name).file_size
+    for codec, suffix in SUFFIXES.items():
+        if name + suffix in names:
+            with zf.open(name + suffix) as f:
+                header = f.read(FRAME_HEADER_SIZE)
+            if codec == 'lz4':
+                return lz4f_content_size(header)
+            return zstd_content_size(header)
+    raise KeyError(f'There is no item named {name!r} in the archive')
+
+
+def zstd_content_size(data):
+    """Returns the decoded size in the header of a zstd frame, or None when it has no size."""
+    if len(data) < 5 or data[:4] != ZSTD_MAGIC:
+        return None
+    descriptor = data[4]
+    single_segment = descriptor >> 5 & 1
+    size_bytes = [single_segment, 2, 4, 8][descriptor >> 6]
+    if size_bytes == 0:
+        return None
+    # Window descriptor and dictionary id come before the size
+    offset = 5 + (1 - single_segment) + [0, 1, 2, 4][descriptor & 3]
+    if len(data) < offset + size_bytes:
+        return None
+    size = int.from_bytes(data[offset : offset + size_bytes], 'little')
+    return size + 256 if size_bytes == 2 else size
+
+
+def lz4f_content_size(data):
+    """Returns the decoded size in the header of an LZ4 frame, or None when it has no size."""
+    if len(data) >= 14 and data[:4] == LZ4F_MAGIC and data[4] & 0x08:
+        return int.from_bytes(data[6:14], 'little')
+    return None
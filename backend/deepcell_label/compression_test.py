@@ -0,0 +1,125 @@
+"""Tests for compression.py"""
+
+import io
+import zipfile
+
+import numpy as np
+import pytest
+
+from deepcell_label.compression import (
+    ZIP_CODECS,
+    Codec,
+    has_member,
+    member_size,
+    read_member,
+    read_member_into,
+    zstd_content_size,
+)
+
+
+@pytest.mark.parametrize(
+    'name,level,member,compress_type',
+    [
+        ('stored', None, 'labeled.dat', zipfile.ZIP_STORED),
+        ('deflate', 1, 'labeled.dat', zipfile.ZIP_DEFLATED),
+        ('deflate', None, 'labeled.dat', zipfile.ZIP_DEFLATED),
+        ('zstd', 3, 'labeled.dat.zst', zipfile.ZIP_STORED),
+        ('lz4', None, 'labeled.dat.lz4', zipfile.ZIP_STORED),
+    ],
+)
+def test_write_and_read(name, level, member, compress_type):
+    data = np.repeat(np.arange(100, dtype=np.int32), 100).tobytes()
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        Codec(name, level).write(zf, 'labeled.dat', data)
+        Codec(name, level).write(zf, 'cells.json', '[]')
+
+    with zipfile.ZipFile(f) as zf:
+        assert zf.getinfo(member).compress_type == compress_type
+        assert has_member(zf, 'labeled.dat')
+        assert read_member(zf, 'labeled.dat') == data
+        assert read_member(zf, 'cells.json') == b'[]'
+        assert not has_member(zf, 'raw.dat')
+        with pytest.raises(KeyError):
+            read_member(zf, 'raw.dat')
+
+
+@pytest.mark.parametrize('name', ['stored', 'deflate', 'zstd', 'lz4'])
+def test_read_member_into(name):
+    labels = np.arange(10000, dtype=np.int32).reshape((100, 100))
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        Codec(name).write(zf, 'labeled.dat', memoryview(labels).cast('B'))
+
+    with zipfile.ZipFile(f) as zf:
+        out = np.empty((100, 100), np.int32)
+        read_member_into(zf, 'labeled.dat', out, chunk_size=1000)
+        np.testing.assert_array_equal(out, labels)
+        with pytest.raises(ValueError):
+            read_member_into(zf, 'labeled.dat', np.empty((10, 10), np.int32))
+        with pytest.raises(ValueError):
+            read_member_into(zf, 'labeled.dat', np.empty((200, 100), np.int32))
+        with pytest.raises(KeyError):
+            read_member_into(zf, 'raw.dat', out)
+
+
+@pytest.mark.parametrize('name', ['stored', 'deflate', 'zstd', 'lz4'])
+@pytest.mark.parametrize('size', [0, 100, 1000, 100000])
+def test_member_size(name, size):
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        Codec(name).write(zf, 'labeled.dat', bytes(size))
+
+    with zipfile.ZipFile(f) as zf:
+        # lz4 leaves the size out of the header of empty frames
+        expected = None if name == 'lz4' and size == 0 else size
+        assert member_size(zf, 'labeled.dat') == expected
+        with pytest.raises(KeyError):
+            member_size(zf, 'raw.dat')
+
+
+def test_zstd_content_size():
+    assert zstd_content_size(b'') is None
+    assert zstd_content_size(b'not a zstd frame') is None
+    # Frame without the single segment flag, a window descriptor, and a 4 byte size
+    assert zstd_content_size(b'\x28\xb5\x2f\xfd\x80\x00\x10\x27\x00\x00') == 10000
+    # Frame without its size
+    assert zstd_content_size(b'\x28\xb5\x2f\xfd\x00\x00') is None
+
+
+def test_stores_tiffs():
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        Codec('zstd').write(zf, 'y.ome.tiff', b'tiff')
+        Codec('deflate', 9).write(zf, 'X.ome.tiff', b'tiff')
+
+    with zipfile.ZipFile(f) as zf:
+        assert zf.getinfo('y.ome.tiff').compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo('X.ome.tiff').compress_type == zipfile.ZIP_STORED
+
+
+@pytest.mark.parametrize('name', ['stored', 'deflate', 'zstd'])
+def test_write_file(name):
+    data = np.arange(10000, dtype=np.int32).tobytes()
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        source = io.BytesIO(data)
+        source.seek(100)
+        Codec(name).write_file(zf, 'X.ome.tiff', source, chunk_size=1000)
+        Codec(name).write_file(zf, 'labeled.dat', io.BytesIO(data))
+
+    with zipfile.ZipFile(f) as zf:
+        assert zf.getinfo('X.ome.tiff').compress_type == zipfile.ZIP_STORED
+        assert zf.read('X.ome.tiff') == data
+        assert read_member(zf, 'labeled.dat') == data
+
+
+def test_invalid_codec():
+    with pytest.raises(ValueError):
+        Codec('gzip')
+    with pytest.raises(ValueError):
+        Codec('zstd', valid_codecs=ZIP_CODECS)
+    with pytest.raises(ValueError):
+        Codec('deflate', 10)
+    with pytest.raises(ValueError):
+        Codec('deflate', 'high')
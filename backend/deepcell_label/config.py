@@ -11,6 +11,9 @@ PORT = config('PORT', cast=int, default=5000)
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')
 S3_BUCKET = config('S3_BUCKET', default='deepcell-label-input')
+# Uploads are split into parts of this size, with at most S3_MAX_CONCURRENCY parts in memory
+S3_PART_SIZE = config('S3_PART_SIZE', cast=int, default=16)  # measured in MB
+S3_MAX_CONCURRENCY = config('S3_MAX_CONCURRENCY', cast=int, default=4)
 
 TEMPLATES_AUTO_RELOAD = config('TEMPLATES_AUTO_RELOAD', cast=bool, default=True)
 
@@ -31,6 +34,53 @@ DASHBOARD_CONFIG = config('DASHBOARD_CONFIG', default='')
 DROPZONE_MAX_FILE_SIZE = config('DROPZONE_MAX_FILE_SIZE', default=128)  # measured in MB
 DROPZONE_TIMEOUT = config('DROPZONE_TIMEOUT', default=60 * 1000)  # measured in ms
 
+# Frame cache for edits
+# Frames evicted from memory are written to FRAME_CACHE_SPILL_DIR when set
+FRAME_CACHE_SIZE = config('FRAME_CACHE_SIZE', cast=int, default=256)  # measured in MB
+FRAME_CACHE_SPILL_DIR = config('FRAME_CACHE_SPILL_DIR', default='')
+FRAME_CACHE_SPILL_SIZE = config(
+    'FRAME_CACHE_SPILL_SIZE', cast=int, default=1024
+)  # measured in MB
+# Raw frames loaded from the projects on S3 for edits that use the raw image
+RAW_CACHE_SIZE = config('RAW_CACHE_SIZE', cast=int, default=512)  # measured in MB
+
+# Worker processes for slow edits that clients ask to run asynchronously
+# EDIT_JOB_WORKERS limits the jobs that run at the same time
+# EDIT_JOB_ACTIONS lists the actions to run in the pool with their timeouts in seconds
+EDIT_JOB_WORKERS = config('EDIT_JOB_WORKERS', cast=int, default=2)
+EDIT_JOB_QUEUE_SIZE = config('EDIT_JOB_QUEUE_SIZE', cast=int, default=32)
+EDIT_JOB_ACTIONS = config(
+    'EDIT_JOB_ACTIONS',
+    default='active_contour:60,watershed:30,watershed_many:60,threshold_many:30',
+)
+# Polls for a job return after at most EDIT_JOB_MAX_WAIT so they do not hold a web thread
+EDIT_JOB_MAX_WAIT = config('EDIT_JOB_MAX_WAIT', cast=float, default=1)  # measured in s
+EDIT_JOB_TTL = config('EDIT_JOB_TTL', cast=int, default=300)  # measured in s
+
+# Compression of zip members, chosen with bench_compression.py
+# Edits can use stored, deflate, zstd, or lz4 and projects can use stored or deflate
+EDIT_COMPRESSION = config('EDIT_COMPRESSION', default='deflate')
+EDIT_COMPRESSION_LEVEL = config('EDIT_COMPRESSION_LEVEL', cast=int, default=1)
+PROJECT_COMPRESSION = config('PROJECT_COMPRESSION', default='deflate')
+PROJECT_COMPRESSION_LEVEL = config('PROJECT_COMPRESSION_LEVEL', cast=int, default=6)
+# Compression of the OME TIFFs in project and export zips, chosen with bench_tiff.py
+# Projects can use zlib or lzw, which the client decodes, and exports can also use zstd
+# Levels are empty for the default level of the codec
+TIFF_COMPRESSION = config('TIFF_COMPRESSION', default='zlib')
+TIFF_COMPRESSION_LEVEL = config('TIFF_COMPRESSION_LEVEL', default='1')
+TIFF_PREDICTOR = config('TIFF_PREDICTOR', cast=bool, default=True)
+LABEL_TIFF_COMPRESSION = config('LABEL_TIFF_COMPRESSION', default='zlib')
+LABEL_TIFF_COMPRESSION_LEVEL = config('LABEL_TIFF_COMPRESSION_LEVEL', default='6')
+LABEL_TIFF_PREDICTOR = config('LABEL_TIFF_PREDICTOR', cast=bool, default=False)
+# Frames larger than this are written in square tiles of this size, or 0 for strips
+TIFF_TILE_SIZE = config('TIFF_TILE_SIZE', cast=int, default=256)  # measured in pixels
+# Threads that compress each TIFF, or 0 to use up to the number of CPUs
+TIFF_WRITE_WORKERS = config('TIFF_WRITE_WORKERS', cast=int, default=0)
+# Threads that decode the TIFFs in an input zip, as tifffile releases the GIL
+TIFF_DECODE_WORKERS = config('TIFF_DECODE_WORKERS', cast=int, default=4)
+# Project zips and their TIFFs are written to disk once they are larger than this in MB
+PROJECT_SPOOL_SIZE = config('PROJECT_SPOOL_SIZE', cast=int, default=16)
+
 # Compression settings
 COMPRESS_MIMETYPES = [
     'text/html',
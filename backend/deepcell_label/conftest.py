@@ -1,7 +1,10 @@
 """Tests for the DeepCell Label Flask App."""
 
+import io
+import json
 import os
 import tempfile
+import zipfile
 
 import numpy as np
 import pytest
@@ -60,6 +63,20 @@ class DummyLoader(Loader):
         pass
 
 
+def make_edit_zip(edit, labels=None, cells=None, raw=None):
+    """Returns a zip with the files sent to edit labels."""
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        zf.writestr('edit.json', json.dumps(edit))
+        if labels is not None:
+            zf.writestr('labeled.dat', np.asarray(labels, np.int32).tobytes())
+            zf.writestr('cells.json', json.dumps(cells))
+        if raw is not None:
+            zf.writestr('raw.dat', np.asarray(raw, np.uint8).tobytes())
+    f.seek(0)
+    return f
+
+
 @pytest.fixture(autouse=True)
 def mock_aws(mocker):
     mocker.patch('deepcell_label.models.boto3.client')
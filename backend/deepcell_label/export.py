@@ -8,23 +8,37 @@ import json
 import zipfile
 
 import numpy as np
-import tifffile
+
+from deepcell_label.compression import ZIP_CODECS, Codec
+from deepcell_label.config import PROJECT_COMPRESSION, PROJECT_COMPRESSION_LEVEL
+from deepcell_label.metrics import timed
+from deepcell_label.tiffs import (
+    default_image_codec,
+    default_label_codec,
+    write_ome_tiff,
+)
 
 
 class Export:
-    def __init__(self, labels_zip):
+    def __init__(self, labels_zip, codec=None, image_codec=None, label_codec=None):
         self.labels_zip = labels_zip
+        if codec is None:
+            codec = Codec(PROJECT_COMPRESSION, PROJECT_COMPRESSION_LEVEL, ZIP_CODECS)
+        self.codec = codec
+        self.image_codec = default_image_codec() if image_codec is None else image_codec
+        self.label_codec = default_label_codec() if label_codec is None else label_codec
         self.export_zip = io.BytesIO()
 
-        self.load_dimensions()
-        self.load_labeled()
-        self.load_raw()
-        self.load_channels()
-        self.load_cells()
-
-        self.labeled, self.cells = rewrite_labeled(self.labeled, self.cells)
+        with timed('decode'):
+            self.load_dimensions()
+            self.load_labeled()
+            self.load_raw()
+            self.load_channels()
+            self.load_cells()
 
-        self.write_export_zip()
+        with timed('encode'):
+            self.labeled, self.cells = rewrite_labeled(self.labeled, self.cells)
+            self.write_export_zip()
         self.export_zip.seek(0)
 
     def load_dimensions(self):
@@ -100,33 +114,27 @@ class Export:
                     'cells.json',
                 ]:
                     buffer = input_zf.read(item.filename)
-                    export_zf.writestr(item, buffer)
+                    self.codec.write(export_zf, item.filename, buffer)
             # Write updated cells
-            export_zf.writestr('cells.json', json.dumps(self.cells))
+            self.codec.write(export_zf, 'cells.json', json.dumps(self.cells))
             # Write OME TIFF for labeled
-            labeled_ome_tiff = io.BytesIO()
-            tifffile.imwrite(
-                labeled_ome_tiff,
+            write_ome_tiff(
+                export_zf,
+                'y.ome.tiff',
                 self.labeled,
-                ome=True,
-                photometric='minisblack',
-                compression='zlib',
-                metadata={'axes': 'CZYX'},
+                {'axes': 'CZYX'},
+                self.label_codec,
+                self.codec,
             )
-            labeled_ome_tiff.seek(0)
-            export_zf.writestr('y.ome.tiff', labeled_ome_tiff.read())
             # Write OME TIFF for raw
-            raw_ome_tiff = io.BytesIO()
-            tifffile.imwrite(
-                raw_ome_tiff,
+            write_ome_tiff(
+                export_zf,
+                'X.ome.tiff',
                 self.raw,
-                ome=True,
-                photometric='minisblack',
-                compression='zlib',
-                metadata={'axes': 'CZYX', 'Channel': {'Name': self.channels}},
+                {'axes': 'CZYX', 'Channel': {'Name': self.channels}},
+                self.image_codec,
+                self.codec,
             )
-            raw_ome_tiff.seek(0)
-            export_zf.writestr('X.ome.tiff', raw_ome_tiff.read())
 
 
 def rewrite_labeled(labeled, cells):
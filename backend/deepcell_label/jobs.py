@@ -0,0 +1,316 @@
+"""Runs slow edits in worker processes so they do not block the web workers."""
+from __future__ import absolute_import, division, print_function
+
+import collections
+import io
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+from deepcell_label.cache import frame_cache
+from deepcell_label.compression import Codec, has_member
+from deepcell_label.config import (
+    EDIT_JOB_ACTIONS,
+    EDIT_JOB_QUEUE_SIZE,
+    EDIT_JOB_TTL,
+    EDIT_JOB_WORKERS,
+)
+from deepcell_label.label import RAW_ACTIONS, Edit, frame_size, get_cached_frame
+from deepcell_label.raw import get_raw_frame
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class JobTimeout(Exception):
+    """Raised when a job runs longer than its timeout and its process is killed."""
+
+
+def parse_timeouts(actions):
+    """
+    Parses a list of actions and timeouts like active_contour:60,watershed:30.
+
+    Returns:
+        dictionary from each action to its timeout in seconds, or None for no timeout
+    """
+    timeouts = {}
+    for item in actions.split(','):
+        if not item.strip():
+            continue
+        action, _, timeout = item.strip().partition(':')
+        timeouts[action] = float(timeout) if timeout else None
+    return timeouts
+
+
+def run_edit(data):
+    """
+    Applies an edit in a worker process.
+
+    Args:
+        data (bytes): edit zip with labeled.dat and cells.json
+
+    Returns:
+        dictionary with
+            response: bytes of the response zip
+            version: version of the edited frame or None
+            key: (project, t, c) of the edited frame or None
+            frame: edited frame to store in the frame cache of the web process or None
+    """
+    edit = Edit(io.BytesIO(data))
+    # Send the frame to the web process that caches the frames
+    frame = None if edit.frame_key is None else frame_cache.pop(edit.frame_key)
+    return {
+        'response': edit.response_zip.getvalue(),
+        'version': edit.version,
+        'key': edit.frame_key,
+        'frame': frame,
+    }
+
+
+def attach_cached_data(data):
+    """
+    Returns an edit zip with labeled.dat and cells.json from the frame cache
+    and raw.dat from the raw cache when the zip refers to the cached data,
+    as workers do not share the caches.
+
+    Raises:
+        FrameCacheMiss: when the cache does not have the version of the frame in edit.json
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        edit = json.loads(zf.read('edit.json'))
+        if 'project' not in edit:
+            return data
+        members = {}
+        if not has_member(zf, 'labeled.dat'):
+            key = (edit['project'], edit.get('t', 0), edit.get('c', 0))
+            frame = get_cached_frame(
+                key, edit.get('version'), (edit['height'], edit['width'])
+            )
+            members['labeled.dat'] = frame['labels'].tobytes()
+            members['cells.json'] = json.dumps(frame['cells'])
+        if not has_member(zf, 'raw.dat') and edit.get('action') in RAW_ACTIONS:
+            raw = get_raw_frame(
+                edit['project'], edit.get('channel', 0), edit.get('t', 0)
+            )
+            members['raw.dat'] = raw['raw'].tobytes()
+        if not members:
+            return data
+        f = io.BytesIO()
+        codec = Codec('stored')
+        with zipfile.ZipFile(f, 'w') as attached:
+            for info in zf.infolist():
+                attached.writestr(info, zf.read(info))
+            for name, member in members.items():
+                codec.write(attached, name, member)
+    return f.getvalue()
+
+
+def run_job(conn, fn, args):
+    """Sends the result of fn(*args), or the error it raised, through a pipe."""
+    try:
+        result = ('done', fn(*args))
+    except Exception as error:  # pylint: disable=broad-except
+        result = ('failed', error)
+    conn.send(result)
+    conn.close()
+
+
+def run_in_process(fn, args, timeout=None):
+    """
+    Runs fn(*args) in a new process and kills the process when it takes too long.
+
+    Killing the process stops the job even while it runs C code, like numpy
+    or scikit-image, which a timer in the process could not interrupt.
+    Processes fork from a server that has already imported the edits,
+    not from the threaded web process.
+
+    Args:
+        fn: picklable function to run
+        args (tuple): picklable arguments for fn
+        timeout (float): seconds to let the job run, or None for no limit
+
+    Returns:
+        the result of fn(*args)
+
+    Raises:
+        JobTimeout: when the job takes longer than the timeout
+        the error raised by fn
+    """
+    receiver, sender = JOB_CONTEXT.Pipe(duplex=False)
+    process = JOB_CONTEXT.Process(target=run_job, args=(sender, fn, args), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            raise JobTimeout('Edit took too long.')
+        try:
+            status, result = receiver.recv()
+        except EOFError:
+            raise RuntimeError(f'Job process exited with code {process.exitcode}.')
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+    if status == 'failed':
+        raise result
+    return result
+
+
+class JobQueue(object):
+    """
+    Bounded queue of jobs that each run in their own process.
+
+    Keeps each job until its result is taken or for ttl seconds after it finishes.
+    Jobs live in the web process that submitted them, like the frame cache,
+    so the server must run a single web process (with threads) to find them again.
+    """
+
+    def __init__(self, max_workers, max_queued, ttl, timeouts=None):
+        """
+        Args:
+            max_workers (int): jobs to run at the same time
+            max_queued (int): jobs that can wait for a process before submit raises JobQueueFull
+            ttl (float): seconds to keep finished jobs
+            timeouts (dict): timeout in seconds for each action to run as a job
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.timeouts = {} if timeouts is None else timeouts
+        self.executor = None
+        self.jobs = collections.OrderedDict()  # job id -> job dictionary
+        self.lock = threading.RLock()
+
+    def runs(self, action):
+        """Returns whether the action runs as a job."""
+        return self.max_workers > 0 and action in self.timeouts
+
+    def submit(self, fn, *args, name=None, timeout=None, on_done=None):
+        """
+        Runs fn(*args) in a worker process.
+
+        Args:
+            fn: picklable function to run
+            name (str): name to show for the job, like the action
+            timeout (float): seconds to let the job run before killing its process,
+                or None for no limit
+            on_done: function to call in this process with the result
+
+        Returns:
+            id of the job
+
+        Raises:
+            JobQueueFull: when max_queued jobs are already waiting
+        """
+        with self.lock:
+            self.prune()
+            if self.stats()['queued'] >= self.max_queued:
+                raise JobQueueFull(
+                    f'There are {self.max_queued} jobs waiting. Try again later.'
+                )
+            if self.executor is None:
+                # Each thread waits on the process of one job
+                self.executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='job'
+                )
+            job_id = uuid.uuid4().hex
+            future = self.executor.submit(run_in_process, fn, args, timeout)
+            job = {'id': job_id, 'name': name, 'future': future, 'finished': None}
+            self.jobs[job_id] = job
+
+        def finish(future):
+            job['finished'] = time.monotonic()
+            if (
+                on_done is not None
+                and not future.cancelled()
+                and not future.exception()
+            ):
+                on_done(future.result())
+
+        future.add_done_callback(finish)
+        return job_id
+
+    def get(self, job_id):
+        """Returns the job dictionary for a job id or None."""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        """Returns queued, running, done, failed, or cancelled for a job."""
+        future = self.jobs[job_id]['future']
+        if future.cancelled():
+            return 'cancelled'
+        if future.done():
+            return 'failed' if future.exception() else 'done'
+        return 'running' if future.running() else 'queued'
+
+    def wait(self, job_id, timeout):
+        """Waits up to timeout seconds for a job to finish and returns its status."""
+        wait_futures([self.jobs[job_id]['future']], timeout)
+        return self.status(job_id)
+
+    def result(self, job_id):
+        """
+        Removes a finished job and returns its result.
+
+        Raises:
+            the error raised by the job
+        """
+        with self.lock:
+            job = self.jobs.pop(job_id)
+        return job['future'].result()
+
+    def cancel(self, job_id):
+        """Cancels a job that has not started and returns whether it was cancelled."""
+        with self.lock:
+            cancelled = self.jobs[job_id]['future'].cancel()
+            if cancelled:
+                del self.jobs[job_id]
+        return cancelled
+
+    def prune(self):
+        """Removes jobs that finished more than ttl seconds ago."""
+        now = time.monotonic()
+        with self.lock:
+            for job_id, job in list(self.jobs.items()):
+                if job['finished'] is not None and now - job['finished'] > self.ttl:
+                    del self.jobs[job_id]
+
+    def stats(self):
+        """Returns a dictionary with the number of jobs in each status."""
+        with self.lock:
+            counts = collections.Counter(self.status(job_id) for job_id in self.jobs)
+        return {
+            'queued': counts['queued'],
+            'running': counts['running'],
+            'done': counts['done'],
+            'failed': counts['failed'],
+            'workers': self.max_workers,
+            'maxQueued': self.max_queued,
+        }
+
+
+def cache_job_frame(result):
+    """Stores the frame edited by a job in the frame cache of this process."""
+    if result['frame'] is not None:
+        frame_cache.put(result['key'], result['frame'], frame_size(result['frame']))
+
+
+# Job processes fork from a server process instead of the threaded web process
+JOB_CONTEXT = multiprocessing.get_context('forkserver')
+JOB_CONTEXT.set_forkserver_preload(['deepcell_label.jobs'])
+
+# Edits run in worker processes, kept in each web process like the frame cache
+job_queue = JobQueue(  # pylint: disable=C0103
+    EDIT_JOB_WORKERS,
+    EDIT_JOB_QUEUE_SIZE,
+    EDIT_JOB_TTL,
+    parse_timeouts(EDIT_JOB_ACTIONS),
+)
@@ -0,0 +1,100 @@
+"""Tests for jobs.py"""
+
+import io
+import json
+import threading
+import time
+import zipfile
+
+import numpy as np
+import pytest
+
+from deepcell_label.cache import frame_cache
+from deepcell_label.conftest import make_edit_zip
+from deepcell_label.jobs import (
+    JobQueue,
+    JobQueueFull,
+    JobTimeout,
+    attach_cached_data,
+    parse_timeouts,
+    run_edit,
+)
+from deepcell_label.label import FrameCacheMiss
+
+
+def test_parse_timeouts():
+    assert parse_timeouts('active_contour:60, watershed:2.5,draw') == {
+        'active_contour': 60,
+        'watershed': 2.5,
+        'draw': None,
+    }
+    assert parse_timeouts('') == {}
+
+
+def test_run_edit():
+    edit = {'height': 1, 'width': 2, 'action': 'dilate', 'args': {'cell': 1}}
+    data = make_edit_zip(edit, np.array([[1, 0]]), [{'cell': 1, 'value': 1}]).getvalue()
+    result = run_edit(data)
+    zf = zipfile.ZipFile(io.BytesIO(result['response']))
+    np.testing.assert_array_equal(
+        np.frombuffer(zf.read('labeled.dat'), np.int32), [1, 1]
+    )
+    assert result['frame'] is None
+
+
+def test_job_queue_timeout():
+    queue = JobQueue(max_workers=1, max_queued=10, ttl=60)
+    job_id = queue.submit(time.sleep, 10, timeout=0.5)
+    start = time.monotonic()
+    assert queue.wait(job_id, 10) == 'failed'
+    assert time.monotonic() - start < 5
+    with pytest.raises(JobTimeout):
+        queue.result(job_id)
+
+
+def test_attach_cached_data():
+    labels = np.array([[1, 2]], dtype=np.int32)
+    cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+    frame_cache.put(
+        ('test_attach_cached_data', 0, 0),
+        {'version': 'a', 'labels': labels, 'cells': cells},
+        labels.nbytes,
+    )
+    edit = {'height': 1, 'width': 2, 'project': 'test_attach_cached_data'}
+
+    zf = zipfile.ZipFile(
+        io.BytesIO(
+            attach_cached_data(make_edit_zip({**edit, 'version': 'a'}).getvalue())
+        )
+    )
+    np.testing.assert_array_equal(
+        np.frombuffer(zf.read('labeled.dat'), np.int32), [1, 2]
+    )
+    assert json.loads(zf.read('cells.json')) == cells
+    with pytest.raises(FrameCacheMiss):
+        attach_cached_data(make_edit_zip({**edit, 'version': 'b'}).getvalue())
+
+
+def test_job_queue():
+    queue = JobQueue(max_workers=1, max_queued=10, ttl=60)
+    finished = threading.Event()
+    job_ids = [queue.submit(time.sleep, 0.5, on_done=lambda _: finished.set())]
+    job_ids += [queue.submit(time.sleep, 0.5) for _ in range(2)]
+    # The last job waits for the first jobs to finish
+    assert queue.status(job_ids[-1]) == 'queued'
+    assert queue.cancel(job_ids[-1])
+    assert queue.get(job_ids[-1]) is None
+
+    assert queue.wait(job_ids[0], 10) == 'done'
+    assert queue.result(job_ids[0]) is None
+    assert queue.get(job_ids[0]) is None
+    assert not queue.cancel(job_ids[1])
+    assert queue.wait(job_ids[1], 10) == 'done'
+    assert finished.wait(10)
+    assert queue.stats()['done'] == 1
+
+
+def test_job_queue_full():
+    queue = JobQueue(max_workers=1, max_queued=0, ttl=60)
+    with pytest.raises(JobQueueFull):
+        queue.submit(time.sleep, 0)
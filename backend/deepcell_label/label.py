@@ -1,17 +1,307 @@
 """Classes to view and edit DeepCell Label Projects"""
 from __future__ import absolute_import, division, print_function
 
+import hashlib
 import io
 import json
+import os
+import timeit
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import skimage
+from scipy import ndimage
 from skimage import filters
-from skimage.exposure import rescale_intensity
-from skimage.measure import regionprops
 from skimage.morphology import dilation, disk, erosion, flood, square
-from skimage.segmentation import morphological_chan_vese, watershed
+from skimage.segmentation import expand_labels, morphological_chan_vese, watershed
+
+from deepcell_label.cache import frame_cache
+from deepcell_label.compression import (
+    Codec,
+    has_member,
+    member_size,
+    read_member,
+    read_member_into,
+)
+from deepcell_label.config import EDIT_COMPRESSION, EDIT_COMPRESSION_LEVEL
+from deepcell_label.metrics import timed
+from deepcell_label.raw import cache_elevation, get_raw_frame
+
+# Actions that use the raw image
+RAW_ACTIONS = [
+    'watershed',
+    'watershed_many',
+    'active_contour',
+    'threshold',
+    'threshold_many',
+]
+# Pixels to count at a time when counting the pixels of each value
+COUNT_CHUNK_SIZE = 2**20
+
+
+def get_bbox(mask):
+    """
+    Returns the bounding box of the nonzero pixels in a mask.
+
+    Args:
+        mask: 2D boolean numpy array
+
+    Returns:
+        (top, left, bottom, right) tuple or None when the mask is empty
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return (int(rows[0]), int(cols[0]), int(rows[-1]) + 1, int(cols[-1]) + 1)
+
+
+def union_bbox(a, b):
+    """Returns the smallest bounding box containing both bounding boxes."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def pad_bbox(bbox, pad, shape):
+    """Grows a bounding box by pad pixels on each side, clipped to the shape."""
+    top, left, bottom, right = bbox
+    height, width = shape
+    return (
+        max(0, top - pad),
+        max(0, left - pad),
+        min(height, bottom + pad),
+        min(width, right + pad),
+    )
+
+
+def offset_bbox(bbox, offset):
+    """Moves a bounding box within a crop to the coordinates of the full frame."""
+    top, left = offset[:2]
+    return (bbox[0] + top, bbox[1] + left, bbox[2] + top, bbox[3] + left)
+
+
+def crop(array, bbox):
+    """Returns a view of the bounding box in a 2D array."""
+    top, left, bottom, right = bbox
+    return array[top:bottom, left:right]
+
+
+def trace_pixels(points):
+    """
+    Returns the pixels on the line segments between consecutive points.
+
+    Args:
+        points: (N, 2) integer array of (y, x) points
+
+    Returns:
+        (M, 2) integer array of (y, x) pixels that includes every point
+    """
+    if len(points) < 2:
+        return points
+    starts = points[:-1]
+    deltas = points[1:] - starts
+    # One pixel per step along the longer axis of each segment
+    steps = np.maximum(np.abs(deltas).max(axis=1), 1)
+    segments = np.repeat(np.arange(len(steps)), steps)
+    offsets = np.arange(len(segments)) - np.repeat(np.cumsum(steps) - steps, steps)
+    fractions = (offsets / steps[segments])[:, np.newaxis]
+    pixels = np.rint(starts[segments] + deltas[segments] * fractions).astype(int)
+    return np.concatenate([pixels, points[-1:]])
+
+
+def draw_stroke(trace, radius, shape, chunk_size=256):
+    """
+    Rasterizes a brush stroke with a round brush along a trace,
+    filling in the gaps between consecutive points.
+
+    Pixels are in the stroke when they are closer than the radius to a pixel
+    on the trace, like a skimage.draw.disk stamped on each pixel of the trace.
+
+    Args:
+        trace: list of (x, y) points where the brush has painted
+        radius: radius of the brush in pixels
+        shape: (height, width) of the frame
+        chunk_size: number of trace pixels to rasterize at once,
+            which bounds the area of each distance transform on long strokes
+
+    Returns:
+        (mask, bbox) of the stroke in the frame or (None, None) when the stroke is empty
+    """
+    points = np.rint(np.asarray(trace, dtype=float).reshape(-1, 2)[:, ::-1])
+    if len(points) == 0 or radius <= 0:
+        return None, None
+    pixels = trace_pixels(points.astype(int))
+    pad = int(np.ceil(radius))
+    height, width = shape
+    top, left = np.maximum(pixels.min(axis=0) - pad, 0)
+    bottom, right = np.minimum(pixels.max(axis=0) + pad + 1, (height, width))
+    if top >= bottom or left >= right:
+        return None, None
+
+    mask = np.zeros((bottom - top, right - left), dtype=bool)
+    for start in range(0, len(pixels), chunk_size):
+        chunk = pixels[start : start + chunk_size]
+        # Canvas around the chunk that may extend past the edges of the frame
+        canvas_top, canvas_left = chunk.min(axis=0) - pad
+        canvas_bottom, canvas_right = chunk.max(axis=0) + pad + 1
+        canvas = np.ones((canvas_bottom - canvas_top, canvas_right - canvas_left), bool)
+        canvas[chunk[:, 0] - canvas_top, chunk[:, 1] - canvas_left] = False
+        stroke = ndimage.distance_transform_edt(canvas) < radius
+        # Copy the part of the canvas inside the frame
+        overlap = (
+            max(canvas_top, top),
+            max(canvas_left, left),
+            min(canvas_bottom, bottom),
+            min(canvas_right, right),
+        )
+        if overlap[0] >= overlap[2] or overlap[1] >= overlap[3]:
+            continue
+        target = crop(mask, offset_bbox(overlap, (-top, -left)))
+        target |= crop(stroke, offset_bbox(overlap, (-canvas_top, -canvas_left)))
+    return mask, (int(top), int(left), int(bottom), int(right))
+
+
+def threshold_mask(image):
+    """
+    Thresholds an image with hysteresis between a triangle threshold and 10% above it.
+
+    Args:
+        image: 2D float array
+
+    Returns:
+        boolean array with the thresholded pixels
+    """
+    # Hysteresis thresholding strategy needs two thresholds
+    # triangle threshold picked after trying a few on one dataset
+    # it may not be the best approach for other datasets!
+    low = filters.threshold_triangle(image=image)
+    high = 1.10 * low
+    # Limit stray pixelst
+    return filters.apply_hysteresis_threshold(image, low, high)
+
+
+class Converged(Exception):
+    """Raised to stop contouring when the level set stops changing."""
+
+
+def contour(image, init_level_set, iterations):
+    """
+    Runs morphological Chan-Vese until the level set stops changing.
+
+    The smoothing step alternates between two operators, so the level set
+    only stays the same for all further iterations once it is unchanged
+    for two iterations in a row.
+
+    Args:
+        image: 2D float array to contour
+        init_level_set: 2D boolean array with the starting contour
+        iterations: maximum number of iterations to run
+
+    Returns:
+        (level set, number of iterations run)
+    """
+    level_sets = []
+
+    def check_converged(level_set):
+        # Count the iteration that produced this level set, even when it converged
+        check_converged.count += 1
+        if len(level_sets) >= 2 and all(
+            np.array_equal(level_set, previous) for previous in level_sets[-2:]
+        ):
+            raise Converged()
+        level_sets.append(level_set.copy())
+        del level_sets[:-2]
+
+    check_converged.count = -1  # Called once before the first iteration
+    try:
+        level_set = morphological_chan_vese(
+            image,
+            iterations,
+            init_level_set=init_level_set,
+            iter_callback=check_converged,
+        )
+    except Converged:
+        level_set = level_sets[-1]
+    return level_set, check_converged.count
+
+
+def frame_version(labels, cells):
+    """Returns a hash of the contents of a labeled frame and its cells."""
+    pairs = sorted((c['value'], c['cell']) for c in cells)
+    version = hashlib.blake2b(digest_size=16)
+    version.update(np.ascontiguousarray(labels, dtype=np.int32))
+    version.update(json.dumps(pairs).encode())
+    return version.hexdigest()
+
+
+def frame_size(frame):
+    """Returns the bytes used by a frame in the frame cache."""
+    # Estimate about 200 bytes for each cell dictionary
+    size = frame['labels'].nbytes + 200 * len(frame['cells'])
+    size += sum(entry['labels'].nbytes for entry in frame['components'].values())
+    return size
+
+
+def read_array(zf, name, shape, dtype):
+    """
+    Decompresses a member of a zip file into a new array with a shape from edit.json.
+
+    Checks the shape against the size of the member before allocating the array,
+    so an invalid shape raises ValueError instead of running out of memory.
+
+    Raises:
+        ValueError: when the shape is invalid or does not match the size of the member
+    """
+    if not all(isinstance(n, int) and n >= 0 for n in shape):
+        raise ValueError(f'Invalid shape {shape} in edit.json.')
+    nbytes = int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+    size = member_size(zf, name)
+    data = None
+    if size is None:
+        # Codec frame without its size in the header
+        data = read_member(zf, name)
+        size = len(data)
+    if size != nbytes:
+        raise ValueError(
+            f'{name} has {size} bytes instead of the {nbytes} bytes for shape {shape}.'
+        )
+    if data is not None:
+        return np.frombuffer(data, dtype).reshape(shape).copy()
+    array = np.empty(shape, dtype)
+    read_member_into(zf, name, array)
+    return array
+
+
+class FrameCacheMiss(ValueError):
+    """Raised when an edit refers to a frame that is not in the frame cache."""
+
+
+def get_cached_frame(key, version, shape, take=False):
+    """
+    Returns a frame from the frame cache.
+
+    Args:
+        key: (project, t, c) of the frame
+        version (str): version of the frame the client has
+        shape: (height, width) of the frame
+        take (bool): whether to remove the frame from the cache, like to edit it in place
+
+    Raises:
+        FrameCacheMiss: when the cache does not have that version of the frame
+    """
+    frame = frame_cache.take(key) if take else frame_cache.get(key)
+    if frame is None or frame['version'] != version or frame['labels'].shape != shape:
+        if take and frame is not None:
+            # Keep the other version of the frame for the client that has it
+            frame_cache.put(key, frame, frame_size(frame))
+        raise FrameCacheMiss(
+            'Frame is not cached. Send the full frame in labeled.dat and cells.json.'
+        )
+    return frame
 
 
 class Edit(object):
@@ -33,167 +323,748 @@ class Edit(object):
     It additionally may contain:
         raw.dat - a binary array buffer of the raw data (uint8)
         lineage.json - a json object describing the lineage of the cells
+
+    When edit.json has a project, t, and c, the edited frame is kept in the frame cache
+    and its version returned in self.version. Later edits to the frame can send
+    that version in edit.json in place of labeled.dat and cells.json.
+    Without raw.dat, actions that use the raw image load the raw frame
+    for the project, channel, and t in edit.json from the raw cache.
     """
 
     def __init__(self, labels_zip):
 
         self.valid_modes = ['overlap', 'overwrite', 'exclude']
-        self.raw_required = ['watershed', 'active_contour', 'threshold']
+        self.valid_formats = ['full', 'patch']
+        self.raw_required = RAW_ACTIONS
+        self.response_format = 'full'
+        self.codec = Codec(EDIT_COMPRESSION, EDIT_COMPRESSION_LEVEL)
+        self.frame_key = None
+        self.version = None
+        # Version of the frame taken from the frame cache to edit, if any
+        self.cached_version = None
+        self.value_counts = None
+        # Details about how the action ran, like the iterations of active contouring
+        self.report = {}
+        self.elevation = None
+        # (project, channel, t) of the raw frame when loaded from the raw cache
+        self.raw_key = None
+        # Connected components for each (cell, connectivity), kept until edited
+        self.components = {}
 
         self.load(labels_zip)
-        self.dispatch_action()
-        self.write_response_zip()
+        self.initial_cells = list(self.cells)
+        self.index_cells()
+        if self.value_counts is None:
+            self.index_counts()
+        self.value_bboxes = None
+        # Labels in the changed area before the edit, so edits do not copy the whole frame
+        self.changed_bbox = None
+        self.initial_patch = None
+        checkpoint = self.checkpoint()
+        try:
+            with timed('decode'):
+                self.labels = self.clean_labels(self.labels, self.cells)
+            with timed('action'):
+                self.dispatch_action()
+            self.write_response_zip()
+        except Exception:
+            # Keep the frame the client has in the cache for its next edit
+            self.rollback(checkpoint)
+            self.restore_cached_frame()
+            raise
+        self.cache_frame()
 
     @property
     def new_value(self):
         """Returns a value not in the segmentation."""
-        if len(self.cells) == 0:
-            return 1
-        return max(map(lambda c: c['value'], self.cells)) + 1
+        return self.max_value + 1
 
     @property
     def new_cell(self):
         """Returns a cell not in the segmentation."""
-        if len(self.cells) == 0:
-            return 1
-        return max(map(lambda c: c['cell'], self.cells)) + 1
+        return self.max_cell + 1
 
     def load(self, labels_zip):
         """
         Load the project data to edit from a zip file.
         """
-        if not zipfile.is_zipfile(labels_zip):
-            raise ValueError('Attached labels.zip is not a zip file.')
-        zf = zipfile.ZipFile(labels_zip)
+        with timed('unzip'):
+            if not zipfile.is_zipfile(labels_zip):
+                raise ValueError('Attached labels.zip is not a zip file.')
+            zf = zipfile.ZipFile(labels_zip)
+            if 'edit.json' not in zf.namelist():
+                raise ValueError('Attached labels.zip must contain edit.json.')
+            edit_data = zf.read('edit.json')
 
         # Load edit args
-        if 'edit.json' not in zf.namelist():
-            raise ValueError('Attached labels.zip must contain edit.json.')
-        with zf.open('edit.json') as f:
-            edit = json.load(f)
-            if 'action' not in edit:
-                raise ValueError('No action specified in edit.json.')
-            self.action = edit['action']
+        with timed('decode'):
+            edit = json.loads(edit_data)
             self.height = edit['height']
             self.width = edit['width']
-            self.args = edit.get('args', None)
-            # TODO: specify write mode per cell?
-            self.write_mode = edit.get('writeMode', 'overlap')
-            if self.write_mode not in self.valid_modes:
+            self.response_format = edit.get('responseFormat', 'full')
+            if self.response_format not in self.valid_formats:
                 raise ValueError(
-                    f'Invalid writeMode {self.write_mode} in edit.json. Choose from cell, overwrite, or exclude.'
+                    f'Invalid responseFormat {self.response_format} in edit.json. Choose from full or patch.'
                 )
+            if 'compression' in edit:
+                self.codec = Codec(edit['compression'], edit.get('compressionLevel'))
+            self.load_edit(edit)
+            if 'project' in edit:
+                self.frame_key = (edit['project'], edit.get('t', 0), edit.get('c', 0))
 
-        # Load label array
-        if 'labeled.dat' not in zf.namelist():
-            raise ValueError('zip must contain labeled.dat.')
-        with zf.open('labeled.dat') as f:
-            labels = np.frombuffer(f.read(), np.int32)
-            self.initial_labels = np.reshape(labels, (self.height, self.width))
-            self.labels = self.initial_labels.copy()
-
-        # Load cells array
-        if 'cells.json' not in zf.namelist():
-            raise ValueError('zip must contain cells.json.')
-        with zf.open('cells.json') as f:
-            self.cells = json.load(f)
-
-        # Load raw image
-        if 'raw.dat' in zf.namelist():
-            with zf.open('raw.dat') as f:
-                raw = np.frombuffer(f.read(), np.uint8)
-                self.raw = np.reshape(raw, (self.width, self.height))
-        elif self.action in self.raw_required:
+        if not has_member(zf, 'labeled.dat') and self.frame_key is not None:
+            with timed('decode'):
+                self.load_cached_frame(edit.get('version'))
+        else:
+            # Decompress the labels straight into the array to edit
+            if not has_member(zf, 'labeled.dat'):
+                raise ValueError('zip must contain labeled.dat.')
+            with timed('unzip'):
+                self.labels = read_array(
+                    zf, 'labeled.dat', (self.height, self.width), np.int32
+                )
+                if not has_member(zf, 'cells.json'):
+                    raise ValueError('zip must contain cells.json.')
+                cells_data = read_member(zf, 'cells.json')
+            with timed('decode'):
+                self.cells = json.loads(cells_data)
+
+        if has_member(zf, 'raw.dat'):
+            with timed('unzip'):
+                self.raw = read_array(
+                    zf, 'raw.dat', (self.height, self.width), np.uint8
+                )
+            return
+
+        # Load raw image from the raw cache when not in the zip
+        uses_raw = any(action in self.raw_required for action in self.get_actions())
+        if uses_raw and 'project' in edit:
+            self.load_cached_raw(
+                edit['project'], edit.get('channel', 0), edit.get('t', 0)
+            )
+        else:
+            for action in self.get_actions():
+                if action in self.raw_required:
+                    raise ValueError(
+                        f'Include raw array in raw.json to use action {action}.'
+                    )
+
+    def load_cached_frame(self, version):
+        """
+        Loads the labels and cells to edit from the frame cache.
+
+        Args:
+            version (str): version of the frame the client has
+
+        Raises:
+            FrameCacheMiss: when the cache does not have that version of the frame
+        """
+        # Take the frame out of the cache to edit it in place instead of a copy.
+        # The edited frame replaces it in the cache when the edit finishes.
+        frame = get_cached_frame(
+            self.frame_key, version, (self.height, self.width), take=True
+        )
+        self.cached_version = frame['version']
+        self.labels = frame['labels']
+        self.labels.flags.writeable = True
+        self.cells = frame['cells']
+        self.value_counts = frame['counts']
+        self.components = frame['components']
+
+    def load_cached_raw(self, project, channel, t):
+        """Loads the raw frame and its elevation from the raw cache."""
+        frame = get_raw_frame(project, channel, t)
+        if frame['raw'].shape != (self.height, self.width):
             raise ValueError(
-                f'Include raw array in raw.json to use action {self.action}.'
+                f'Raw frame has shape {frame["raw"].shape} instead of {(self.height, self.width)}.'
             )
+        self.raw_key = (project, channel, t)
+        self.raw = frame['raw']
+        self.elevation = frame['elevation']
+
+    def cache_frame(self):
+        """Stores the edited frame in the frame cache and sets its version."""
+        if self.frame_key is None:
+            return
+        self.version = frame_version(self.labels, self.cells)
+        self.labels.flags.writeable = False
+        frame = {
+            'version': self.version,
+            'labels': self.labels,
+            'cells': self.cells,
+            'counts': self.value_counts,
+            'components': self.components,
+        }
+        frame_cache.put(self.frame_key, frame, frame_size(frame))
+
+    def restore_cached_frame(self):
+        """Puts the frame taken from the frame cache back after a failed edit."""
+        if self.cached_version is None:
+            return
+        self.labels.flags.writeable = False
+        frame = {
+            'version': self.cached_version,
+            'labels': self.labels,
+            'cells': self.cells,
+            'counts': self.value_counts,
+            'components': self.components,
+        }
+        frame_cache.put(self.frame_key, frame, frame_size(frame))
+
+    def checkpoint(self):
+        """
+        Returns the state to roll back the changes made after this call to,
+        and starts keeping the labels that the later changes overwrite.
+        """
+        checkpoint = {
+            'cells': list(self.cells),
+            'bbox': self.changed_bbox,
+            'patch': self.initial_patch,
+        }
+        self.changed_bbox = None
+        self.initial_patch = None
+        return checkpoint
+
+    def rollback(self, checkpoint):
+        """Undoes the changes to the labels and cells made since a checkpoint."""
+        if self.changed_bbox is not None:
+            crop(self.labels, self.changed_bbox)[:] = self.initial_patch
+        self.changed_bbox = checkpoint['bbox']
+        self.initial_patch = checkpoint['patch']
+        self.cells = checkpoint['cells']
+        self.index_cells()
+        self.index_counts()
+        self.value_bboxes = None
+        # Components labeled during the changes may not match the restored labels
+        self.components = {}
+
+    def commit(self, checkpoint):
+        """
+        Keeps the changes made since a checkpoint, merging the labels they overwrote
+        with the labels kept before the checkpoint.
+        """
+        if checkpoint['bbox'] is None:
+            return
+        if self.changed_bbox is None:
+            self.changed_bbox = checkpoint['bbox']
+            self.initial_patch = checkpoint['patch']
+            return
+        bbox = union_bbox(checkpoint['bbox'], self.changed_bbox)
+        patch = crop(self.labels, bbox).copy()
+        top, left = bbox[:2]
+        # The labels from before the checkpoint are older, so they go on top
+        for changed_bbox, initial_patch in [
+            (self.changed_bbox, self.initial_patch),
+            (checkpoint['bbox'], checkpoint['patch']),
+        ]:
+            crop(patch, offset_bbox(changed_bbox, (-top, -left)))[:] = initial_patch
+        self.changed_bbox = bbox
+        self.initial_patch = patch
+
+    def load_edit(self, edit):
+        """
+        Load the action to dispatch from edit.json.
+
+        Args:
+            edit (dict): contents of edit.json
+        """
+        if 'action' not in edit:
+            raise ValueError('No action specified in edit.json.')
+        self.action = edit['action']
+        self.args = edit.get('args', None)
+        # TODO: specify write mode per cell?
+        self.write_mode = self.check_write_mode(edit.get('writeMode', 'overlap'))
+
+    def check_write_mode(self, write_mode):
+        """Raises a ValueError for unknown write modes."""
+        if write_mode not in self.valid_modes:
+            raise ValueError(
+                f'Invalid writeMode {write_mode} in edit.json. Choose from cell, overwrite, or exclude.'
+            )
+        return write_mode
+
+    def get_actions(self):
+        """Returns the names of the actions in the edit."""
+        return [self.action]
 
     def write_response_zip(self):
         """Write edited segmentation to zip."""
         f = io.BytesIO()
-        with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-            zf.writestr('labeled.dat', self.labels.tobytes())
-            # Remove cell labels that are not in the segmentation
-            values = np.unique(self.labels)
-            self.cells = list(filter(lambda c: c['value'] in values, self.cells))
-            zf.writestr('cells.json', json.dumps(self.cells))
+        with zipfile.ZipFile(f, 'w') as zf:
+            self.write_response(zf)
         f.seek(0)
         self.response_zip = f
 
+    def write_response(self, zf):
+        """Writes the edited labels and cells to the response zip."""
+        with timed('encode'):
+            members = self.encode_response()
+        for name, data in members.items():
+            self.codec.write(zf, name, data)
+
+    def encode_response(self):
+        """Returns a dictionary with the name and contents of each member of the response zip."""
+        # Remove cell labels that are not in the segmentation
+        self.cells = [c for c in self.cells if c['value'] in self.value_counts]
+        if self.response_format == 'patch':
+            members = self.encode_patch()
+        else:
+            members = {
+                # Write the labels to the zip without a copy
+                'labeled.dat': memoryview(np.ascontiguousarray(self.labels)).cast('B'),
+                'cells.json': json.dumps(self.cells),
+            }
+        if self.report:
+            members['report.json'] = json.dumps(self.report)
+        return members
+
+    def encode_patch(self):
+        """
+        Returns only the changes to the labels and cells for the response zip.
+
+        patch.dat - a binary array buffer of the labels in the bounding box
+                    of the changed pixels (int32)
+        patch.json - a json object with
+                     - bbox: [top, left, bottom, right] of patch.dat
+                             or null when no pixels changed
+                     - added: cells not in the edited cells.json
+                     - removed: cells from the edited cells.json that were removed
+        """
+        bbox = None
+        if self.changed_bbox is not None:
+            changed = self.initial_patch != crop(self.labels, self.changed_bbox)
+            bbox = get_bbox(changed)
+        patch_data = b''
+        if bbox is not None:
+            bbox = offset_bbox(bbox, self.changed_bbox)
+            patch_data = crop(self.labels, bbox).tobytes()
+
+        initial_pairs = set((c['value'], c['cell']) for c in self.initial_cells)
+        edited_pairs = set((c['value'], c['cell']) for c in self.cells)
+        patch = {
+            'bbox': bbox,
+            'added': [
+                c for c in self.cells if (c['value'], c['cell']) not in initial_pairs
+            ],
+            'removed': [
+                c
+                for c in self.initial_cells
+                if (c['value'], c['cell']) not in edited_pairs
+            ],
+        }
+        return {'patch.dat': patch_data, 'patch.json': json.dumps(patch)}
+
+    def index_cells(self):
+        """
+        Builds lookup tables between values and cells from the cells list.
+
+        Creates
+            value_cells: maps each value to the frozenset of cells it encodes
+            cell_values: maps each cell to the set of values that encode it
+            cells_value: maps each frozenset of cells to the value that encodes it
+        """
+        value_cells = {}
+        for c in self.cells:
+            value_cells.setdefault(c['value'], set()).add(c['cell'])
+        self.value_cells = {0: frozenset()}
+        self.cell_values = {}
+        self.cells_value = {frozenset(): 0}
+        self.max_value = 0
+        self.max_cell = 0
+        for value, cells in value_cells.items():
+            self.index_value(value, frozenset(cells))
+
+    def index_value(self, value, cells):
+        """Adds a value that encodes a frozenset of cells to the lookup tables."""
+        self.value_cells[value] = cells
+        self.cells_value.setdefault(cells, value)
+        for cell in cells:
+            self.cell_values.setdefault(cell, set()).add(value)
+            self.max_cell = max(self.max_cell, cell)
+        self.max_value = max(self.max_value, value)
+
+    def index_counts(self):
+        """Counts the pixels with each value in the labels."""
+        labels = self.labels.ravel()
+        if labels.size and 0 <= labels.min() and labels.max() <= 4 * labels.size:
+            # Count in chunks as bincount makes an int64 copy of its input
+            counts = np.zeros(labels.max() + 1, np.int64)
+            for start in range(0, labels.size, COUNT_CHUNK_SIZE):
+                chunk = labels[start : start + COUNT_CHUNK_SIZE]
+                counts += np.bincount(chunk, minlength=counts.size)
+            values = np.flatnonzero(counts)
+            counts = counts[values]
+        else:
+            # Avoid allocating a count for each value up to a very large value
+            values, counts = np.unique(labels, return_counts=True)
+        self.value_counts = dict(zip(values.tolist(), counts.tolist()))
+
+    def update_counts(self, value, new_value, count):
+        """Moves count pixels from value to new_value in the pixel counts."""
+        self.value_counts[value] -= count
+        if self.value_counts[value] == 0:
+            del self.value_counts[value]
+        self.value_counts[new_value] = self.value_counts.get(new_value, 0) + count
+
     def get_cells(self, value):
         """
         Returns a list of cells encoded by the value
         """
-        return list(
-            map(lambda c: c['cell'], filter(lambda c: c['value'] == value, self.cells))
-        )
+        return list(self.value_cells.get(value, ()))
 
     def get_values(self, cell):
         """
         Returns a list of values that encode a cell
         """
-        return list(
-            map(lambda c: c['value'], filter(lambda c: c['cell'] == cell, self.cells))
-        )
+        return list(self.cell_values.get(cell, ()))
 
     def get_value(self, cells):
         """
         Returns the value that encodes the list of cells
         """
-        if cells == []:
-            return 0
-        values = set(map(lambda c: c['value'], self.cells))
-        for cell in cells:
-            values = values & set(self.get_values(cell))
-        for value in values:
-            if set(self.get_cells(value)) == set(cells):
-                return value
+        cells = frozenset(cells)
+        if cells in self.cells_value:
+            return self.cells_value[cells]
         value = self.new_value
         for cell in cells:
             self.cells.append({'value': value, 'cell': cell})
+        self.index_value(value, cells)
         return value
 
-    def get_mask(self, cell):
+    @property
+    def frame_bbox(self):
+        """Returns the bounding box of the whole frame."""
+        height, width = self.labels.shape
+        return (0, 0, height, width)
+
+    def index_bboxes(self):
         """
-        Returns a boolean mask of the cell (or the background when cell == 0)
+        Finds the bounding box of each value in the segmentation.
+        Runs once per edit and only when an action needs the extent of a cell.
+        """
+        self.value_bboxes = {}
+        for value, slices in enumerate(ndimage.find_objects(self.labels), start=1):
+            if slices is not None:
+                rows, cols = slices
+                self.value_bboxes[value] = (
+                    rows.start,
+                    cols.start,
+                    rows.stop,
+                    cols.stop,
+                )
+
+    def get_bbox(self, cell):
+        """
+        Returns the bounding box of a cell or None if the cell is not in the segmentation.
         """
         if cell == 0:
-            return self.labels == 0
-        mask = np.zeros(self.labels.shape, dtype=bool)
+            return self.frame_bbox
+        if self.value_bboxes is None:
+            self.index_bboxes()
+        bbox = None
         for value in self.get_values(cell):
-            mask[self.labels == value] = True
-        return mask
+            bbox = union_bbox(bbox, self.value_bboxes.get(value))
+        if bbox is None:
+            return None
+        # Shrink to the pixels still in the cell
+        cell_bbox = get_bbox(self.get_mask(cell, bbox))
+        return None if cell_bbox is None else offset_bbox(cell_bbox, bbox)
+
+    def get_mask(self, cell, bbox=None):
+        """
+        Returns a boolean mask of the cell (or the background when cell == 0)
+        within a bounding box (or the whole frame when bbox is None).
+        """
+        labels = self.labels if bbox is None else crop(self.labels, bbox)
+        if cell == 0:
+            return labels == 0
+        return np.isin(labels, self.get_values(cell))
+
+    def label_components(self, cell, connectivity):
+        """
+        Labels the connected components of a cell (or the background when cell == 0)
+        and keeps them until an edit changes them.
+
+        Args:
+            cell (int): cell to label
+            connectivity (int): 1 to connect pixels by their edges or 2 to include corners
+
+        Returns:
+            dictionary with
+                bbox: bounding box of the labeled area
+                labels: array of the component of each pixel in the bounding box
+                bboxes: (N, 4) array with the bounding box of each component in the frame
+                valid: (N,) boolean array that is False for components changed by an edit
+                complete: whether the labels have all of the components of the cell
+        """
+        bbox = self.get_bbox(cell)
+        if bbox is None:
+            bbox = (0, 0, 0, 0)
+        top, left = bbox[:2]
+        structure = ndimage.generate_binary_structure(2, connectivity)
+        labels, _ = ndimage.label(self.get_mask(cell, bbox), structure)
+        bboxes = [
+            (rows.start, cols.start, rows.stop, cols.stop)
+            for rows, cols in ndimage.find_objects(labels)
+        ]
+        bboxes = np.array(bboxes, dtype=int).reshape(-1, 4) + (top, left, top, left)
+        entry = {
+            'bbox': bbox,
+            'labels': labels,
+            'bboxes': bboxes,
+            'valid': np.ones(len(bboxes), dtype=bool),
+            'complete': True,
+        }
+        self.components[(cell, connectivity)] = entry
+        return entry
+
+    def get_components(self, cell, connectivity, x, y, complete=False):
+        """
+        Returns the connected components of a cell with the component at (x, y) unchanged,
+        labeling the components again when an edit may have changed them.
+
+        Args:
+            cell (int): cell with the components
+            connectivity (int): 1 to connect pixels by their edges or 2 to include corners
+            x (int): x coordinate of a pixel in the cell
+            y (int): y coordinate of a pixel in the cell
+            complete (bool): whether all the components must be unchanged
+
+        Returns:
+            (components, component at (x, y)) where components is from label_components
+        """
+        entry = self.components.get((cell, connectivity))
+        if entry is not None and (entry['complete'] or not complete):
+            top, left, bottom, right = entry['bbox']
+            if top <= y < bottom and left <= x < right:
+                component = entry['labels'][y - top, x - left]
+                if component != 0 and entry['valid'][component - 1]:
+                    return entry, component
+        entry = self.label_components(cell, connectivity)
+        top, left = entry['bbox'][:2]
+        return entry, entry['labels'][y - top, x - left]
+
+    def get_component_mask(self, entry, component):
+        """Returns the mask and bounding box of a component from label_components."""
+        bbox = tuple(entry['bboxes'][component - 1].tolist())
+        labels = crop(
+            entry['labels'], offset_bbox(bbox, (-entry['bbox'][0], -entry['bbox'][1]))
+        )
+        return labels == component, bbox
+
+    def invalidate_components(self, bbox):
+        """Marks the connected components that an edit in the bounding box could change."""
+        top, left, bottom, right = pad_bbox(bbox, 1, self.labels.shape)
+        for entry in self.components.values():
+            bboxes = entry['bboxes']
+            changed = (
+                (bboxes[:, 0] < bottom)
+                & (bboxes[:, 2] > top)
+                & (bboxes[:, 1] < right)
+                & (bboxes[:, 3] > left)
+            )
+            entry['valid'][changed] = False
+            # The edit may add new components anywhere
+            entry['complete'] = False
+
+    def add_mask(self, mask, cell, bbox=None):
+        """
+        Adds the cell to the mask area according to the write mode.
+
+        Args:
+            mask: boolean array with the same shape as the bounding box
+            cell (int): cell to add
+            bbox: (top, left, bottom, right) area of the mask or None for the whole frame
+        """
+        if self.write_mode == 'overlap':
+            self.overlap_mask(mask, cell, bbox=bbox)
+        else:
+            self.rewrite_mask(mask, lambda value: self.write_value(value, cell), bbox)
+
+    def remove_mask(self, mask, cell, bbox=None):
+        """Removes the cell from the mask area."""
+        self.overlap_mask(mask, cell, remove=True, bbox=bbox)
 
-    def add_mask(self, mask, cell):
-        self.labels = self.clean_labels(self.labels, self.cells)
+    def write_value(self, value, cell):
+        """Returns the value that replaces a value when adding a cell according to the write mode."""
         if self.write_mode == 'overwrite':
-            self.labels[mask] = self.get_value([cell])
-        elif self.write_mode == 'exclude':
-            mask = mask & (self.labels == 0)
-            self.labels[mask] = self.get_value([cell])
-        else:  # self.write_mode == 'overlap'
-            self.overlap_mask(mask, cell)
+            return self.get_value([cell])
+        if self.write_mode == 'exclude':
+            return self.get_value([cell]) if value == 0 else value
+        # self.write_mode == 'overlap'
+        return self.get_value(set(self.get_cells(value)) | {cell})
+
+    def add_cells(self, image, mask, bbox=None):
+        """
+        Adds the cell in the image to each pixel in the mask area according to the write mode.
+
+        Args:
+            image: array with the same shape as the bounding box with the cell to add to each pixel
+            mask: boolean array with the same shape as the bounding box
+            bbox: (top, left, bottom, right) area of the mask or None for the whole frame
+        """
+        self.rewrite_mask(mask, self.write_value, bbox, cells=image)
+
+    def remove_cells(self, image, mask, bbox=None):
+        """Removes the cell in the image from each pixel in the mask area."""
+
+        def remap(value, cell):
+            return self.get_value(set(self.get_cells(value)) - {cell})
+
+        self.rewrite_mask(mask, remap, bbox, cells=image)
+
+    def shrink_mask(self, mask, bbox=None):
+        """
+        Crops a mask to the bounding box of its pixels.
+
+        Returns:
+            (cropped mask, bounding box in the frame) or (None, None) when the mask is empty
+        """
+        if bbox is None:
+            bbox = self.frame_bbox
+        mask_bbox = get_bbox(mask)
+        if mask_bbox is None:
+            return None, None
+        return crop(mask, mask_bbox), offset_bbox(mask_bbox, bbox)
+
+    def get_cell_image(self, cells):
+        """
+        Returns an image with the cell out of cells at each pixel (or 0 for pixels without them).
+        No value may encode more than one of the cells.
+        """
+        values = np.array(sorted(self.value_counts), dtype=self.labels.dtype)
+        value_cells = np.zeros(len(values), dtype=np.int32)
+        for i, value in enumerate(values.tolist()):
+            for cell in self.value_cells.get(value, frozenset()) & cells:
+                value_cells[i] = cell
+        return value_cells[np.searchsorted(values, self.labels)]
+
+    def get_cells_mask(self, cells):
+        """Returns a boolean image of the pixels with any of the cells."""
+        if not cells:
+            return np.zeros(self.labels.shape, dtype=bool)
+        values = np.array(sorted(self.value_counts), dtype=self.labels.dtype)
+        has_cells = np.array(
+            [
+                bool(self.value_cells.get(value, frozenset()) & cells)
+                for value in values.tolist()
+            ],
+            dtype=bool,
+        )
+        return has_cells[np.searchsorted(values, self.labels)]
 
-    def remove_mask(self, mask, cell):
-        self.overlap_mask(mask, cell, remove=True)
+    def get_separate_cells(self, cells):
+        """Returns a subset of cells where no value in the labels encodes two of the cells."""
+        separate = set()
+        overlapping = set()
+        for cell in sorted(cells):
+            if cell in overlapping:
+                continue
+            separate.add(cell)
+            for value in self.get_values(cell):
+                if value in self.value_counts:
+                    overlapping |= self.value_cells[value]
+        return separate
 
-    def overlap_mask(self, mask, cell, remove=False):
+    def edit_cells(self, cells, edit_fn):
+        """
+        Edits many cells at once with a function of an image from get_cell_image.
+        When cells overlap, edits the overlapping cells in separate passes.
+
+        Args:
+            cells (list): cells to edit or None to edit every cell
+            edit_fn: function of an image with the cell to edit at each pixel
+        """
+        cells = set(self.cell_values if cells is None else cells) - {0}
+        while cells:
+            separate = self.get_separate_cells(cells)
+            edit_fn(self.get_cell_image(separate))
+            cells -= separate
+
+    def update_bbox(self, value, bbox):
+        """Grows the bounding box of a value after writing it inside bbox."""
+        if self.value_bboxes is not None:
+            self.value_bboxes[value] = union_bbox(self.value_bboxes.get(value), bbox)
+
+    def overlap_mask(self, mask, cell, remove=False, bbox=None):
         """
         Adds the cell to the segmentation in the mask area,
         overlapping with existing cells.
         """
-        # Rewrite values inside mask to encode label
-        values = np.unique(self.labels[mask])
-        for value in values:
+
+        def remap(value):
             # Get value to encode new set of labels
-            cells = self.get_cells(value)
+            cells = set(self.get_cells(value))
             if remove:
-                if cell in cells:
-                    cells.remove(cell)
+                cells.discard(cell)
             else:
-                cells.append(cell)
-            new_value = self.get_value(cells)
-            self.labels[mask & (self.labels == value)] = new_value
+                cells.add(cell)
+            return self.get_value(cells)
+
+        self.rewrite_mask(mask, remap, bbox)
+
+    def rewrite_mask(self, mask, remap, bbox=None, cells=None):
+        """
+        Rewrites each value in the mask area with a new value in a single pass.
+
+        Args:
+            mask: boolean array with the same shape as the bounding box
+            remap: function from a value inside the mask to the value that replaces it,
+                   or from a value and a cell when cells is given
+            bbox: (top, left, bottom, right) area of the mask or None for the whole frame
+            cells: array with the same shape as the bounding box
+                   with the cell to pass to remap for each pixel
+        """
+        if cells is not None:
+            mask_bbox = get_bbox(mask)
+            cells = None if mask_bbox is None else crop(cells, mask_bbox)
+        mask, bbox = self.shrink_mask(mask, bbox)
+        if bbox is None:
+            return
+        self.snapshot(bbox)
+        labels = crop(self.labels, bbox)
+        if cells is None:
+            values, inverse = np.unique(labels[mask], return_inverse=True)
+            new_values = [remap(value) for value in values.tolist()]
+        else:
+            # Remap each pair of a value and a cell, packed into one integer
+            pairs = labels[mask].astype(np.int64) << 32 | cells[mask].astype(np.int64)
+            pairs, inverse = np.unique(pairs, return_inverse=True)
+            values = pairs >> 32
+            new_values = [
+                remap(value, cell)
+                for value, cell in zip(values.tolist(), (pairs & 0xFFFFFFFF).tolist())
+            ]
+        inverse = inverse.ravel()
+        new_values = np.array(new_values)
+        labels[mask] = new_values.astype(labels.dtype)[inverse]
+        self.invalidate_components(bbox)
+        counts = np.bincount(inverse, minlength=len(values))
+        for value, new_value, count in zip(
+            values.tolist(), new_values.tolist(), counts.tolist()
+        ):
+            if new_value != value:
+                self.update_bbox(new_value, bbox)
+                self.update_counts(value, new_value, count)
+
+    def snapshot(self, bbox):
+        """
+        Keeps the labels in a bounding box before they are edited,
+        growing the changed area to include the bounding box.
+        """
+        changed_bbox = union_bbox(self.changed_bbox, bbox)
+        if self.changed_bbox is not None and tuple(changed_bbox) == tuple(
+            self.changed_bbox
+        ):
+            return
+        initial_patch = crop(self.labels, changed_bbox).copy()
+        if self.changed_bbox is not None:
+            # The labels in the previous changed area may already be edited
+            top, left = changed_bbox[:2]
+            previous = offset_bbox(self.changed_bbox, (-top, -left))
+            crop(initial_patch, previous)[:] = self.initial_patch
+        self.changed_bbox = changed_bbox
+        self.initial_patch = initial_patch
 
     def clean_cell(self, cell):
         """Ensures that a cell is a positive integer"""
@@ -211,9 +1082,17 @@ class Edit(object):
         Returns:
             (numpy array of shape (height, width), cells with updated values)
         """
-        values = [cell['value'] for cell in cells]  # get list of values
-        deleted_mask = np.isin(labeled, values, invert=True)
+        values = set(cell['value'] for cell in cells)
+        deleted = [v for v in self.value_counts if v != 0 and v not in values]
+        if not deleted:
+            return labeled
+        deleted_mask = np.isin(labeled, deleted)
+        deleted_bbox = get_bbox(deleted_mask)
+        self.snapshot(deleted_bbox)
         labeled[deleted_mask] = 0  # delete any labels not in values
+        self.invalidate_components(deleted_bbox)
+        for value in deleted:
+            self.update_counts(value, 0, self.value_counts[value])
         return labeled
 
     def dispatch_action(self):
@@ -244,18 +1123,14 @@ class Edit(object):
             erase (bool): whether to add or remove label from brush stroke area
         """
         trace = json.loads(trace)
-        # Create mask for brush stroke
-        brush_mask = np.zeros(self.labels.shape, dtype=bool)
-        for loc in trace:
-            x = loc[0]
-            y = loc[1]
-            disk = skimage.draw.disk((y, x), brush_size, shape=self.labels.shape)
-            brush_mask[disk] = True
+        brush_mask, bbox = draw_stroke(trace, brush_size, self.labels.shape)
+        if bbox is None:
+            return
 
         if erase:
-            self.remove_mask(brush_mask, cell)
+            self.remove_mask(brush_mask, cell, bbox)
         else:
-            self.add_mask(brush_mask, cell)
+            self.add_mask(brush_mask, cell, bbox)
 
     def action_trim_pixels(self, cell, x, y):
         """
@@ -266,10 +1141,13 @@ class Edit(object):
             x (int): x position of seed
             y (int): y position of seed
         """
-        mask = self.get_mask(cell)
-        if mask[y, x]:
-            connected_mask = flood(mask, (y, x))
-            self.remove_mask(~connected_mask, cell)
+        if not self.get_mask(cell, (y, x, y + 1, x + 1))[0, 0]:
+            return
+        components, connected = self.get_components(cell, 2, x, y, complete=True)
+        for component in range(1, len(components['bboxes']) + 1):
+            if component != connected:
+                mask, bbox = self.get_component_mask(components, component)
+                self.remove_mask(mask, cell, bbox)
 
     # TODO: come back to flooding with overlaps...
     def action_flood(self, foreground, background, x, y):
@@ -283,46 +1161,74 @@ class Edit(object):
             x (int): x coordinate of region to flood
             y (int): y coordinate of region to flood
         """
-        mask = self.get_mask(background)
-        flooded = flood(mask, (y, x), connectivity=2 if background != 0 else 1)
-        self.add_mask(flooded, foreground)
+        connectivity = 2 if background != 0 else 1
+        if self.get_mask(background, (y, x, y + 1, x + 1))[0, 0]:
+            components, component = self.get_components(background, connectivity, x, y)
+            flooded, bbox = self.get_component_mask(components, component)
+        else:
+            # Flood the pixels outside of the background label connected to (x, y)
+            bbox = self.frame_bbox
+            mask = self.get_mask(background, bbox)
+            flooded = flood(mask, (y, x), connectivity=connectivity)
+        self.add_mask(flooded, foreground, bbox)
+
+    def get_elevation(self):
+        """
+        Returns the inverted raw image for watershed to flood from the brightest pixels,
+        computed once for each raw frame.
+        """
+        if self.elevation is None:
+            self.elevation = -self.raw.astype(np.float32)
+            if self.raw_key is not None:
+                cache_elevation(self.raw_key, self.elevation)
+        return self.elevation
 
     def action_watershed(self, cell, new_cell, x1, y1, x2, y2):
         """Use watershed to segment different objects"""
-        # Create markers for to seed watershed labels
-        markers = np.zeros(self.labels.shape)
-        markers[y1, x1] = cell
-        markers[y2, x2] = new_cell
+        seeds = [{'x': x1, 'y': y1, 'cell': cell}, {'x': x2, 'y': y2, 'cell': new_cell}]
+        self.action_watershed_many(cell, seeds)
+
+    def action_watershed_many(self, cell, seeds):
+        """
+        Splits a cell with watershed into a cell for each seed.
 
+        Args:
+            cell (int): cell to split
+            seeds (list): dictionaries with the x and y of a seed and the cell to grow from it,
+                          where later seeds replace earlier seeds at the same pixel
+        """
         # Cut images to cell bounding box
-        mask = self.get_mask(cell)
-        props = regionprops(mask.astype(np.uint8))
-        top, left, bottom, right = props[0].bbox
-        raw = np.copy(self.raw[top:bottom, left:right])
-        markers = np.copy(markers[top:bottom, left:right])
-        mask = np.copy(mask[top:bottom, left:right])
-
-        # Contrast adjust and invert the raw image
-        raw = -rescale_intensity(raw)
+        bbox = self.get_bbox(cell)
+        if bbox is None:
+            return
+        top, left, bottom, right = bbox
+        mask = self.get_mask(cell, bbox)
+
+        # Create markers for to seed watershed labels
+        markers = np.zeros(mask.shape, dtype=np.int32)
+        seed_cells = []
+        for seed in seeds:
+            x, y = seed['x'], seed['y']
+            if top <= y < bottom and left <= x < right:
+                if seed['cell'] not in seed_cells:
+                    seed_cells.append(seed['cell'])
+                markers[y - top, x - left] = seed_cells.index(seed['cell']) + 1
+        if not seed_cells:
+            return
+
         # Apply watershed
-        results = watershed(raw, markers, mask=mask)
+        results = watershed(crop(self.get_elevation(), bbox), markers, mask=mask)
 
         # Dilate small cells to prevent "dimmer" cell from being eroded by the "brighter" cell
-        if np.sum(results == new_cell) < 5:
-            dilated = dilation(results == new_cell, disk(3))
-            results[dilated] = new_cell
-        if np.sum(results == cell) < 5:
-            dilated = dilation(results == cell, disk(3))
-            results[dilated] = cell
+        for i in range(len(seed_cells), 0, -1):
+            if np.sum(results == i) < 5:
+                dilated = dilation(results == i, disk(3))
+                results[dilated] = i
 
         # Update cells where watershed changed cell
-        new_cell_mask = np.zeros(self.labels.shape, dtype=bool)
-        cell_mask = np.zeros(self.labels.shape, dtype=bool)
-        new_cell_mask[top:bottom, left:right] = results == new_cell
-        cell_mask[top:bottom, left:right] = results == cell
-        self.remove_mask(self.get_mask(cell), cell)
-        self.add_mask(cell_mask, cell)
-        self.add_mask(new_cell_mask, new_cell)
+        self.remove_mask(mask, cell, bbox)
+        for i, seed_cell in enumerate(seed_cells, 1):
+            self.add_mask(results == i, seed_cell, bbox)
 
     def action_threshold(self, y1, x1, y2, x2, cell):
         """
@@ -336,54 +1242,76 @@ class Edit(object):
             x2 (int): second x coordinate to bound threshold area
             cell (int): cell drawn in threshold area
         """
-        cell = self.clean_cell(cell)
-        # Make bounding box from coordinates
-        top = min(y1, y2)
-        bottom = max(y1, y2) + 1
-        left = min(x1, x2)
-        right = max(x1, x2) + 1
-        image = self.raw[top:bottom, left:right].astype('float64')
-        # Hysteresis thresholding strategy needs two thresholds
-        # triangle threshold picked after trying a few on one dataset
-        # it may not be the best approach for other datasets!
-        low = filters.threshold_triangle(image=image)
-        high = 1.10 * low
-        # Limit stray pixelst
-        thresholded = filters.apply_hysteresis_threshold(image, low, high)
-        mask = np.zeros(self.labels.shape, dtype=bool)
-        mask[top:bottom, left:right] = thresholded
-        self.add_mask(mask, cell)
+        self.action_threshold_many(
+            [{'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'cell': cell}]
+        )
+
+    def action_threshold_many(self, boxes):
+        """
+        Thresholds the raw image in many boxes at once, in parallel threads,
+        then adds each thresholded box to its cell in order.
+
+        Args:
+            boxes (list): dictionaries with the x1, y1, x2, and y2 corners of a box
+                          and the cell to draw in it
+        """
+        bboxes = []
+        for box in boxes:
+            # Make bounding box from coordinates
+            top = min(box['y1'], box['y2'])
+            bottom = max(box['y1'], box['y2']) + 1
+            left = min(box['x1'], box['x2'])
+            right = max(box['x1'], box['x2']) + 1
+            bbox = pad_bbox((top, left, bottom, right), 0, self.labels.shape)
+            if bbox[0] < bbox[2] and bbox[1] < bbox[3]:
+                bboxes.append((bbox, self.clean_cell(box['cell'])))
+
+        def threshold_box(bbox):
+            return threshold_mask(crop(self.raw, bbox).astype(np.float32))
+
+        workers = min(len(bboxes), os.cpu_count() or 1)
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                masks = list(executor.map(threshold_box, [b for b, _ in bboxes]))
+        else:
+            masks = [threshold_box(bbox) for bbox, _ in bboxes]
+
+        for (bbox, cell), mask in zip(bboxes, masks):
+            self.add_mask(mask, cell, bbox)
 
     def action_active_contour(self, cell, min_pixels=20, iterations=100, dilate=0):
         """
         Uses active contouring to reshape a cell to match the raw image.
         """
-        mask = self.get_mask(cell)
         # Limit contouring to a bounding box twice the size of the cell
-        props = regionprops(mask.astype(np.uint8))[0]
-        top, left, bottom, right = props.bbox
+        cell_bbox = self.get_bbox(cell)
+        if cell_bbox is None:
+            return
+        top, left, bottom, right = cell_bbox
         cell_height = bottom - top
         cell_width = right - left
         # Double size of bounding box
         height, width = self.labels.shape
-        top = max(0, top - height // 2)
+        top = max(0, top - cell_height // 2)
         bottom = min(height, bottom + cell_height // 2)
-        left = max(0, left - width // 2)
+        left = max(0, left - cell_width // 2)
         right = min(width, right + cell_width // 2)
+        bbox = (top, left, bottom, right)
 
         # Contour the cell
-        init_level_set = mask[top:bottom, left:right]
-        # Normalize to range [0., 1.]
-        _vmin, _vmax = self.raw.min(), self.raw.max()
+        mask = self.get_mask(cell, bbox)
+        init_level_set = mask
+        # Normalize to range [0., 1.] within the box
+        # as contouring does not change when the image is scaled and shifted
+        image = crop(self.raw, bbox).astype(np.float64)
+        _vmin, _vmax = image.min(), image.max()
         if _vmin == _vmax:
-            image = np.zeros_like(self.raw)
+            image = np.zeros_like(image)
         else:
-            image = self.raw.copy()
             image -= _vmin
-            image = image / (_vmax - _vmin)
-        image = image[top:bottom, left:right]
-        contoured = morphological_chan_vese(
-            image, iterations, init_level_set=init_level_set
+            image /= _vmax - _vmin
+        contoured, self.report['iterations'] = contour(
+            image, init_level_set, iterations
         )
 
         # Dilate to adjust for tight fit
@@ -392,29 +1320,396 @@ class Edit(object):
         # Keep only the largest connected component
         regions = skimage.measure.label(contoured)
         if np.any(regions):
-            largest_component = regions == (
-                np.argmax(np.bincount(regions.flat)[1:]) + 1
-            )
-            mask = np.zeros(self.labels.shape, dtype=bool)
-            mask[top:bottom, left:right] = largest_component
+            mask = regions == (np.argmax(np.bincount(regions.flat)[1:]) + 1)
 
         # Throw away small contoured cells
         if np.count_nonzero(mask) >= min_pixels:
-            self.remove_mask(~mask, cell)
-            self.add_mask(mask, cell)
+            self.remove_mask(~mask, cell, bbox)
+            self.add_mask(mask, cell, bbox)
 
     def action_erode(self, cell):
         """
         Shrink the selected cell.
         """
-        mask = self.get_mask(cell)
+        bbox = self.get_bbox(cell)
+        if bbox is None:
+            return
+        # Pad so that the edges of the box erode like the rest of the frame
+        bbox = pad_bbox(bbox, 1, self.labels.shape)
+        mask = self.get_mask(cell, bbox)
         eroded = erosion(mask, square(3))
-        self.remove_mask(mask & ~eroded, cell)
+        self.remove_mask(mask & ~eroded, cell, bbox)
 
     def action_dilate(self, cell):
         """
         Expand the selected cell.
         """
-        mask = self.get_mask(cell)
+        bbox = self.get_bbox(cell)
+        if bbox is None:
+            return
+        bbox = pad_bbox(bbox, 1, self.labels.shape)
+        mask = self.get_mask(cell, bbox)
         dilated = dilation(mask, square(3))
-        self.add_mask(dilated, cell)
+        self.add_mask(dilated, cell, bbox)
+
+    def action_erode_all(self, radius=1, cells=None):
+        """
+        Shrinks every cell (or each cell in cells) by removing its pixels
+        within radius pixels of another cell or the background.
+
+        Args:
+            radius (int): pixels to remove from the edge of each cell
+            cells (list): cells to shrink, or None for all cells
+        """
+        footprint = disk(radius)
+
+        def erode(image):
+            low = ndimage.minimum_filter(image, footprint=footprint, mode='nearest')
+            high = ndimage.maximum_filter(image, footprint=footprint, mode='nearest')
+            self.remove_cells(image, (image != 0) & ((low != image) | (high != image)))
+
+        self.edit_cells(cells, erode)
+
+    def action_dilate_all(self, radius=1, cells=None):
+        """
+        Expands every cell (or each cell in cells) by up to radius pixels
+        without expanding into the other cells being expanded.
+        Pixels within radius of several cells go to the nearest cell.
+
+        Args:
+            radius (int): pixels to add to the edge of each cell
+            cells (list): cells to expand, or None for all cells
+        """
+        cells = set(self.cell_values if cells is None else cells) - {0}
+
+        def dilate(image):
+            # Overlapping cells expand in separate passes, where the cells expanded
+            # in the other passes are not background and stop the expansion
+            others = self.get_cells_mask(cells - set(np.unique(image).tolist()))
+            blocked = others & (image == 0)
+            barrier = image.max() + 1
+            image = np.where(blocked, barrier, image)
+            expanded = expand_labels(image, radius)
+            self.add_cells(expanded, (expanded != image) & (expanded != barrier))
+
+        self.edit_cells(cells, dilate)
+
+    def action_fill_holes(self, cells=None):
+        """
+        Fills the holes in every cell (or each cell in cells).
+        A hole is an area without the cells that one cell surrounds.
+
+        Args:
+            cells (list): cells to fill, or None for all cells
+        """
+
+        def fill(image):
+            # Pixels of the cells not in this pass are not holes and are not
+            # the cell that surrounds a hole
+            barrier = image.max() + 1
+            image = np.where((image == 0) & (self.labels != 0), barrier, image)
+            regions, count = ndimage.label(image == 0)
+            # Find the smallest and largest cell next to each region
+            low = np.full(count + 1, np.iinfo(np.int32).max, dtype=np.int32)
+            high = np.zeros(count + 1, dtype=np.int32)
+            for region, cell in [
+                (regions[1:], image[:-1]),
+                (regions[:-1], image[1:]),
+                (regions[:, 1:], image[:, :-1]),
+                (regions[:, :-1], image[:, 1:]),
+            ]:
+                border = (region != 0) & (cell != 0)
+                np.minimum.at(low, region[border], cell[border])
+                np.maximum.at(high, region[border], cell[border])
+            holes = np.where((low == high) & (high != barrier), high, 0)
+            # Regions on the edges are not surrounded
+            holes[0] = 0
+            for edge in [regions[0], regions[-1], regions[:, 0], regions[:, -1]]:
+                holes[edge] = 0
+            filled = holes[regions]
+            self.add_cells(filled, filled != 0)
+
+        self.edit_cells(cells, fill)
+
+    def action_remove_small_objects(self, min_size, cells=None):
+        """
+        Removes the connected parts of every cell (or each cell in cells)
+        with fewer than min_size pixels.
+
+        Args:
+            min_size (int): fewest pixels in the parts to keep
+            cells (list): cells to clean up, or None for all cells
+        """
+
+        def remove(image):
+            components = skimage.measure.label(image, background=0, connectivity=2)
+            small = np.bincount(components.ravel()) < min_size
+            small[0] = False
+            self.remove_cells(image, small[components])
+
+        self.edit_cells(cells, remove)
+
+
+class BatchEdit(Edit):
+    """
+    Loads labeled data from a zip file,
+    applies a sequence of edits from edit.json to the same labels,
+    and writes the edited labels to a new zip file.
+
+    The labels zipfile has the same contents as for Edit,
+    except that edit.json has an actions list instead of a single action:
+        edit.json - a json object including
+                    - height: the height of the labeled (and raw) arrays
+                    - width: the width of the labeled (and raw) arrays
+                    - actions: list of objects with action, args, and writeMode
+                               to apply in order
+
+    The response zip additionally contains batch.json with the time for each
+    completed action and the error that stopped the batch, if any.
+    The batch applies the actions before the first failed action,
+    undoes any changes from the failed action, and skips the actions after it.
+    The response and the cached frame both have the labels from the applied actions.
+    """
+
+    def load_edit(self, edit):
+        """
+        Load the list of actions to dispatch from edit.json.
+
+        Args:
+            edit (dict): contents of edit.json
+        """
+        if 'actions' not in edit or not isinstance(edit['actions'], list):
+            raise ValueError('No actions list specified in edit.json.')
+        self.actions = []
+        for action in edit['actions']:
+            if 'action' not in action:
+                raise ValueError('No action specified in edit.json actions.')
+            self.actions.append(
+                {
+                    'action': action['action'],
+                    'args': action.get('args', None),
+                    'writeMode': self.check_write_mode(
+                        action.get('writeMode', 'overlap')
+                    ),
+                }
+            )
+
+    def get_actions(self):
+        """Returns the names of the actions in the edit."""
+        return [action['action'] for action in self.actions]
+
+    def dispatch_action(self):
+        """
+        Call each action in order until an action raises an error,
+        and undo the changes of the action that raised.
+        """
+        self.timings = []
+        self.error = None
+        for i, action in enumerate(self.actions):
+            self.action = action['action']
+            self.args = action['args']
+            self.write_mode = action['writeMode']
+            self.report = {}
+            start = timeit.default_timer()
+            checkpoint = self.checkpoint()
+            try:
+                super().dispatch_action()
+            except Exception as error:  # pylint: disable=W0703
+                self.rollback(checkpoint)
+                self.error = {
+                    'index': i,
+                    'action': self.action,
+                    'message': str(error),
+                }
+                break
+            self.commit(checkpoint)
+            self.timings.append(
+                {
+                    'action': self.action,
+                    'writeMode': self.write_mode,
+                    'time': timeit.default_timer() - start,
+                    'report': self.report,
+                }
+            )
+        # Each action's report is in batch.json
+        self.report = {}
+
+    def encode_response(self):
+        """Adds the batch report to the edited labels and cells for the response zip."""
+        members = super().encode_response()
+        members['batch.json'] = json.dumps(
+            {'actions': self.timings, 'error': self.error}
+        )
+        return members
+
+
+class FrameEdit(Edit):
+    """
+    Edits one frame of a StackEdit from arrays instead of a zip file.
+    """
+
+    def __init__(self, labels, cells, raw, edit):
+        """
+        Args:
+            labels: writable labeled frame (int32) with shape (height, width) to edit in place
+            cells: list of cells in the frame
+            raw: raw frame (uint8) with shape (height, width) or None
+            edit (dict): action, args, and writeMode to apply to the frame
+        """
+        self.frame = {'labels': labels, 'cells': cells, 'raw': raw}
+        self.edit = edit
+        super().__init__(labels_zip=None)
+
+    def load(self, labels_zip):
+        """Loads the frame passed to the constructor."""
+        self.height, self.width = self.frame['labels'].shape
+        self.load_edit(self.edit)
+        self.labels = self.frame['labels']
+        self.cells = list(self.frame['cells'])
+        self.raw = self.frame['raw']
+        if self.raw is None and self.action in self.raw_required:
+            raise ValueError(
+                f'Include raw array in raw.dat to use action {self.action}.'
+            )
+
+    def write_response_zip(self):
+        """Removes cells that are not in the segmentation instead of writing a zip."""
+        self.cells = [c for c in self.cells if c['value'] in self.value_counts]
+
+    @property
+    def changed(self):
+        """Whether the edit changed the labels or the cells of the frame."""
+        if self.changed_bbox is not None and not np.array_equal(
+            crop(self.labels, self.changed_bbox), self.initial_patch
+        ):
+            return True
+        initial_pairs = set((c['value'], c['cell']) for c in self.initial_cells)
+        return initial_pairs != set((c['value'], c['cell']) for c in self.cells)
+
+
+class StackEdit(object):
+    """
+    Loads a stack of labeled frames from a zip file,
+    applies the edit in edit.json to each frame in a range of the stack,
+    and writes the changed frames to a new zip file.
+
+    The labels zipfile must contain:
+        labeled.dat - a binary array buffer of the labeled frames (int32)
+                      with shape (frames, height, width)
+        cells.json - a list of cells like { "cell": 1, "value": 1, "t": 0 }
+                     where t is the index of the frame in labeled.dat
+        edit.json - a json object like for Edit with
+                    - frames: the number of frames in labeled.dat (and raw.dat)
+                    - start, stop (optional): the range of frames to edit
+    It additionally may contain:
+        raw.dat - a binary array buffer of the raw frames (uint8)
+
+    The frames can be the times of a timelapse or the z slices of a volume.
+    Frames are edited in parallel in a thread pool.
+    """
+
+    def __init__(self, labels_zip):
+        self.codec = Codec(EDIT_COMPRESSION, EDIT_COMPRESSION_LEVEL)
+        # The stack edit does not cache its frames
+        self.version = None
+        self.load(labels_zip)
+        with timed('action'):
+            self.dispatch_action()
+        self.write_response_zip()
+
+    def load(self, labels_zip):
+        """
+        Load the stack of frames to edit from a zip file.
+        """
+        with timed('unzip'):
+            if not zipfile.is_zipfile(labels_zip):
+                raise ValueError('Attached labels.zip is not a zip file.')
+            zf = zipfile.ZipFile(labels_zip)
+            if 'edit.json' not in zf.namelist():
+                raise ValueError('Attached labels.zip must contain edit.json.')
+            edit_data = zf.read('edit.json')
+
+        with timed('decode'):
+            edit = json.loads(edit_data)
+            if 'action' not in edit:
+                raise ValueError('No action specified in edit.json.')
+            self.action = edit['action']
+            self.edit = {
+                'action': edit['action'],
+                'args': edit.get('args', None),
+                'writeMode': edit.get('writeMode', 'overlap'),
+            }
+            if 'compression' in edit:
+                self.codec = Codec(edit['compression'], edit.get('compressionLevel'))
+            shape = (edit['frames'], edit['height'], edit['width'])
+            self.start = edit.get('start', 0)
+            self.stop = edit.get('stop', shape[0])
+            if not 0 <= self.start <= self.stop <= shape[0]:
+                raise ValueError(
+                    f'Invalid frames from {self.start} to {self.stop} in edit.json '
+                    f'for {shape[0]} frames.'
+                )
+
+        # Decompress the frames straight into the array that the frame edits change in place
+        if not has_member(zf, 'labeled.dat'):
+            raise ValueError('zip must contain labeled.dat.')
+        self.raw = None
+        with timed('unzip'):
+            self.labels = read_array(zf, 'labeled.dat', shape, np.int32)
+            if not has_member(zf, 'cells.json'):
+                raise ValueError('zip must contain cells.json.')
+            cells_data = read_member(zf, 'cells.json')
+            if has_member(zf, 'raw.dat'):
+                self.raw = read_array(zf, 'raw.dat', shape, np.uint8)
+        with timed('decode'):
+            self.frame_cells = {}
+            for cell in json.loads(cells_data):
+                self.frame_cells.setdefault(cell.get('t', 0), []).append(cell)
+
+    def edit_frame(self, t):
+        """Applies the edit to the frame at index t and returns the FrameEdit."""
+        raw = None if self.raw is None else self.raw[t]
+        return FrameEdit(self.labels[t], self.frame_cells.get(t, []), raw, self.edit)
+
+    def dispatch_action(self):
+        """Edits each frame in the range, in parallel when there are several CPUs."""
+        frames = list(range(self.start, self.stop))
+        workers = min(len(frames), os.cpu_count() or 1)
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                edits = list(executor.map(self.edit_frame, frames))
+        else:
+            edits = [self.edit_frame(t) for t in frames]
+        self.changed = [(t, edit) for t, edit in zip(frames, edits) if edit.changed]
+
+    def write_response_zip(self):
+        """
+        Writes the changed frames to a zip with
+            labeled.dat - the changed frames (int32) with shape (changed frames, height, width)
+            cells.json - the cells in the changed frames with their t
+            frames.json - the index in the stack of each frame in labeled.dat
+            report.json - (if any action reported details) a list of t and report
+        """
+        with timed('encode'):
+            members = {
+                'labeled.dat': b''.join(
+                    edit.labels.tobytes() for _, edit in self.changed
+                ),
+                'cells.json': json.dumps(
+                    [dict(c, t=t) for t, edit in self.changed for c in edit.cells]
+                ),
+                'frames.json': json.dumps([t for t, _ in self.changed]),
+            }
+            reports = [
+                {'t': t, 'report': edit.report}
+                for t, edit in self.changed
+                if edit.report
+            ]
+            if reports:
+                members['report.json'] = json.dumps(reports)
+        f = io.BytesIO()
+        with zipfile.ZipFile(f, 'w') as zf:
+            for name, data in members.items():
+                self.codec.write(zf, name, data)
+        f.seek(0)
+        self.response_zip = f
@@ -1,9 +1,17 @@
 """Test for File classes"""
 
+import io
+import json
+import zipfile
+
 import numpy as np
 import pytest
+from skimage.segmentation import morphological_chan_vese
 
-from deepcell_label.label import Edit
+from deepcell_label.cache import frame_cache, raw_cache
+from deepcell_label.compression import read_member
+from deepcell_label.conftest import make_edit_zip
+from deepcell_label.label import BatchEdit, Edit, FrameCacheMiss, StackEdit, contour
 
 
 # Automatically enable transactions for all tests, without importing any extra fixtures.
@@ -35,6 +43,19 @@ class DummyEdit(Edit):
         pass
 
 
+def load_response_zip(edit):
+    """Returns the labels, cells, and other files in the response zip of an edit."""
+    zf = zipfile.ZipFile(edit.response_zip)
+    labels = np.frombuffer(zf.read('labeled.dat'), np.int32)
+    labels = labels.reshape((edit.height, edit.width))
+    files = {
+        name: json.loads(zf.read(name))
+        for name in zf.namelist()
+        if name.endswith('.json')
+    }
+    return labels, files
+
+
 def cells_equal(a, b):
     for cell in a:
         if cell not in b:
@@ -94,6 +115,49 @@ class TestEdit:
             )
             np.testing.assert_array_equal(edit.labels, expected_labels)
 
+    def test_action_flood_reuses_components(self, app):
+        """Flooding again reuses the background components that the first flood did not change."""
+        labels = np.zeros((3, 5), dtype=np.int32)
+        labels[:, 2] = 1
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        expected_labels = np.array([[2, 2, 1, 3, 3]] * 3, dtype=np.int32)
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='flood',
+                args={'foreground': 2, 'background': 0, 'x': 0, 'y': 0},
+            )
+            components = edit.components[(0, 1)]
+            np.testing.assert_array_equal(components['valid'], [False, True])
+            edit.action_flood(3, 0, 4, 0)
+            assert edit.components[(0, 1)] is components
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+
+    def test_action_trim_pixels(self, app):
+        """Trimming keeps only the component of the cell at (x, y)."""
+        # fmt: off
+        labels = np.array([
+            [1, 0, 1],
+            [0, 0, 1],
+            [1, 1, 0],
+        ], dtype=np.int32)
+        expected_labels = np.array([
+            [0, 0, 1],
+            [0, 0, 1],
+            [1, 1, 0],
+        ], dtype=np.int32)
+        # fmt: on
+        cells = [{'cell': 1, 'value': 1}]
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='trim_pixels',
+                args={'cell': 1, 'x': 2, 'y': 0},
+            )
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+
     def test_action_draw_remove_label(self, app):
         """Erasing a label with by drawing over it."""
         labels = np.array([[1]], dtype=np.int32)
@@ -183,6 +247,36 @@ class TestEdit:
                 raw=raw,
             )
             assert int((edit.labels == 1).sum()) < int((initial_labels == 1).sum())
+            # Stops once the contour stops changing
+            assert 2 <= edit.report['iterations'] < 100
+
+    def test_contour_stops_when_converged(self):
+        """Stops early with the same level set as running every iteration."""
+        image = np.zeros((20, 20))
+        image[5:15, 5:15] = 1
+        init_level_set = np.zeros((20, 20), dtype=bool)
+        init_level_set[8:12, 8:12] = True
+
+        level_sets = []
+        expected = morphological_chan_vese(
+            image,
+            100,
+            init_level_set=init_level_set,
+            iter_callback=lambda level_set: level_sets.append(level_set.copy()),
+        )
+        # The first iteration that leaves the level set unchanged twice in a row
+        expected_iterations = next(
+            i
+            for i in range(2, len(level_sets))
+            if np.array_equal(level_sets[i], level_sets[i - 1])
+            and np.array_equal(level_sets[i], level_sets[i - 2])
+        )
+        level_set, iterations = contour(image, init_level_set, 100)
+        assert iterations == expected_iterations < 100
+        np.testing.assert_array_equal(level_set, expected)
+
+        level_set, iterations = contour(image, init_level_set, 1)
+        assert iterations == 1
 
     def test_action_erode_delete_label(self, app):
         """Tests that a label is correctly removed when eroding deletes all of its pixels."""
@@ -268,6 +362,141 @@ class TestEdit:
             )
             np.testing.assert_array_equal(expected_labels, edit.labels)
 
+    def test_action_erode_all(self, app):
+        """Eroding all cells shrinks each cell away from the other cells."""
+        labels = np.zeros((5, 7), dtype=np.int32)
+        labels[1:4, 0:3] = 1
+        labels[1:4, 3:7] = 2
+        expected_labels = np.zeros((5, 7), dtype=np.int32)
+        # Cells do not erode at the edges of the frame
+        expected_labels[2, 0:2] = 1
+        expected_labels[2, 4:7] = 2
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels, cells=cells, action='erode_all', args={'radius': 1}
+            )
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+
+    def test_action_erode_all_overlapping(self, app):
+        """Eroding overlapping cells erodes each cell separately."""
+        labels = np.zeros((5, 5), dtype=np.int32)
+        labels[1:4, 1:4] = 3
+        cells = [
+            {'cell': 1, 'value': 1},
+            {'cell': 2, 'value': 2},
+            {'cell': 1, 'value': 3},
+            {'cell': 2, 'value': 3},
+        ]
+        expected_labels = np.zeros((5, 5), dtype=np.int32)
+        expected_labels[2, 2] = 3
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels, cells=cells, action='erode_all', args={'radius': 1}
+            )
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+
+    @pytest.mark.parametrize(
+        'write_mode, expected',
+        [('overlap', [2, 3]), ('overwrite', [2]), ('exclude', [3])],
+    )
+    def test_action_dilate_all(self, app, write_mode, expected):
+        """Dilating some cells splits the background between them and honors the write mode."""
+        labels = np.array([[1, 0, 0, 0, 2, 3, 0]], dtype=np.int32)
+        cells = [
+            {'cell': 1, 'value': 1},
+            {'cell': 2, 'value': 2},
+            {'cell': 3, 'value': 3},
+        ]
+        expected_labels = np.array([[1, 1, 0, 2, 2]], dtype=np.int32)
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='dilate_all',
+                args={'radius': 1, 'cells': [1, 2]},
+                write_mode=write_mode,
+            )
+            np.testing.assert_array_equal(edit.labels[:, :5], expected_labels)
+            assert sorted(edit.get_cells(edit.labels[0, 5])) == expected
+            assert edit.labels[0, 6] == 0
+
+    def test_action_dilate_all_overlapping(self, app):
+        """Overlapping cells dilate in separate passes without growing into each other."""
+        labels = np.array([[0, 1, 1, 2, 2, 0, 0, 3]], dtype=np.int32)
+        cells = [
+            {'cell': 1, 'value': 1},
+            {'cell': 2, 'value': 2},
+            {'cell': 1, 'value': 3},
+            {'cell': 2, 'value': 3},
+        ]
+        expected_cells = [[1], [1], [1], [2], [2], [2], [1], [1, 2]]
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels, cells=cells, action='dilate_all', args={'radius': 1}
+            )
+            actual_cells = [sorted(edit.get_cells(value)) for value in edit.labels[0]]
+            assert actual_cells == expected_cells
+
+    def test_action_fill_holes(self, app):
+        """Fills the areas that a single cell surrounds."""
+        # fmt: off
+        labels = np.array([
+            [1, 1, 1, 2, 2, 2],
+            [1, 0, 1, 2, 0, 0],
+            [1, 1, 1, 2, 2, 2],
+        ], dtype=np.int32)
+        expected_labels = np.array([
+            [1, 1, 1, 2, 2, 2],
+            [1, 1, 1, 2, 0, 0],
+            [1, 1, 1, 2, 2, 2],
+        ], dtype=np.int32)
+        # fmt: on
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        with app.app_context():
+            edit = DummyEdit(labels=labels, cells=cells, action='fill_holes', args={})
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+
+    def test_action_fill_holes_nested_cell(self, app):
+        """Does not fill over an unselected cell inside a selected cell."""
+        # fmt: off
+        labels = np.array([
+            [1, 1, 1, 1, 1],
+            [1, 2, 1, 0, 1],
+            [1, 1, 1, 1, 1],
+        ], dtype=np.int32)
+        expected_labels = np.array([
+            [1, 1, 1, 1, 1],
+            [1, 2, 1, 1, 1],
+            [1, 1, 1, 1, 1],
+        ], dtype=np.int32)
+        # fmt: on
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='fill_holes',
+                args={'cells': [1]},
+                write_mode='overwrite',
+            )
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+            assert {'cell': 2, 'value': 2} in edit.cells
+
+    def test_action_remove_small_objects(self, app):
+        """Removes the parts of the cells smaller than min_size."""
+        labels = np.array([[1, 1, 0, 1, 2, 0, 2, 2]], dtype=np.int32)
+        expected_labels = np.array([[1, 1, 0, 0, 0, 0, 2, 2]], dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='remove_small_objects',
+                args={'min_size': 2},
+            )
+            np.testing.assert_array_equal(edit.labels, expected_labels)
+
     def test_clean_labels(self, app):
         """Tests that labels are properly removed for values with no corresponding cell."""
         labels = np.array([[1, 1], [2, 2]], dtype=np.int32)
@@ -283,3 +512,614 @@ class TestEdit:
                 write_mode='exclude',
             )
             np.testing.assert_array_equal(edit.labels, expected_labels)
+
+    def test_get_value_existing_overlap(self, app):
+        """Finds the value that encodes a set of overlapping cells."""
+        labels = np.array([[1, 2, 3]], dtype=np.int32)
+        cells = [
+            {'cell': 1, 'value': 1},
+            {'cell': 2, 'value': 2},
+            {'cell': 1, 'value': 3},
+            {'cell': 2, 'value': 3},
+        ]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='draw',
+                args={'trace': '[]', 'brush_size': 1, 'cell': 1},
+            )
+            assert edit.get_value([2, 1]) == 3
+            assert edit.get_value([]) == 0
+            assert sorted(edit.get_values(1)) == [1, 3]
+            assert sorted(edit.get_cells(3)) == [1, 2]
+
+    def test_get_value_new_overlap(self, app):
+        """Mints and indexes a new value for a new set of cells."""
+        labels = np.array([[1, 2]], dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='draw',
+                args={'trace': '[]', 'brush_size': 1, 'cell': 1},
+            )
+            value = edit.get_value([1, 2])
+            assert value == 3
+            assert edit.get_value([1, 2]) == value
+            assert sorted(edit.get_values(2)) == [2, 3]
+            assert edit.new_value == 4
+            assert edit.new_cell == 3
+            assert {'cell': 1, 'value': 3} in edit.cells
+            assert {'cell': 2, 'value': 3} in edit.cells
+
+    def test_get_bbox(self, app):
+        """Finds the bounding box of a cell encoded by several values."""
+        labels = np.zeros((5, 6), dtype=np.int32)
+        labels[1, 1] = 1
+        labels[3, 4] = 2
+        cells = [{'cell': 1, 'value': 1}, {'cell': 1, 'value': 2}]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='draw',
+                args={'trace': '[]', 'brush_size': 1, 'cell': 1},
+            )
+            assert edit.get_bbox(1) == (1, 1, 4, 5)
+            assert edit.get_bbox(2) is None
+
+    def test_action_watershed(self, app):
+        """Watershed splits a cell between two seeds."""
+        labels = np.zeros((5, 10), dtype=np.int32)
+        labels[1:4, 1:9] = 1
+        raw = np.zeros((5, 10), dtype=np.uint8)
+        raw[1:4, 1:4] = 200
+        raw[1:4, 6:9] = 200
+        cells = [{'cell': 1, 'value': 1}]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='watershed',
+                args={'cell': 1, 'new_cell': 2, 'x1': 2, 'y1': 2, 'x2': 7, 'y2': 2},
+                raw=raw,
+            )
+            assert edit.labels[2, 2] == edit.get_value([1])
+            assert edit.labels[2, 7] == edit.get_value([2])
+            assert np.all((edit.labels != 0) == (labels != 0))
+
+    def test_action_watershed_many(self, app):
+        """Watershed splits a cell into a cell for each seed in one pass."""
+        labels = np.zeros((5, 15), dtype=np.int32)
+        labels[1:4, 1:14] = 1
+        raw = np.zeros((5, 15), dtype=np.uint8)
+        raw[1:4, 1:4] = 200
+        raw[1:4, 6:9] = 200
+        raw[1:4, 11:14] = 200
+        cells = [{'cell': 1, 'value': 1}]
+        seeds = [
+            {'x': 2, 'y': 2, 'cell': 1},
+            {'x': 7, 'y': 2, 'cell': 2},
+            {'x': 12, 'y': 2, 'cell': 3},
+            # Outside of the cell
+            {'x': 0, 'y': 0, 'cell': 4},
+        ]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='watershed_many',
+                args={'cell': 1, 'seeds': seeds},
+                raw=raw,
+            )
+            assert edit.labels[2, 2] == edit.get_value([1])
+            assert edit.labels[2, 7] == edit.get_value([2])
+            assert edit.labels[2, 12] == edit.get_value([3])
+            assert edit.get_values(4) == []
+            assert np.all((edit.labels != 0) == (labels != 0))
+
+    def test_get_elevation(self, app):
+        """Elevation for watershed is lowest at the brightest pixels and highest at the darkest."""
+        labels = np.zeros((1, 4), dtype=np.int32)
+        raw = np.array([[0, 1, 128, 255]], dtype=np.uint8)
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=[],
+                action='draw',
+                args={'trace': '[]', 'brush_size': 1, 'cell': 1},
+                raw=raw,
+            )
+            elevation = edit.get_elevation()
+            assert np.all(np.diff(elevation) < 0)
+
+    @pytest.mark.parametrize('cpu_count', [1, 4])
+    def test_action_threshold_many(self, app, mocker, cpu_count):
+        """Thresholds each box into its cell."""
+        mocker.patch('os.cpu_count', return_value=cpu_count)
+        labels = np.zeros((10, 20), dtype=np.int32)
+        raw = np.zeros((10, 20), dtype=np.uint8)
+        raw[2:5, 2:5] = 200
+        raw[4:7, 14:18] = 150
+        boxes = [
+            {'x1': 0, 'y1': 0, 'x2': 7, 'y2': 7, 'cell': 1},
+            # Corners in either order and past the edge of the frame
+            {'x1': 25, 'y1': 9, 'x2': 12, 'y2': 2, 'cell': 2},
+        ]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=[],
+                action='threshold_many',
+                args={'boxes': boxes},
+                raw=raw,
+            )
+            expected = np.zeros((10, 20), dtype=np.int32)
+            expected[2:5, 2:5] = edit.get_value([1])
+            expected[4:7, 14:18] = edit.get_value([2])
+            np.testing.assert_array_equal(edit.labels, expected)
+
+    def test_overlap_mask_rewrites_each_value(self, app):
+        """Overlapping a cell over several values rewrites each value once."""
+        labels = np.array([[0, 1, 2, 3]], dtype=np.int32)
+        cells = [
+            {'cell': 1, 'value': 1},
+            {'cell': 2, 'value': 2},
+            {'cell': 1, 'value': 3},
+            {'cell': 2, 'value': 3},
+        ]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='draw',
+                args={'trace': '[]', 'brush_size': 1, 'cell': 1},
+            )
+            edit.overlap_mask(np.ones((1, 4), dtype=bool), 2)
+            np.testing.assert_array_equal(edit.labels, [[2, 3, 2, 3]])
+            edit.overlap_mask(np.ones((1, 4), dtype=bool), 2, remove=True)
+            np.testing.assert_array_equal(edit.labels, [[0, 1, 0, 1]])
+
+    def test_value_counts(self, app):
+        """Counts the pixels of each value after removing deleted values and editing."""
+        labels = np.array([[0, 1, 2, 3]], dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='draw',
+                args={'trace': '[]', 'brush_size': 1, 'cell': 1},
+            )
+            # Value 3 is not in cells
+            assert edit.value_counts == {0: 2, 1: 1, 2: 1}
+            edit.overlap_mask(np.array([[True, True, False, False]]), 2)
+            assert edit.value_counts == {0: 1, 2: 2, edit.max_value: 1}
+            edit.remove_mask(np.ones((1, 4), dtype=bool), 2)
+            assert edit.value_counts == {0: 3, 1: 1}
+
+    def test_action_draw_fills_gaps(self, app):
+        """Drawing connects the points in the trace."""
+        labels = np.zeros((3, 5), dtype=np.int32)
+        expected = np.array(
+            [[0, 0, 0, 0, 0], [1, 1, 1, 1, 1], [0, 0, 0, 0, 0]], dtype=np.int32
+        )
+        cells = [{'cell': 1, 'value': 1}]
+
+        with app.app_context():
+            edit = DummyEdit(
+                labels=labels,
+                cells=cells,
+                action='draw',
+                args={'trace': '[[0, 1], [4, 1]]', 'brush_size': 1, 'cell': 1},
+            )
+            np.testing.assert_array_equal(edit.labels, expected)
+
+    def test_patch_response(self, app):
+        """Responds with only the changed pixels and cells."""
+        labels = np.zeros((10, 10), dtype=np.int32)
+        labels[2, 3] = 1
+        labels[8, 8] = 2
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        edit = {
+            'height': 10,
+            'width': 10,
+            'action': 'dilate',
+            'args': {'cell': 1},
+            'writeMode': 'overwrite',
+            'responseFormat': 'patch',
+        }
+
+        with app.app_context():
+            edit = Edit(make_edit_zip(edit, labels, cells))
+            zf = zipfile.ZipFile(edit.response_zip)
+            assert 'labeled.dat' not in zf.namelist()
+            patch = json.loads(zf.read('patch.json'))
+            assert patch['bbox'] == [1, 2, 4, 5]
+            np.testing.assert_array_equal(
+                np.frombuffer(zf.read('patch.dat'), np.int32).reshape((3, 3)),
+                np.ones((3, 3)),
+            )
+            assert patch['added'] == []
+            assert patch['removed'] == []
+
+    def test_patch_response_removed_cell(self, app):
+        """Lists cells that are no longer in the labels as removed."""
+        labels = np.array([[1, 0, 2]], dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1, 't': 0}, {'cell': 2, 'value': 2, 't': 0}]
+        edit = {
+            'height': 1,
+            'width': 3,
+            'action': 'erode',
+            'args': {'cell': 2},
+            'responseFormat': 'patch',
+        }
+
+        with app.app_context():
+            edit = Edit(make_edit_zip(edit, labels, cells))
+            zf = zipfile.ZipFile(edit.response_zip)
+            patch = json.loads(zf.read('patch.json'))
+            assert patch['bbox'] == [0, 2, 1, 3]
+            assert np.frombuffer(zf.read('patch.dat'), np.int32).tolist() == [0]
+            assert patch['removed'] == [{'cell': 2, 'value': 2, 't': 0}]
+
+    def test_patch_response_after_several_edits(self, app):
+        """Compares with the labels before the first edit that changed each pixel."""
+        labels = np.zeros((10, 10), dtype=np.int32)
+        labels[2, 3] = 1
+        labels[8, 8] = 2
+        cells = [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}]
+        edit = {
+            'height': 10,
+            'width': 10,
+            'actions': [
+                {'action': 'dilate', 'args': {'cell': 1}},
+                {'action': 'dilate', 'args': {'cell': 2}},
+                {'action': 'erode', 'args': {'cell': 1}},
+            ],
+            'responseFormat': 'patch',
+        }
+
+        with app.app_context():
+            edit = BatchEdit(make_edit_zip(edit, labels, cells))
+            zf = zipfile.ZipFile(edit.response_zip)
+            patch = json.loads(zf.read('patch.json'))
+            # Cell 1 is back to its initial pixel
+            assert patch['bbox'] == [7, 7, 10, 10]
+            np.testing.assert_array_equal(
+                np.frombuffer(zf.read('patch.dat'), np.int32).reshape((3, 3)),
+                np.full((3, 3), 2),
+            )
+
+    def test_zstd_response(self, app):
+        """Compresses the response with the codec in edit.json."""
+        labels = np.array([[1, 0]], dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {
+            'height': 1,
+            'width': 2,
+            'action': 'dilate',
+            'args': {'cell': 1},
+            'compression': 'zstd',
+        }
+
+        with app.app_context():
+            edit = Edit(make_edit_zip(edit, labels, cells))
+            zf = zipfile.ZipFile(edit.response_zip)
+            assert zf.namelist() == ['labeled.dat.zst', 'cells.json.zst']
+            edited = np.frombuffer(read_member(zf, 'labeled.dat'), np.int32)
+            np.testing.assert_array_equal(edited, [1, 1])
+            assert json.loads(read_member(zf, 'cells.json')) == cells
+
+    def test_cached_frame(self, app):
+        """Edits the cached frame when the zip only has edit.json."""
+        labels = np.zeros((5, 5), dtype=np.int32)
+        labels[2, 2] = 1
+        cells = [{'cell': 1, 'value': 1, 't': 0, 'c': 0}]
+        edit = {
+            'height': 5,
+            'width': 5,
+            'action': 'dilate',
+            'args': {'cell': 1},
+            'project': 'test_cached_frame',
+        }
+
+        with app.app_context():
+            first = Edit(make_edit_zip(edit, labels, cells))
+            assert first.version is not None
+
+            f = io.BytesIO()
+            with zipfile.ZipFile(f, 'w') as zf:
+                zf.writestr('edit.json', json.dumps({**edit, 'version': first.version}))
+            f.seek(0)
+            second = Edit(f)
+            edited, files = load_response_zip(second)
+            # Dilated twice
+            np.testing.assert_array_equal(edited, np.ones((5, 5)))
+            assert files['cells.json'] == cells
+            assert second.version != first.version
+
+            # The first version was replaced by the second
+            f.seek(0)
+            with pytest.raises(FrameCacheMiss):
+                Edit(f)
+
+    def test_cached_frame_failed_edit(self, app, mocker):
+        """Puts the cached frame back unchanged when an edit fails partway."""
+        labels = np.zeros((5, 5), dtype=np.int32)
+        labels[2, 2] = 1
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {
+            'height': 5,
+            'width': 5,
+            'action': 'dilate',
+            'args': {'cell': 1},
+            'project': 'test_cached_frame_failed_edit',
+        }
+        action_dilate = Edit.action_dilate
+
+        def fail(self, *args, **kwargs):
+            action_dilate(self, *args, **kwargs)
+            raise ValueError('failed after editing')
+
+        with app.app_context():
+            first = Edit(make_edit_zip(edit, labels, cells))
+            key = ('test_cached_frame_failed_edit', 0, 0)
+            cached = frame_cache.get(key)['labels'].copy()
+
+            f = io.BytesIO()
+            with zipfile.ZipFile(f, 'w') as zf:
+                zf.writestr('edit.json', json.dumps({**edit, 'version': first.version}))
+            f.seek(0)
+            patch = mocker.patch.object(
+                Edit, 'action_dilate', autospec=True, side_effect=fail
+            )
+            with pytest.raises(ValueError, match='failed after editing'):
+                Edit(f)
+            frame = frame_cache.get(key)
+            assert frame['version'] == first.version
+            np.testing.assert_array_equal(frame['labels'], cached)
+            assert frame['cells'] == cells
+            assert frame['counts'] == {0: 16, 1: 9}
+
+            mocker.stop(patch)
+            f.seek(0)
+            edited, _ = load_response_zip(Edit(f))
+            np.testing.assert_array_equal(edited, np.ones((5, 5)))
+
+    def test_cached_raw(self, app):
+        """Loads the raw frame from the raw cache when the zip does not have raw.dat."""
+        key = ('test_cached_raw', 0, 0)
+        raw = np.array([[255] * 6 + [0] + [255] * 6], dtype=np.uint8)
+        raw_cache.put(key, {'raw': raw, 'elevation': None}, raw.nbytes)
+        labels = np.ones((1, 13), dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {
+            'height': 1,
+            'width': 13,
+            'action': 'watershed',
+            'args': {'cell': 1, 'new_cell': 2, 'x1': 0, 'y1': 0, 'x2': 12, 'y2': 0},
+            'project': 'test_cached_raw',
+        }
+
+        with app.app_context():
+            edit = Edit(make_edit_zip(edit, labels, cells))
+            np.testing.assert_array_equal(edit.raw, raw)
+            assert edit.labels[0, 0] != edit.labels[0, 12]
+            # Keeps the elevation for later watersheds
+            np.testing.assert_array_equal(
+                raw_cache.get(key)['elevation'], -raw.astype(np.float32)
+            )
+
+    def test_cached_frame_miss(self, app):
+        """Raises FrameCacheMiss when the frame is not cached."""
+        edit = {
+            'height': 1,
+            'width': 1,
+            'action': 'dilate',
+            'args': {'cell': 1},
+            'project': 'test_cached_frame_miss',
+            'version': 'missing',
+        }
+        f = io.BytesIO()
+        with zipfile.ZipFile(f, 'w') as zf:
+            zf.writestr('edit.json', json.dumps(edit))
+        f.seek(0)
+
+        with app.app_context():
+            with pytest.raises(FrameCacheMiss):
+                Edit(f)
+
+
+class TestBatchEdit:
+    def test_batch_edit(self, app):
+        """Applies each action in order to the same labels."""
+        labels = np.zeros((5, 6), dtype=np.int32)
+        labels[2, 2] = 1
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {
+            'height': 5,
+            'width': 6,
+            'actions': [
+                {'action': 'dilate', 'args': {'cell': 1}},
+                {
+                    'action': 'draw',
+                    'args': {'trace': '[[5, 0]]', 'brush_size': 1, 'cell': 2},
+                    'writeMode': 'exclude',
+                },
+                {'action': 'erode', 'args': {'cell': 1}},
+            ],
+        }
+        expected_labels = np.zeros((5, 6), dtype=np.int32)
+        expected_labels[2, 2] = 1
+        expected_labels[0, 5] = 2
+
+        with app.app_context():
+            edit = BatchEdit(make_edit_zip(edit, labels, cells))
+            labels, files = load_response_zip(edit)
+            np.testing.assert_array_equal(labels, expected_labels)
+            assert cells_equal(
+                files['cells.json'],
+                [{'cell': 1, 'value': 1}, {'cell': 2, 'value': 2}],
+            )
+            batch = files['batch.json']
+            assert [a['action'] for a in batch['actions']] == [
+                'dilate',
+                'draw',
+                'erode',
+            ]
+            assert batch['error'] is None
+
+    def test_batch_edit_stops_on_error(self, app):
+        """Stops at the first action that fails and keeps the earlier edits."""
+        labels = np.zeros((3, 3), dtype=np.int32)
+        labels[1, 1] = 1
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {
+            'height': 3,
+            'width': 3,
+            'actions': [
+                {'action': 'dilate', 'args': {'cell': 1}},
+                {'action': 'unknown', 'args': {}},
+                {'action': 'erode', 'args': {'cell': 1}},
+            ],
+        }
+
+        with app.app_context():
+            edit = BatchEdit(make_edit_zip(edit, labels, cells))
+            labels, files = load_response_zip(edit)
+            np.testing.assert_array_equal(labels, np.ones((3, 3)))
+            batch = files['batch.json']
+            assert len(batch['actions']) == 1
+            assert batch['error']['index'] == 1
+            assert batch['error']['action'] == 'unknown'
+
+    def test_batch_edit_undoes_failed_action(self, app, mocker):
+        """Undoes the changes of an action that fails partway and caches the earlier edits."""
+        labels = np.zeros((5, 5), dtype=np.int32)
+        labels[2, 2] = 1
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {
+            'height': 5,
+            'width': 5,
+            'actions': [
+                {'action': 'dilate', 'args': {'cell': 1}},
+                {'action': 'dilate', 'args': {'cell': 1}},
+            ],
+            'project': 'test_batch_edit_undoes_failed_action',
+        }
+        expected_labels = np.zeros((5, 5), dtype=np.int32)
+        expected_labels[1:4, 1:4] = 1
+        action_dilate = Edit.action_dilate
+        calls = []
+
+        def fail_second(self, *args, **kwargs):
+            action_dilate(self, *args, **kwargs)
+            calls.append(args)
+            if len(calls) == 2:
+                raise ValueError('failed after editing')
+
+        mocker.patch.object(
+            BatchEdit, 'action_dilate', autospec=True, side_effect=fail_second
+        )
+        with app.app_context():
+            edit = BatchEdit(make_edit_zip(edit, labels, cells))
+            edited, files = load_response_zip(edit)
+            np.testing.assert_array_equal(edited, expected_labels)
+            assert files['batch.json']['error']['index'] == 1
+            frame = frame_cache.get(('test_batch_edit_undoes_failed_action', 0, 0))
+            assert frame['version'] == edit.version
+            np.testing.assert_array_equal(frame['labels'], expected_labels)
+            assert frame['counts'] == {0: 16, 1: 9}
+
+    def test_batch_edit_requires_raw(self, app):
+        """Checks that raw is attached before applying any action."""
+        labels = np.zeros((2, 2), dtype=np.int32)
+        edit = {
+            'height': 2,
+            'width': 2,
+            'actions': [
+                {'action': 'dilate', 'args': {'cell': 1}},
+                {'action': 'active_contour', 'args': {'cell': 1}},
+            ],
+        }
+
+        with app.app_context():
+            with pytest.raises(ValueError):
+                BatchEdit(make_edit_zip(edit, labels, []))
+
+
+class TestStackEdit:
+    @pytest.mark.parametrize('cpu_count', [1, 4])
+    def test_stack_edit(self, app, mocker, cpu_count):
+        """Edits each frame in the range and responds with only the changed frames."""
+        mocker.patch('os.cpu_count', return_value=cpu_count)
+        labels = np.zeros((4, 3, 3), dtype=np.int32)
+        labels[:, 1, 1] = 1
+        labels[3] = 0
+        cells = [{'cell': 1, 'value': 1, 't': t} for t in range(3)]
+        edit = {
+            'height': 3,
+            'width': 3,
+            'frames': 4,
+            'start': 1,
+            'action': 'dilate',
+            'args': {'cell': 1},
+        }
+
+        with app.app_context():
+            edit = StackEdit(make_edit_zip(edit, labels, cells))
+            zf = zipfile.ZipFile(edit.response_zip)
+            # Frame 0 is not in the range and frame 3 does not have the cell
+            assert json.loads(zf.read('frames.json')) == [1, 2]
+            edited = np.frombuffer(zf.read('labeled.dat'), np.int32).reshape((2, 3, 3))
+            np.testing.assert_array_equal(edited, np.ones((2, 3, 3)))
+            assert cells_equal(
+                json.loads(zf.read('cells.json')),
+                [{'cell': 1, 'value': 1, 't': 1}, {'cell': 1, 'value': 1, 't': 2}],
+            )
+
+    def test_stack_edit_invalid_range(self, app):
+        """Raises an error for a range outside of the stack."""
+        labels = np.zeros((2, 1, 1), dtype=np.int32)
+        edit = {
+            'height': 1,
+            'width': 1,
+            'frames': 2,
+            'stop': 3,
+            'action': 'dilate',
+            'args': {'cell': 1},
+        }
+
+        with app.app_context():
+            with pytest.raises(ValueError):
+                StackEdit(make_edit_zip(edit, labels, []))
+
+    @pytest.mark.parametrize(
+        'shape',
+        [(100000, 100000), (-1, -2), (1.5, 2)],
+        ids=['huge', 'negative', 'float'],
+    )
+    def test_edit_invalid_shape(self, app, shape):
+        """Raises a ValueError for a shape that does not match labeled.dat before allocating it."""
+        labels = np.zeros((1, 2), dtype=np.int32)
+        cells = [{'cell': 1, 'value': 1}]
+        edit = {'height': shape[0], 'width': shape[1], 'action': 'dilate', 'args': {}}
+        stack_edit = {**edit, 'frames': 10**9, 'height': 1, 'width': 2}
+
+        with app.app_context():
+            with pytest.raises(ValueError):
+                Edit(make_edit_zip(edit, labels, cells))
+            with pytest.raises(ValueError):
+                StackEdit(make_edit_zip(stack_edit, labels, cells))
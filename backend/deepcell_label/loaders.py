@@ -4,33 +4,60 @@ Loads both raw image data and labels
 """
 
 import io
-import itertools
 import json
+import os
 import re
 import tarfile
-import tempfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree import ElementTree as ET
 
 import magic
 import numpy as np
 from PIL import Image
-from tifffile import TiffFile, TiffWriter
-
+from tifffile import TiffFile
+
+from deepcell_label.compression import ZIP_CODECS, Codec
+from deepcell_label.config import (
+    PROJECT_COMPRESSION,
+    PROJECT_COMPRESSION_LEVEL,
+    TIFF_DECODE_WORKERS,
+)
+from deepcell_label.metrics import timed
+from deepcell_label.tiffs import (
+    PROJECT_TIFF_CODECS,
+    default_image_codec,
+    default_label_codec,
+    spooled_file,
+    write_ome_tiff,
+)
 from deepcell_label.utils import convert_lineage, reshape
 
 
 class Loader:
     """
     Loads and writes data into a DeepCell Label project zip.
+
+    Use as a context manager to delete the project zip when done with it.
     """
 
-    def __init__(self, image_file=None, label_file=None, axes=None):
+    def __init__(
+        self,
+        image_file=None,
+        label_file=None,
+        axes=None,
+        codec=None,
+        image_codec=None,
+        label_codec=None,
+    ):
         """
         Args:
             image_file: file zip object containing a png, zip, tiff, or npz file
             label_file: file like object containing a zip
             axes: dimension order of the image data
+            codec: Codec to compress the project zip, defaults to PROJECT_COMPRESSION
+            image_codec: TiffCodec to write X.ome.tiff, defaults to TIFF_COMPRESSION
+            label_codec: TiffCodec to write y.ome.tiff, defaults to LABEL_TIFF_COMPRESSION
         """
         self.X = None
         self.y = None
@@ -44,25 +71,69 @@ class Loader:
         self.image_file = image_file
         self.label_file = label_file if label_file else image_file
         self.axes = axes
-
-        with tempfile.TemporaryFile() as project_file:
-            with zipfile.ZipFile(project_file, 'w', zipfile.ZIP_DEFLATED) as zip:
+        if codec is None:
+            codec = Codec(PROJECT_COMPRESSION, PROJECT_COMPRESSION_LEVEL, ZIP_CODECS)
+        self.codec = codec
+        if image_codec is None:
+            image_codec = default_image_codec(PROJECT_TIFF_CODECS)
+        if label_codec is None:
+            label_codec = default_label_codec(PROJECT_TIFF_CODECS)
+        self.image_codec = image_codec
+        self.label_codec = label_codec
+
+        # Kept open to upload the project without reading the whole zip into memory
+        self.project_file = spooled_file()
+        try:
+            with zipfile.ZipFile(self.project_file, 'w') as zip:
                 self.zip = zip
-                self.load()
-                self.write()
-            project_file.seek(0)
-            self.data = project_file.read()
+                with timed('decode'):
+                    self.load()
+                with timed('encode'):
+                    self.write()
+        except BaseException:
+            self.close()
+            raise
+        self.project_file.seek(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def data(self):
+        """Returns the contents of the project zip."""
+        self.project_file.seek(0)
+        data = self.project_file.read()
+        self.project_file.seek(0)
+        return data
+
+    def close(self):
+        """Deletes the project zip."""
+        self.project_file.close()
 
     def load(self):
-        """Loads data from input files."""
-        self.X = load_images(self.image_file, self.axes)
-        self.y = load_segmentation(self.label_file)
-        self.spots = load_spots(self.label_file)
-        self.divisions = load_divisions(self.label_file)
-        self.cellTypes = load_cellTypes(self.label_file)
-        self.cells = load_cells(self.label_file)
-        self.channels = load_channels(self.image_file)
-        self.embeddings = load_embeddings(self.label_file)
+        """Loads data from input files, opening each file once."""
+        images = Archive(self.image_file)
+        labels = (
+            images if self.label_file is self.image_file else Archive(self.label_file)
+        )
+        try:
+            self.X = load_images(images, self.axes)
+            self.channels = load_channels(images)
+            if labels is not images:
+                # Free the images before loading the labels
+                images.close()
+            self.y = load_segmentation(labels)
+            self.spots = load_spots(labels)
+            self.divisions = load_divisions(labels)
+            self.cellTypes = load_cellTypes(labels)
+            self.cells = load_cells(labels)
+            self.embeddings = load_embeddings(labels)
+        finally:
+            images.close()
+            labels.close()
 
         if self.y is None:
             shape = (*self.X.shape[:-1], 1)
@@ -89,18 +160,17 @@ class Loader:
         if X is not None:
             # Move channel axis
             X = np.moveaxis(X, -1, 1)
-            images = io.BytesIO()
             channels = []
             for i in range(len(self.channels)):
                 channels.append({'Name': self.channels[i]})
-            with TiffWriter(images, ome=True) as tif:
-                tif.write(
-                    X,
-                    compression='zlib',
-                    metadata={'axes': 'ZCYX', 'Pixels': {'Channel': channels}},
-                )
-            images.seek(0)
-            self.zip.writestr('X.ome.tiff', images.read())
+            write_ome_tiff(
+                self.zip,
+                'X.ome.tiff',
+                X,
+                {'axes': 'ZCYX', 'Pixels': {'Channel': channels}},
+                self.image_codec,
+                self.codec,
+            )
         # else:
         #     raise ValueError('No images found in files')
 
@@ -113,15 +183,13 @@ class Loader:
                 % (y.shape, self.X.shape)
             )
         # TODO: check if float vs int matters
-        y = y.astype(np.int32)
+        y = y.astype(np.int32, copy=False)
         # Move channel axis
         y = np.moveaxis(y, -1, 1)
 
-        segmentation = io.BytesIO()
-        with TiffWriter(segmentation, ome=True) as tif:
-            tif.write(y, compression='zlib', metadata={'axes': 'ZCYX'})
-        segmentation.seek(0)
-        self.zip.writestr('y.ome.tiff', segmentation.read())
+        write_ome_tiff(
+            self.zip, 'y.ome.tiff', y, {'axes': 'ZCYX'}, self.label_codec, self.codec
+        )
 
     def write_spots(self):
         """Writes spots to spots.csv in the output zip."""
@@ -129,19 +197,19 @@ class Loader:
             buffer = io.BytesIO()
             buffer.write(self.spots)
             buffer.seek(0)
-            self.zip.writestr('spots.csv', buffer.read())
+            self.codec.write(self.zip, 'spots.csv', buffer.read())
 
     def write_divisions(self):
         """Writes divisions to divisions.json in the output zip."""
-        self.zip.writestr('divisions.json', json.dumps(self.divisions))
+        self.codec.write(self.zip, 'divisions.json', json.dumps(self.divisions))
 
     def write_cellTypes(self):
         """Writes cell types to cellTypes.json in the output zip."""
-        self.zip.writestr('cellTypes.json', json.dumps(self.cellTypes))
+        self.codec.write(self.zip, 'cellTypes.json', json.dumps(self.cellTypes))
 
     def write_embeddings(self):
         """Writes embeddings to embeddings.json in the output zip."""
-        self.zip.writestr('embeddings.json', json.dumps(self.embeddings))
+        self.codec.write(self.zip, 'embeddings.json', json.dumps(self.embeddings))
 
     def write_cells(self):
         """Writes cells to cells.json in the output zip."""
@@ -160,7 +228,224 @@ class Loader:
                                 }
                             )
             self.cells = cells
-        self.zip.writestr('cells.json', json.dumps(self.cells))
+        self.codec.write(self.zip, 'cells.json', json.dumps(self.cells))
+
+
+# Offset and first bytes of each type of file, checked before asking libmagic
+SIGNATURES = [
+    (0, b'II*\x00', 'tiff'),
+    (0, b'MM\x00*', 'tiff'),
+    (0, b'II+\x00', 'tiff'),  # BigTIFF
+    (0, b'MM\x00+', 'tiff'),
+    (0, b'\x89PNG\r\n\x1a\n', 'png'),
+    (0, b'\x93NUMPY', 'npy'),
+    (0, b'PK\x03\x04', 'zip'),
+    (0, b'PK\x05\x06', 'zip'),  # empty zip
+    (257, b'ustar', 'tar'),
+]
+# Type of the archive members with these extensions,
+# checked against the signature of the member when the type has one
+EXTENSIONS = {
+    '.tif': 'tiff',
+    '.tiff': 'tiff',
+    '.png': 'png',
+    '.npy': 'npy',
+    '.npz': 'zip',
+    '.zip': 'zip',
+    '.tar': 'tar',
+    '.trk': 'tar',
+    '.json': None,
+}
+# Descriptions from libmagic for the types of files to load
+MAGIC_TYPES = {
+    'TIFF image data': 'tiff',
+    'PNG image data': 'png',
+    'NumPy data file': 'npy',
+}
+# Bytes to read to detect the type of a file
+HEADER_SIZE = 2048
+
+
+def match_signature(header):
+    """Returns the type of a file from the signature in its first bytes or None."""
+    for offset, signature, file_type in SIGNATURES:
+        if header[offset : offset + len(signature)] == signature:
+            return file_type
+    return None
+
+
+def detect_type(header):
+    """
+    Returns the type of a file like tiff, png, or npy from its first bytes,
+    or None for other files.
+
+    Checks the signatures of the types first and asks libmagic
+    only for files without a known signature.
+    """
+    file_type = match_signature(header)
+    if file_type is not None:
+        return file_type
+    description = magic.from_buffer(header)
+    for text, file_type in MAGIC_TYPES.items():
+        if text in description:
+            return file_type
+    return None
+
+
+def extension_type(name):
+    """
+    Returns the type of a file from the extension of its name,
+    None for files that are never loaded as images, or False for unknown extensions.
+    """
+    return EXTENSIONS.get(os.path.splitext(name)[1].lower(), False)
+
+
+def is_resource_fork(name):
+    """
+    Returns whether an archive member is macOS metadata, like the AppleDouble files
+    in __MACOSX/ or named ._image.tif, instead of a file to load.
+    """
+    return name.startswith('__MACOSX/') or os.path.basename(name).startswith('._')
+
+
+class Archive:
+    """
+    Opens an input file once and lists the members of a zip or tar archive,
+    so each loader reads from the same handle instead of opening the file again.
+
+    The type of each member is detected once, and members that more than
+    one loader reads, like X.ome.tiff, are decompressed once
+    and kept until the last loader releases them.
+    """
+
+    def __init__(self, f):
+        """
+        Args:
+            f: file object with a zip, a tar, or a single image file, or an open ZipFile
+        """
+        self.file = f
+        self.zip = None
+        self.tar = None
+        # Member name -> dictionary with its size in bytes and type, when detected
+        self.members = {}
+        self.data = {}
+        self.tiffs = {}
+        self.file_header = None
+
+        if isinstance(f, zipfile.ZipFile):
+            self.zip = f
+        else:
+            f.seek(0)
+            if zipfile.is_zipfile(f):
+                self.zip = zipfile.ZipFile(f, 'r')
+            elif match_signature(self.header) not in ('tiff', 'png', 'npy'):
+                f.seek(0)
+                try:
+                    self.tar = tarfile.open(fileobj=f)
+                except tarfile.TarError:
+                    pass
+        if self.zip is not None:
+            for info in self.zip.infolist():
+                if not info.is_dir() and not is_resource_fork(info.filename):
+                    self.members[info.filename] = {'size': info.file_size}
+        elif self.tar is not None:
+            for info in self.tar.getmembers():
+                if info.isfile() and not is_resource_fork(info.name):
+                    self.members[info.name] = {'size': info.size}
+
+    def names(self):
+        """Returns the names of the members in the archive."""
+        return list(self.members)
+
+    def open(self, name):
+        """Returns a file object to read a member without keeping its contents."""
+        if name in self.data:
+            return io.BytesIO(self.data[name])
+        if self.zip is not None:
+            return self.zip.open(name)
+        return self.tar.extractfile(name)
+
+    def read(self, name, keep=True):
+        """
+        Returns the contents of a member.
+
+        Args:
+            name (str): name of the member
+            keep (bool): whether to keep the contents for later reads of the member
+        """
+        if name in self.data:
+            return self.data[name]
+        with self.open(name) as f:
+            data = f.read()
+        if keep:
+            self.data[name] = data
+        return data
+
+    def type(self, name):
+        """
+        Returns the type of a member like tiff, png, or npy, or None for other files.
+
+        Members with an extension that is never loaded, like cells.json, are not read.
+        Members with an image extension, like batch_0_feature_0.tif, are typed by
+        their signature, so a file named .tif that is not a TIFF is not loaded as one.
+        """
+        member = self.members[name]
+        if 'type' not in member:
+            file_type = extension_type(name)
+            if file_type is not None:
+                header = self.member_header(name)
+                if file_type is False or match_signature(header) != file_type:
+                    file_type = detect_type(header)
+            member['type'] = file_type
+        return member['type']
+
+    def member_header(self, name):
+        """Returns the first bytes of a member."""
+        if name in self.data:
+            return self.data[name][:HEADER_SIZE]
+        with self.open(name) as f:
+            return f.read(HEADER_SIZE)
+
+    @property
+    def header(self):
+        """Returns the first bytes of the input file."""
+        if self.file_header is None:
+            self.file.seek(0)
+            self.file_header = self.file.read(HEADER_SIZE)
+            self.file.seek(0)
+        return self.file_header
+
+    @property
+    def file_type(self):
+        """Returns the type of the input file when it is not an archive."""
+        if self.zip is not None or self.tar is not None:
+            return None
+        return detect_type(self.header)
+
+    def tiff(self, name):
+        """Returns a TiffFile for a member, shared by the loaders that read it."""
+        if name not in self.tiffs:
+            self.tiffs[name] = TiffFile(io.BytesIO(self.read(name, keep=False)))
+        return self.tiffs[name]
+
+    def release(self, name):
+        """Frees the contents and the TiffFile kept for a member."""
+        self.data.pop(name, None)
+        tiff = self.tiffs.pop(name, None)
+        if tiff is not None:
+            tiff.close()
+
+    def close(self):
+        """Frees the members kept in memory."""
+        for tiff in self.tiffs.values():
+            tiff.close()
+        self.tiffs = {}
+        self.data = {}
+
+
+def as_archive(f):
+    """Returns an Archive for a file object or ZipFile, or the Archive itself."""
+    return f if isinstance(f, Archive) else Archive(f)
 
 
 def load_images(image_file, axes=None):
@@ -168,20 +453,21 @@ def load_images(image_file, axes=None):
     Loads image data from image file.
 
     Args:
-        image_file: zip, npy, tiff, or png file object containing image data
+        image_file: zip, npy, tiff, or png file object or Archive containing image data
 
     Returns:
         numpy array or None if no image data found
     """
-    X = load_zip(image_file)
+    archive = as_archive(image_file)
+    X = load_zip(archive)
     if X is None:
-        X = load_npy(image_file)
+        X = load_npy(archive)
     if X is None:
-        X = load_tiff(image_file, axes)
+        X = load_tiff(archive, axes)
     if X is None:
-        X = load_png(image_file)
+        X = load_png(archive)
     if X is None:
-        X = load_trk(image_file, filename='raw.npy')
+        X = load_trk(archive, filename='raw.npy')
     return X
 
 
@@ -190,20 +476,19 @@ def load_segmentation(f):
     Loads segmentation array from label file.
 
     Args:
-        label_file: file with zipped npy or tiff containing segmentation data
+        label_file: file or Archive with zipped npy or tiff containing segmentation data
 
     Returns:
         numpy array or None if no segmentation data found
     """
-    f.seek(0)
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        y = load_zip_numpy(zf, name='y')
+    archive = as_archive(f)
+    if archive.zip is not None:
+        y = load_zip_numpy(archive, name='y')
         if y is None:
-            y = load_zip_tiffs(zf, filename='y.ome.tiff')
+            y = load_zip_tiffs(archive, filename='y.ome.tiff')
         return y
-    if tarfile.is_tarfile(f.name):
-        return load_trk(f, filename='tracked.npy')
+    if archive.tar is not None:
+        return load_trk(archive, filename='tracked.npy')
 
 
 def load_spots(f):
@@ -211,15 +496,14 @@ def load_spots(f):
     Load spots data from label file.
 
     Args:
-        f: file with zipped csv containing spots data
+        f: file or Archive with zipped csv containing spots data
 
     Returns:
         bytes read from csv in zip or None if no csv in zip
     """
-    f.seek(0)
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        return load_zip_csv(zf)
+    archive = as_archive(f)
+    if archive.zip is not None:
+        return load_zip_csv(archive)
 
 
 def load_divisions(f):
@@ -235,16 +519,15 @@ def load_divisions(f):
     Returns:
         dict or None if divisions.json not found
     """
-    f.seek(0)
+    archive = as_archive(f)
     divisions = None
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        divisions = load_zip_json(zf, filename='divisions.json')
-        lineage = load_zip_json(zf, filename='lineage.json')
+    if archive.zip is not None:
+        divisions = load_zip_json(archive, filename='divisions.json')
+        lineage = load_zip_json(archive, filename='lineage.json')
         if lineage:
             divisions = convert_lineage(lineage)
-    elif tarfile.is_tarfile(f.name):
-        lineage = load_trk(f, filename='lineage.json')
+    elif archive.tar is not None:
+        lineage = load_trk(archive, filename='lineage.json')
         divisions = convert_lineage(lineage)
     if divisions is None:
         return []
@@ -261,11 +544,10 @@ def load_cellTypes(f):
     Returns:
         dict or None if cellTypes.json not found
     """
-    f.seek(0)
+    archive = as_archive(f)
     cellTypes = None
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        cellTypes = load_zip_json(zf, filename='cellTypes.json')
+    if archive.zip is not None:
+        cellTypes = load_zip_json(archive, filename='cellTypes.json')
     if cellTypes is None:
         return []
     return cellTypes
@@ -281,11 +563,10 @@ def load_embeddings(f):
     Returns:
         dict or None if embeddings.json not found
     """
-    f.seek(0)
+    archive = as_archive(f)
     embeddings = None
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        embeddings = load_zip_json(zf, filename='embeddings.json')
+    if archive.zip is not None:
+        embeddings = load_zip_json(archive, filename='embeddings.json')
     return embeddings
 
 
@@ -299,10 +580,9 @@ def load_cells(f):
     Returns:
         dict or None if no json in zip
     """
-    f.seek(0)
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        return load_zip_json(zf, filename='cells.json')
+    archive = as_archive(f)
+    if archive.zip is not None:
+        return load_zip_json(archive, filename='cells.json')
 
 
 def load_channels(f):
@@ -315,76 +595,82 @@ def load_channels(f):
     Returns:
         list or None if no channel metadata
     """
-    f.seek(0)
+    archive = as_archive(f)
     channels = []
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        for filename in zf.namelist():
-            if filename == 'X.ome.tiff':
-                with zf.open(filename) as X:
-                    tiff = TiffFile(X)
-                    if tiff.is_ome:
-                        root = ET.fromstring(tiff.ome_metadata)
-                        for child in root.iter():
-                            if child.tag.endswith('Channel') and 'Name' in child.attrib:
-                                channels.append(child.attrib['Name'])
+    if (
+        archive.zip is not None
+        and 'X.ome.tiff' in archive.members
+        and archive.type('X.ome.tiff') == 'tiff'
+    ):
+        tiff = archive.tiff('X.ome.tiff')
+        if tiff.is_ome:
+            root = ET.fromstring(tiff.ome_metadata)
+            for child in root.iter():
+                if child.tag.endswith('Channel') and 'Name' in child.attrib:
+                    channels.append(child.attrib['Name'])
+        # Reading the channels is the last use of X.ome.tiff
+        archive.release('X.ome.tiff')
     return channels
 
 
-def load_zip_numpy(zf, name='X'):
+def load_zip_numpy(zf, name='X', keep=False):
     """
     Loads a numpy array from the zip file
     If loading an NPZ with multiple arrays, name selects which one to load
 
     Args:
-        zf: a ZipFile with a npy or npz file
+        zf: a ZipFile or Archive with a npy or npz file
         name (str): name of the array to load
+        keep (bool): whether to keep the npz for loading another array from it
 
     Returns:
         numpy array or None if no png in zip
     """
-    for filename in zf.namelist():
+    archive = as_archive(zf)
+    for filename in archive.names():
         if filename == f'{name}.npy':
-            with zf.open(filename) as f:
+            with archive.open(filename) as f:
                 return np.load(f)
         if filename.endswith('.npz'):
-            with zf.open(filename) as f:
-                npz = np.load(f)
-                return npz[name] if name in npz.files else npz[npz.files[0]]
+            npz = np.load(io.BytesIO(archive.read(filename, keep=keep)))
+            array = npz[name] if name in npz.files else npz[npz.files[0]]
+            if not keep:
+                archive.release(filename)
+            return array
 
 
-def load_zip_tiffs(zf, filename):
+def load_zip_tiffs(zf, filename, keep=False):
     """
     Returns an array with all tiff image data in the zip file
 
     Args:
-        zf: a ZipFile containing tiffs to load
+        zf: a ZipFile or Archive containing tiffs to load
+        filename (str): name of the OME TIFF to load before looking for other tiffs
+        keep (bool): whether to keep the OME TIFF for reading its metadata later
 
     Returns:
         numpy array or None if no tiffs in zip
     """
-    if filename in zf.namelist():
-        with zf.open(filename) as f:
-            if 'TIFF image data' in magic.from_buffer(f.read(2048)):
-                f.seek(0)
-                tiff = TiffFile(f)
-                # TODO: check when there are multiple series
-                axes = tiff.series[0].axes
-                array = reshape(tiff.asarray(), axes, 'ZYXC')
-                return array
-            else:
-                print(f'{filename} is not a tiff file.')
+    archive = as_archive(zf)
+    if filename in archive.members:
+        # Read the whole file once to check its signature and load it
+        archive.read(filename)
+        if archive.type(filename) == 'tiff':
+            tiff = archive.tiff(filename)
+            # TODO: check when there are multiple series
+            axes = tiff.series[0].axes
+            array = reshape(tiff.asarray(), axes, 'ZYXC')
+            if not keep:
+                archive.release(filename)
+            return array
+        else:
+            archive.release(filename)
+            print(f'{filename} is not a tiff file.')
     else:
         print(f'{filename} not found in zip.')
     print('Loading all tiffs in zip.')
-    tiffs = {}
-    for name in zf.namelist():
-        with zf.open(name) as f:
-            if 'TIFF image data' in magic.from_buffer(f.read(2048)):
-                f.seek(0)
-                tiff = TiffFile(f).asarray()
-                tiffs[name] = tiff
-    if len(tiffs) > 0:
+    filenames = [name for name in archive.names() if archive.type(name) == 'tiff']
+    if len(filenames) > 0:
         regex = r'(.*)batch_(\d*)_feature_(\d*)\.tif'
 
         def get_batch(filename):
@@ -397,45 +683,100 @@ def load_zip_tiffs(zf, filename):
             if match:
                 return int(match.group(3))
 
-        filenames = list(tiffs.keys())
         all_have_batch = all(map(lambda x: x is not None, map(get_batch, filenames)))
         if all_have_batch:  # Use batches as Z dimension
-            batches = {}
-            for batch, batch_group in itertools.groupby(filenames, get_batch):
+            batches = sorted(set(map(get_batch, filenames)))
+            positions = {}
+            for i, batch in enumerate(batches):
                 # Stack features on last axis
-                features = [
-                    tiffs[filename]
-                    for filename in sorted(list(batch_group), key=get_feature)
-                ]
-                batches[batch] = np.stack(features, axis=-1)
+                features = sorted(
+                    [
+                        filename
+                        for filename in filenames
+                        if get_batch(filename) == batch
+                    ],
+                    key=get_feature,
+                )
+                for j, filename in enumerate(features):
+                    positions[filename] = ((i,), j)
             # Stack batches on first axis
-            batches = map(lambda x: x[1], sorted(batches.items()))
-            array = np.stack(list(batches), axis=0)
-            return array
+            return stack_tiffs(archive, positions, (len(batches),))
         else:  # Use each tiff as a channel and stack on the last axis
-            y = np.stack(list(tiffs.values()), axis=-1)
+            positions = {filename: ((), j) for j, filename in enumerate(filenames)}
+            y = stack_tiffs(archive, positions, ())
             # Add Z axis
             if y.ndim == 3:
                 y = y[np.newaxis, ...]
             return y
 
 
+def stack_tiffs(archive, positions, leading_shape):
+    """
+    Decodes TIFFs in a thread pool straight into one array,
+    sized from the TIFF headers, instead of stacking the decoded TIFFs.
+
+    Each member is decompressed from the zip once: its bytes are read
+    to get the shape from its header and kept until it is decoded,
+    so the compressed TIFFs are in memory together with the array.
+
+    Args:
+        archive (Archive): zip with the TIFFs
+        positions (dict): TIFF name -> (index on the leading axes, channel)
+        leading_shape (tuple): shape of the axes before the axes of each TIFF
+
+    Returns:
+        numpy array with shape (*leading_shape, *TIFF shape, channels)
+
+    Raises:
+        ValueError: when the TIFFs have different shapes or
+            the leading axes have different numbers of channels
+    """
+
+    def read_header(name):
+        return TiffFile(io.BytesIO(archive.read(name, keep=False)))
+
+    def decode(name, tiff):
+        index, channel = positions[name]
+        with tiff:
+            array[index + (Ellipsis, channel)] = tiff.asarray(maxworkers=1)
+
+    names = list(positions)
+    tiffs = []
+    try:
+        with ThreadPoolExecutor(TIFF_DECODE_WORKERS) as executor:
+            for tiff in executor.map(read_header, names):
+                tiffs.append(tiff)
+            shapes = {tiff.series[0].shape for tiff in tiffs}
+            if len(shapes) > 1:
+                raise ValueError(f'TIFFs have different shapes {sorted(shapes)}.')
+            channels = max(channel for _, channel in positions.values()) + 1
+            if len(names) != np.prod(leading_shape, dtype=int) * channels:
+                raise ValueError('Batches have different numbers of features.')
+            dtype = np.result_type(*[tiff.series[0].dtype for tiff in tiffs])
+            array = np.empty((*leading_shape, *shapes.pop(), channels), dtype)
+            # Raise the first error from decoding
+            list(executor.map(decode, names, tiffs))
+    finally:
+        for tiff in tiffs:
+            tiff.close()
+    return array
+
+
 def load_zip_png(zf):
     """
     Returns the image data array for the first PNG image in the zip file
 
     Args:
-        zf: a ZipFile with a PNG
+        zf: a ZipFile or Archive with a PNG
 
     Returns:
         numpy array or None if no png in zip
     """
-    for name in zf.namelist():
-        with zf.open(name) as f:
-            if 'PNG image data' in magic.from_buffer(f.read(2048)):
-                f.seek(0)
-                png = Image.open(f)
-                return np.array(png)
+    archive = as_archive(zf)
+    for name in archive.names():
+        if archive.type(name) == 'png':
+            png = Image.open(io.BytesIO(archive.read(name, keep=False)))
+            return np.array(png)
 
 
 def load_zip_csv(zf):
@@ -443,15 +784,15 @@ def load_zip_csv(zf):
     Returns the binary data for the first CSV file in the zip file, if it exists.
 
     Args:
-        zf: a ZipFile with a CSV
+        zf: a ZipFile or Archive with a CSV
 
     Returns:
         bytes or None if not a csv file
     """
-    for name in zf.namelist():
+    archive = as_archive(zf)
+    for name in archive.names():
         if name.endswith('.csv'):
-            with zf.open(name) as f:
-                return f.read()
+            return archive.read(name, keep=False)
 
 
 def load_zip_json(zf, filename=None):
@@ -459,19 +800,18 @@ def load_zip_json(zf, filename=None):
     Returns a dicstion json file in the zip file, if it exists.
 
     Args:
-        zf: a ZipFile with a CSV
+        zf: a ZipFile or Archive with a CSV
 
     Returns:
         bytes or None if not a csv file
     """
-    if filename in zf.namelist():
-        with zf.open(filename) as f:
-            try:
-                f.seek(0)
-                return json.load(f)
-            except json.JSONDecodeError as e:
-                print(f'Warning: Could not load {filename} as JSON. {e.msg}')
-                return
+    archive = as_archive(zf)
+    if filename in archive.members:
+        try:
+            return json.loads(archive.read(filename, keep=False))
+        except json.JSONDecodeError as e:
+            print(f'Warning: Could not load {filename} as JSON. {e.msg}')
+            return
     print(f'Warning: JSON file {filename} not found.')
 
 
@@ -480,19 +820,19 @@ def load_zip(f):
     Loads image data from a zip file by loading from the npz, tiff, or png files in the archive
 
     Args:
-        f: file object
+        f: file object or Archive
 
     Returns:
         numpy array or None if not a zip file
     """
-    f.seek(0)
-    if zipfile.is_zipfile(f):
-        zf = zipfile.ZipFile(f, 'r')
-        X = load_zip_numpy(zf)
+    archive = as_archive(f)
+    if archive.zip is not None:
+        # Keep the npz for the segmentation and X.ome.tiff for the channel names
+        X = load_zip_numpy(archive, keep=True)
         if X is None:
-            X = load_zip_tiffs(zf, filename='X.ome.tiff')
+            X = load_zip_tiffs(archive, filename='X.ome.tiff', keep=True)
         if X is None:
-            X = load_zip_png(zf)
+            X = load_zip_png(archive)
         return X
 
 
@@ -501,15 +841,15 @@ def load_npy(f):
     Loads image data from a npy file
 
     Args:
-        f: file object
+        f: file object or Archive
 
     Returns:
         numpy array or None if not a npy file
     """
-    f.seek(0)
-    if 'NumPy data file' in magic.from_buffer(f.read(2048)):
-        f.seek(0)
-        npy = np.load(f)
+    archive = as_archive(f)
+    if archive.file_type == 'npy':
+        archive.file.seek(0)
+        npy = np.load(archive.file)
         return npy
 
 
@@ -518,7 +858,7 @@ def load_tiff(f, axes=None):
     Loads image data from a tiff file
 
     Args:
-        f: file object
+        f: file object or Archive
 
     Returns:
         numpy array or None if not a tiff file
@@ -526,10 +866,10 @@ def load_tiff(f, axes=None):
     Raises:
         ValueError: tiff has less than 2 or more than 4 dimensions
     """
-    f.seek(0)
-    if 'TIFF image data' in magic.from_buffer(f.read(2048)):
-        f.seek(0)
-        tiff = TiffFile(io.BytesIO(f.read()))
+    archive = as_archive(f)
+    if archive.file_type == 'tiff':
+        archive.file.seek(0)
+        tiff = TiffFile(io.BytesIO(archive.file.read()))
         # Load array
         if tiff.is_imagej:
             X = tiff.asarray()
@@ -589,15 +929,15 @@ def load_png(f):
     Loads image data from a png file
 
     Args:
-        f: file object
+        f: file object or Archive
 
     Returns:
         numpy array or None if not a png file
     """
-    f.seek(0)
-    if 'PNG image data' in magic.from_buffer(f.read(2048)):
-        f.seek(0)
-        image = Image.open(f, formats=['PNG'])
+    archive = as_archive(f)
+    if archive.file_type == 'png':
+        archive.file.seek(0)
+        image = Image.open(archive.file, formats=['PNG'])
         # Add channel dimension at end to single channel images
         if image.mode == 'L':  # uint8
             X = np.array(image)
@@ -624,22 +964,16 @@ def load_trk(f, filename='raw.npy'):
     Loads image data from a .trk file containing raw.npy, tracked.npy, and lineage.json
 
     Args:
-        f: file object containing a .trk file
+        f: file object or Archive containing a .trk file
         filename: name of the file within the .trk to load
 
     Returns:
         numpy array (for raw.npy or tracked.npy) or dictionary (for lineage.json)
     """
-    f.seek(0)
-    if tarfile.is_tarfile(f.name):
-        with tarfile.open(fileobj=f) as trks:
-            if filename == 'raw.npy' or filename == 'tracked.npy':
-                # numpy can't read these from disk...
-                with io.BytesIO() as array_file:
-                    array_file.write(trks.extractfile(filename).read())
-                    array_file.seek(0)
-                    return np.load(array_file)
-            if filename == 'lineage.json':
-                return json.loads(
-                    trks.extractfile(trks.getmember('lineage.json')).read().decode()
-                )
+    archive = as_archive(f)
+    if archive.tar is not None:
+        if filename == 'raw.npy' or filename == 'tracked.npy':
+            # numpy can't read these from disk...
+            return np.load(io.BytesIO(archive.read(filename, keep=False)))
+        if filename == 'lineage.json':
+            return json.loads(archive.read('lineage.json', keep=False).decode())
@@ -9,11 +9,20 @@ import tempfile
 import zipfile
 
 import numpy as np
+import pytest
 from PIL import Image
 from tifffile import TiffFile, TiffWriter, imwrite
 
 from deepcell_label.config import DELETE_TEMP
-from deepcell_label.loaders import Loader
+from deepcell_label.loaders import (
+    Archive,
+    Loader,
+    detect_type,
+    load_channels,
+    load_images,
+    load_segmentation,
+    load_zip_tiffs,
+)
 
 
 def assert_image(archive, expected):
@@ -36,6 +45,144 @@ def assert_segmentation(archive, expected):
     assert json.loads(archive.open('cells.json').read()) is not None
 
 
+def test_archive_manifest():
+    """Lists the members of a zip and reads each member once."""
+    expected = np.zeros((1, 10, 10, 2), dtype=np.uint8)
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        tiff = io.BytesIO()
+        with TiffWriter(tiff, ome=True) as writer:
+            writer.write(
+                np.moveaxis(expected, -1, 1),
+                metadata={
+                    'axes': 'ZCYX',
+                    'Pixels': {'Channel': [{'Name': 'a'}, {'Name': 'b'}]},
+                },
+            )
+        zf.writestr('X.ome.tiff', tiff.getvalue())
+        zf.writestr('cells.json', '[]')
+
+    archive = Archive(f)
+    assert archive.names() == ['X.ome.tiff', 'cells.json']
+    assert archive.members['cells.json']['size'] == 2
+    assert archive.type('cells.json') is None
+    opened = []
+    open_member = archive.zip.open
+    archive.zip.open = lambda name: opened.append(name) or open_member(name)
+
+    np.testing.assert_array_equal(load_images(archive), expected)
+    assert load_channels(archive) == ['a', 'b']
+    assert opened == ['X.ome.tiff']
+    # The channels are the last use of X.ome.tiff
+    assert archive.tiffs == {} and archive.data == {}
+    archive.close()
+
+
+def test_archive_release_npz():
+    """Keeps an npz for the segmentation and frees it once the segmentation is loaded."""
+    X = np.zeros((1, 2, 2, 1), dtype=np.uint8)
+    y = np.ones((1, 2, 2, 1), dtype=np.int32)
+    npz = io.BytesIO()
+    np.savez(npz, X=X, y=y)
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        zf.writestr('data.npz', npz.getvalue())
+
+    archive = Archive(f)
+    np.testing.assert_array_equal(load_images(archive), X)
+    assert list(archive.data) == ['data.npz']
+    np.testing.assert_array_equal(load_segmentation(archive), y)
+    assert archive.data == {}
+
+
+def test_detect_type():
+    tiff = io.BytesIO()
+    imwrite(tiff, np.zeros((2, 2), dtype=np.uint8))
+    big_tiff = io.BytesIO()
+    imwrite(big_tiff, np.zeros((2, 2), dtype=np.uint8), bigtiff=True)
+    png = io.BytesIO()
+    Image.fromarray(np.zeros((2, 2), dtype=np.uint8)).save(png, format='png')
+    npy = io.BytesIO()
+    np.save(npy, np.zeros((2, 2)))
+
+    assert detect_type(tiff.getvalue()) == 'tiff'
+    assert detect_type(big_tiff.getvalue()) == 'tiff'
+    assert detect_type(png.getvalue()) == 'png'
+    assert detect_type(npy.getvalue()) == 'npy'
+    assert detect_type(b'[]') is None
+
+
+def test_archive_type_from_extension():
+    """Checks the signature of image members and does not read other known members."""
+    tiff = io.BytesIO()
+    imwrite(tiff, np.zeros((2, 2), dtype=np.uint8))
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        zf.writestr('batch_0_feature_0.tif', tiff.getvalue())
+        zf.writestr('batch_0_feature_1.tif', b'not a tiff')
+        zf.writestr('lineage.json', b'{}')
+        zf.writestr('X', np.zeros(1).tobytes())
+    archive = Archive(f)
+    opened = []
+    open_member = archive.zip.open
+    archive.zip.open = lambda name: opened.append(name) or open_member(name)
+
+    assert archive.type('batch_0_feature_0.tif') == 'tiff'
+    assert archive.type('batch_0_feature_1.tif') is None
+    assert archive.type('lineage.json') is None
+    assert archive.type('X') is None
+    assert opened == ['batch_0_feature_0.tif', 'batch_0_feature_1.tif', 'X']
+
+
+def test_load_zip_tiffs_resource_forks():
+    """Skips the AppleDouble files that macOS adds to zips."""
+    expected = np.arange(2 * 4 * 4).reshape((2, 4, 4, 1)).astype(np.uint8)
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        for batch in range(2):
+            name = f'batch_{batch}_feature_0.tif'
+            tiff = io.BytesIO()
+            imwrite(tiff, expected[batch, ..., 0])
+            zf.writestr(name, tiff.getvalue())
+            # AppleDouble header
+            zf.writestr(f'__MACOSX/._{name}', b'\x00\x05\x16\x07' + bytes(78))
+            zf.writestr(f'._{name}', b'\x00\x05\x16\x07' + bytes(78))
+
+    archive = Archive(f)
+    assert archive.names() == ['batch_0_feature_0.tif', 'batch_1_feature_0.tif']
+    np.testing.assert_array_equal(load_zip_tiffs(archive, 'X.ome.tiff'), expected)
+
+
+def test_load_zip_tiffs_not_tiff():
+    """Loads the other TIFFs when X.ome.tiff is not a TIFF."""
+    expected = np.ones((1, 2, 2, 1), dtype=np.uint8)
+    tiff = io.BytesIO()
+    imwrite(tiff, expected[0, ..., 0])
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        zf.writestr('X.ome.tiff', b'not a tiff')
+        zf.writestr('image.tif', tiff.getvalue())
+
+    archive = Archive(f)
+    np.testing.assert_array_equal(load_zip_tiffs(archive, 'X.ome.tiff'), expected)
+    assert load_channels(archive) == []
+    assert archive.data == {}
+
+
+def test_project_file(mocker):
+    """Writes TIFFs larger than the spool size through temporary files on disk."""
+    mocker.patch('deepcell_label.tiffs.PROJECT_SPOOL_SIZE', 0.001)
+    expected = np.arange(2 * 64 * 64).reshape((2, 64, 64, 1)).astype(np.uint16)
+    npz = io.BytesIO()
+    np.savez(npz, X=expected)
+    loader = Loader(npz)
+
+    assert loader.project_file.tell() == 0
+    loaded_zip = zipfile.ZipFile(loader.project_file)
+    assert_image(loaded_zip, expected)
+    loader.close()
+
+
 def test_load_npz():
     """Load npz with image data."""
     expected = np.zeros((1, 1, 1, 1))
@@ -203,6 +350,55 @@ def test_load_segmentation_zip():
     assert_segmentation(loaded_zip, expected_segmentation)
 
 
+def test_load_zip_tiffs():
+    """Stacks the tiffs in a zip by batch and feature in any order."""
+    rng = np.random.default_rng(0)
+    expected = rng.integers(0, 100, (3, 10, 20, 2)).astype(np.uint16)
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        for batch, feature in [(2, 1), (0, 0), (1, 1), (2, 0), (1, 0), (0, 1)]:
+            tiff = io.BytesIO()
+            # Stacks with the common type like np.stack
+            dtype = np.uint8 if feature == 0 else np.uint16
+            imwrite(tiff, expected[batch, ..., feature].astype(dtype))
+            zf.writestr(f'batch_{batch}_feature_{feature}.tif', tiff.getvalue())
+
+    archive = Archive(f)
+    # Detect the types first, which only reads the first bytes of each TIFF
+    names = [name for name in archive.names() if archive.type(name) == 'tiff']
+    opened = []
+    open_member = archive.zip.open
+    archive.zip.open = lambda name: opened.append(name) or open_member(name)
+
+    array = load_zip_tiffs(archive, filename='X.ome.tiff')
+    assert array.dtype == np.uint16
+    np.testing.assert_array_equal(array, expected)
+    # Reads each TIFF once for both its header and its data
+    assert sorted(opened) == sorted(names)
+
+
+def test_load_zip_tiffs_channels():
+    """Stacks tiffs without batches as channels."""
+    expected = np.arange(2 * 10 * 20 * 3).reshape((2, 10, 20, 3))
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        for channel in range(3):
+            tiff = io.BytesIO()
+            imwrite(tiff, expected[..., channel])
+            zf.writestr(f'channel_{channel}.tif', tiff.getvalue())
+        tiff = io.BytesIO()
+        imwrite(tiff, np.zeros((10, 20)))
+        zf.writestr('other_shape.tif', tiff.getvalue())
+
+    archive = Archive(f)
+    with pytest.raises(ValueError):
+        load_zip_tiffs(archive, filename='X.ome.tiff')
+    del archive.members['other_shape.tif']
+    np.testing.assert_array_equal(
+        load_zip_tiffs(archive, filename='X.ome.tiff'), expected
+    )
+
+
 def test_load_batches():
     """Load labeled array from zip of tiff files with multiple batches."""
     expected_image = np.zeros((2, 100, 100, 1))
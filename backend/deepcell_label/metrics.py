@@ -0,0 +1,221 @@
+"""Times the phases of requests and aggregates the timings into Prometheus histograms."""
+from __future__ import absolute_import, division, print_function
+
+import bisect
+import contextlib
+import threading
+import timeit
+
+from flask import g, has_request_context, request
+
+# Upper bounds of the buckets for durations in seconds and payload sizes in bytes
+TIME_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+SIZE_BUCKETS = tuple(4**i for i in range(5, 16))  # 1 KiB to 1 GiB
+
+
+class Histogram(object):
+    """
+    Counts observations in cumulative buckets for each combination of labels,
+    like a Prometheus histogram.
+    """
+
+    def __init__(self, name, description, buckets, label_names):
+        """
+        Args:
+            name (str): metric name
+            description (str): help text for the metric
+            buckets (tuple): increasing upper bounds of the buckets
+            label_names (tuple): names of the labels of each observation
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        # label values -> count in each bucket (not cumulative) and the +Inf bucket
+        self.counts = {}
+        self.sums = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Adds an observation with values for the labels, using '' for missing labels."""
+        key = tuple(str(labels.get(name) or '') for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if key not in self.counts:
+                self.counts[key] = [0] * (len(self.buckets) + 1)
+                self.sums[key] = 0
+            self.counts[key][index] += 1
+            self.sums[key] += value
+
+    def render(self):
+        """Returns the histogram in the Prometheus text format."""
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted((key, list(counts)) for key, counts in self.counts.items())
+            sums = dict(self.sums)
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for key, counts in series:
+            labels = [
+                f'{name}="{escape(value)}"'
+                for name, value in zip(self.label_names, key)
+            ]
+            total = 0
+            for bound, count in zip(bounds, counts):
+                total += count
+                bucket_labels = ','.join(labels + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {total}')
+            lines.append(
+                f'{self.name}_sum{{{",".join(labels)}}} {format_value(sums[key])}'
+            )
+            lines.append(f'{self.name}_count{{{",".join(labels)}}} {total}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    """Formats a number without a trailing .0 for integers."""
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def escape(value):
+    """Escapes a label value for the Prometheus text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'deepcell_label_request_duration_seconds',
+    'Time to handle a request.',
+    TIME_BUCKETS,
+    ('endpoint', 'action', 'write_mode'),
+)
+PHASE_SECONDS = Histogram(
+    'deepcell_label_phase_duration_seconds',
+    'Time spent in each phase of a request, like unzip, decode, action, encode, zip, s3, and db.',
+    TIME_BUCKETS,
+    ('endpoint', 'phase', 'action', 'write_mode'),
+)
+REQUEST_BYTES = Histogram(
+    'deepcell_label_request_size_bytes',
+    'Size of the request body.',
+    SIZE_BUCKETS,
+    ('endpoint', 'action', 'write_mode'),
+)
+RESPONSE_BYTES = Histogram(
+    'deepcell_label_response_size_bytes',
+    'Size of the response body before HTTP compression.',
+    SIZE_BUCKETS,
+    ('endpoint', 'action', 'write_mode'),
+)
+HISTOGRAMS = [REQUEST_SECONDS, PHASE_SECONDS, REQUEST_BYTES, RESPONSE_BYTES]
+
+
+def get_request_timer():
+    """Returns the timings of the current request, or None outside of a timed request."""
+    if not has_request_context():
+        return None
+    return g.get('timer')
+
+
+def start_request():
+    """Starts timing the current request."""
+    g.timer = {
+        'start': timeit.default_timer(),
+        'size': request.content_length,
+        'phases': {},
+        'labels': {},
+        # Time spent in nested phases for each phase being timed
+        'nested': [],
+    }
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the block to a phase of the current request.
+
+    Time spent in a nested phase, like zipping while writing a project,
+    counts toward the nested phase and not the outer phase.
+    Does nothing outside of a timed request, like in a job worker or a thread pool.
+    """
+    timer = get_request_timer()
+    if timer is None:
+        yield
+        return
+    # List the phases in the order they start
+    timer['phases'].setdefault(phase, 0)
+    timer['nested'].append(0)
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        elapsed = timeit.default_timer() - start
+        nested = timer['nested'].pop()
+        if timer['nested']:
+            timer['nested'][-1] += elapsed
+        timer['phases'][phase] += elapsed - nested
+
+
+def label_request(**labels):
+    """Sets labels like action and write_mode for the metrics of the current request."""
+    timer = get_request_timer()
+    if timer is not None:
+        timer['labels'].update(labels)
+
+
+def get_labels():
+    """Returns the labels set for the current request."""
+    timer = get_request_timer()
+    return {} if timer is None else dict(timer['labels'])
+
+
+def finish_request(response, endpoint):
+    """
+    Adds the phase timings of the current request to the response
+    in a Server-Timing header and records them in the histograms.
+
+    Returns:
+        the response
+    """
+    timer = get_request_timer()
+    if timer is None:
+        return response
+    total = timeit.default_timer() - timer['start']
+    labels = dict(timer['labels'], endpoint=endpoint)
+    timings = [
+        f'{phase};dur={seconds * 1000:.3f}'
+        for phase, seconds in timer['phases'].items()
+    ]
+    timings.append(f'total;dur={total * 1000:.3f}')
+    response.headers['Server-Timing'] = ', '.join(timings)
+
+    REQUEST_SECONDS.observe(total, **labels)
+    for phase, seconds in timer['phases'].items():
+        PHASE_SECONDS.observe(seconds, phase=phase, **labels)
+    if timer['size'] is not None:
+        REQUEST_BYTES.observe(timer['size'], **labels)
+    if response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, **labels)
+    return response
+
+
+def render():
+    """Returns all histograms in the Prometheus text format."""
+    return ''.join(histogram.render() for histogram in HISTOGRAMS)
@@ -0,0 +1,60 @@
+"""Tests for metrics.py"""
+
+import time
+
+from flask import Flask
+
+from deepcell_label.metrics import (
+    Histogram,
+    finish_request,
+    get_labels,
+    label_request,
+    start_request,
+    timed,
+)
+
+
+def test_histogram():
+    histogram = Histogram('test_seconds', 'Test.', (0.1, 1), ('action',))
+    histogram.observe(0.05, action='draw')
+    histogram.observe(0.1, action='draw')
+    histogram.observe(5, action='draw')
+    histogram.observe(0.5, action='fill"')
+
+    lines = histogram.render().splitlines()
+    assert lines[:2] == ['# HELP test_seconds Test.', '# TYPE test_seconds histogram']
+    assert 'test_seconds_bucket{action="draw",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{action="draw",le="1"} 2' in lines
+    assert 'test_seconds_bucket{action="draw",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{action="draw"} 5.15' in lines
+    assert 'test_seconds_count{action="draw"} 3' in lines
+    assert 'test_seconds_bucket{action="fill\\"",le="0.1"} 0' in lines
+
+
+def test_timed_outside_request():
+    with timed('action'):
+        pass
+    assert get_labels() == {}
+
+
+def test_timed_nested_phases():
+    app = Flask(__name__)
+    with app.test_request_context():
+        start_request()
+        label_request(action='draw')
+        with timed('encode'):
+            time.sleep(0.02)
+            with timed('zip'):
+                time.sleep(0.05)
+        with timed('zip'):
+            time.sleep(0.01)
+        response = finish_request(app.response_class('data'), 'label.edit')
+
+    timings = dict(
+        timing.split(';dur=')
+        for timing in response.headers['Server-Timing'].split(', ')
+    )
+    assert list(timings) == ['encode', 'zip', 'total']
+    assert 20 <= float(timings['encode']) < 50
+    assert float(timings['zip']) >= 60
+    assert float(timings['total']) >= 80
@@ -1,18 +1,32 @@
 """SQL Alchemy database models."""
 from __future__ import absolute_import, division, print_function
 
-import io
 import logging
 import timeit
 from secrets import token_urlsafe
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from flask_sqlalchemy import SQLAlchemy
 
-from deepcell_label.config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_BUCKET
+from deepcell_label.config import (
+    AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY,
+    S3_BUCKET,
+    S3_MAX_CONCURRENCY,
+    S3_PART_SIZE,
+)
+from deepcell_label.metrics import timed
 
 logger = logging.getLogger('models.Project')  # pylint: disable=C0103
 db = SQLAlchemy()  # pylint: disable=C0103
+# Uploads larger files in parts, reading at most S3_MAX_CONCURRENCY parts at once
+S3_TRANSFER = TransferConfig(
+    multipart_threshold=S3_PART_SIZE * 1024 * 1024,
+    multipart_chunksize=S3_PART_SIZE * 1024 * 1024,
+    max_concurrency=S3_MAX_CONCURRENCY,
+    max_io_queue=S3_MAX_CONCURRENCY,
+)
 
 
 class Project(db.Model):
@@ -34,11 +48,12 @@ class Project(db.Model):
         start = timeit.default_timer()
 
         # Create a unique 12 character base64 project ID
-        while True:
-            project = token_urlsafe(9)  # 9 bytes is 12 base64 characters
-            if not db.session.query(Project).filter_by(project=project).first():
-                self.project = project
-                break
+        with timed('db'):
+            while True:
+                project = token_urlsafe(9)  # 9 bytes is 12 base64 characters
+                if not db.session.query(Project).filter_by(project=project).first():
+                    self.project = project
+                    break
 
         # Upload to s3
         s3 = boto3.client(
@@ -48,8 +63,12 @@ class Project(db.Model):
         )
         self.bucket = S3_BUCKET
         self.key = f'{self.project}.zip'
-        fileobj = io.BytesIO(loader.data)
-        s3.upload_fileobj(fileobj, self.bucket, self.key)
+        # Upload the project zip from the loader without copying it into memory
+        loader.project_file.seek(0)
+        with timed('s3'):
+            s3.upload_fileobj(
+                loader.project_file, self.bucket, self.key, Config=S3_TRANSFER
+            )
 
         logger.debug(
             'Initialized project %s and uploaded to %s in %ss.',
@@ -70,7 +89,8 @@ class Project(db.Model):
             Project: row from the Project table
         """
         start = timeit.default_timer()
-        project = db.session.query(Project).filter_by(project=project).first()
+        with timed('db'):
+            project = db.session.query(Project).filter_by(project=project).first()
         logger.debug('Got project %s in %ss.', project, timeit.default_timer() - start)
         return project
 
@@ -87,8 +107,9 @@ class Project(db.Model):
         """
         start = timeit.default_timer()
         project = Project(data)
-        db.session.add(project)
-        db.session.commit()
+        with timed('db'):
+            db.session.add(project)
+            db.session.commit()
         logger.debug(
             'Created new project %s in %ss.',
             project.project,
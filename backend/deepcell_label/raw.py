@@ -0,0 +1,117 @@
+"""Loads raw frames from the projects on S3 and caches them for edits."""
+from __future__ import absolute_import, division, print_function
+
+import io
+import logging
+import timeit
+import zipfile
+
+import boto3
+import numpy as np
+
+from deepcell_label.cache import raw_cache
+from deepcell_label.loaders import load_zip_tiffs
+from deepcell_label.metrics import timed
+from deepcell_label.models import Project
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+def download_project(project):
+    """Returns a file with the project zip from S3."""
+    row = Project.get(project)
+    if not row:
+        raise ValueError(f'project {project} not found')
+    s3 = boto3.client('s3')
+    data = io.BytesIO()
+    with timed('s3'):
+        s3.download_fileobj(row.bucket, row.key, data)
+    data.seek(0)
+    return data
+
+
+def normalize_frame(frame, low, high):
+    """
+    Scales a raw frame from low to high into 0 to 255
+    like the client does before it displays the frame.
+    """
+    if high == low:
+        return np.zeros(frame.shape, dtype=np.uint8)
+    scaled = (frame.astype(np.float64) - low) / (high - low) * 255
+    return np.floor(scaled + 0.5).astype(np.uint8)
+
+
+def cache_project_raw(project, key=None):
+    """
+    Loads the raw frames of a project into the raw cache.
+
+    Frames larger than the whole cache are not cached.
+
+    Args:
+        project (str): project id
+        key: (project, channel, t) to cache last so it is the last to be evicted
+
+    Returns:
+        the frame for key, even when it was not cached, or None
+    """
+    start = timeit.default_timer()
+    data = download_project(project)
+    with timed('decode'):
+        with zipfile.ZipFile(data) as zf:
+            images = load_zip_tiffs(zf, 'X.ome.tiff')  # ZYXC
+        keys = []
+        for channel in range(images.shape[-1]):
+            channel_images = images[..., channel]
+            low, high = channel_images.min(), channel_images.max()
+            for t, frame in enumerate(channel_images):
+                raw = normalize_frame(frame, low, high)
+                raw.flags.writeable = False
+                keys.append(((project, channel, t), raw))
+    keys.sort(key=lambda item: item[0] == key)
+    frame = None
+    for frame_key, raw in keys:
+        value = {'raw': raw, 'elevation': None}
+        if raw.nbytes <= raw_cache.max_size:
+            raw_cache.put(frame_key, value, raw.nbytes)
+        if frame_key == key:
+            frame = value
+    logger.debug(
+        'Cached %s raw frames of project %s in %s s.',
+        len(keys),
+        project,
+        timeit.default_timer() - start,
+    )
+    return frame
+
+
+def get_raw_frame(project, channel, t):
+    """
+    Returns the cached raw frame, loading the project into the cache when needed.
+
+    Returns:
+        dictionary with
+            raw: uint8 array scaled like the raw frames the client sends in raw.dat
+            elevation: inverted raw frame for watershed, or None when not computed yet
+    """
+    key = (project, channel, t)
+    frame = raw_cache.get(key)
+    if frame is None:
+        # The frame may not fit or may already be evicted by the other frames
+        frame = cache_project_raw(project, key)
+        if frame is None:
+            raise ValueError(
+                f'project {project} has no raw frame in channel {channel} at t {t}'
+            )
+    return frame
+
+
+def cache_elevation(key, elevation):
+    """Adds the elevation computed from a raw frame to the raw cache."""
+    frame = raw_cache.get(key)
+    if frame is not None and frame['elevation'] is None:
+        elevation.flags.writeable = False
+        raw_cache.put(
+            key,
+            dict(frame, elevation=elevation),
+            frame['raw'].nbytes + elevation.nbytes,
+        )
@@ -0,0 +1,72 @@
+"""Tests for raw.py"""
+
+import io
+import zipfile
+
+import numpy as np
+from tifffile import TiffWriter
+
+from deepcell_label.cache import raw_cache
+from deepcell_label.raw import cache_elevation, get_raw_frame, normalize_frame
+
+
+def make_project_zip(X):
+    """Returns a project zip with images X with dimension order ZCYX."""
+    images = io.BytesIO()
+    with TiffWriter(images, ome=True) as tif:
+        tif.write(X, metadata={'axes': 'ZCYX'})
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        zf.writestr('X.ome.tiff', images.getvalue())
+    f.seek(0)
+    return f
+
+
+def test_normalize_frame():
+    frame = np.array([[10, 11, 12, 20]], dtype=np.uint16)
+    np.testing.assert_array_equal(normalize_frame(frame, 10, 20), [[0, 26, 51, 255]])
+    np.testing.assert_array_equal(normalize_frame(frame, 5, 5), [[0, 0, 0, 0]])
+
+
+def test_get_raw_frame(mocker):
+    X = np.zeros((2, 2, 1, 2), dtype=np.uint16)
+    X[0, 0] = [[0, 100]]
+    X[1, 0] = [[50, 200]]
+    X[:, 1] = 7
+    download = mocker.patch(
+        'deepcell_label.raw.download_project',
+        side_effect=lambda _: make_project_zip(X),
+    )
+
+    # Normalizes each channel across all frames
+    frame = get_raw_frame('test_get_raw_frame', 0, 1)
+    np.testing.assert_array_equal(frame['raw'], [[64, 255]])
+    assert frame['elevation'] is None
+    np.testing.assert_array_equal(
+        get_raw_frame('test_get_raw_frame', 0, 0)['raw'], [[0, 128]]
+    )
+    np.testing.assert_array_equal(
+        get_raw_frame('test_get_raw_frame', 1, 1)['raw'], [[0, 0]]
+    )
+    download.assert_called_once()
+
+
+def test_get_raw_frame_larger_than_cache(mocker):
+    X = np.arange(4, dtype=np.uint16).reshape((1, 1, 2, 2))
+    mocker.patch(
+        'deepcell_label.raw.download_project',
+        side_effect=lambda _: make_project_zip(X),
+    )
+    mocker.patch.object(raw_cache, 'max_size', 2)
+
+    frame = get_raw_frame('test_get_raw_frame_larger_than_cache', 0, 0)
+    np.testing.assert_array_equal(frame['raw'], [[0, 85], [170, 255]])
+    assert ('test_get_raw_frame_larger_than_cache', 0, 0) not in raw_cache
+
+
+def test_cache_elevation():
+    key = ('test_cache_elevation', 0, 0)
+    raw = np.ones((2, 2), dtype=np.uint8)
+    raw_cache.put(key, {'raw': raw, 'elevation': None}, raw.nbytes)
+    cache_elevation(key, -raw.astype(np.float32))
+    np.testing.assert_array_equal(raw_cache.get(key)['elevation'], -np.ones((2, 2)))
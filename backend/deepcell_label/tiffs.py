@@ -0,0 +1,188 @@
+"""Writes the OME TIFFs in project and export zips."""
+from __future__ import absolute_import, division, print_function
+
+import itertools
+import tempfile
+
+import numpy as np
+from tifffile import FileHandle, TiffWriter
+
+from deepcell_label.config import (
+    LABEL_TIFF_COMPRESSION,
+    LABEL_TIFF_COMPRESSION_LEVEL,
+    LABEL_TIFF_PREDICTOR,
+    PROJECT_SPOOL_SIZE,
+    TIFF_COMPRESSION,
+    TIFF_COMPRESSION_LEVEL,
+    TIFF_PREDICTOR,
+    TIFF_TILE_SIZE,
+    TIFF_WRITE_WORKERS,
+)
+
+TIFF_CODECS = ['zlib', 'lzw', 'zstd']
+# Codecs that the client can decode in the project TIFFs
+PROJECT_TIFF_CODECS = ['zlib', 'lzw']
+# Highest compression level of each codec
+MAX_LEVELS = {'zlib': 9, 'zstd': 22}
+
+
+class TiffCodec(object):
+    """
+    Writes OME TIFFs with a compression codec and level, an optional predictor,
+    in tiles compressed on several threads.
+    """
+
+    def __init__(
+        self,
+        name='zlib',
+        level=None,
+        predictor=False,
+        tile_size=None,
+        workers=None,
+        valid_codecs=None,
+    ):
+        """
+        Args:
+            name (str): one of zlib, lzw, or zstd
+            level (int): compression level for zlib or zstd, or None for its default
+            predictor (bool): whether to compress the differences between neighboring pixels
+                of integer images
+            tile_size (int): width and height of the tiles, a multiple of 16,
+                or None to write each frame in strips
+            workers (int): threads to compress the tiles or strips with,
+                or None to let tifffile choose from the number of CPUs
+            valid_codecs (list): codecs allowed for the TIFF, defaults to all codecs
+
+        Raises:
+            ValueError: when the codec is not allowed or the level or tile size is invalid
+        """
+        valid_codecs = TIFF_CODECS if valid_codecs is None else valid_codecs
+        if name not in valid_codecs:
+            raise ValueError(
+                f'Invalid TIFF compression {name}. Choose from {", ".join(valid_codecs)}.'
+            )
+        if level is not None:
+            try:
+                level = int(level)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid compression level {level}.')
+            if name not in MAX_LEVELS or not 0 <= level <= MAX_LEVELS[name]:
+                raise ValueError(f'Invalid compression level {level} for {name}.')
+        if tile_size is not None and (tile_size <= 0 or tile_size % 16 != 0):
+            raise ValueError(
+                f'Invalid tile size {tile_size}. Tiles must be a multiple of 16 pixels.'
+            )
+        self.name = name
+        self.level = level
+        self.predictor = predictor
+        self.tile_size = tile_size
+        self.workers = workers
+
+    def __repr__(self):
+        return (
+            f'TiffCodec({self.name!r}, {self.level!r}, {self.predictor!r},'
+            f' {self.tile_size!r}, {self.workers!r})'
+        )
+
+    def write(self, f, array, metadata, name='image.ome.tiff'):
+        """
+        Writes an array to an OME TIFF.
+
+        Frames larger than a tile are written in tiles, so readers can load
+        part of a frame, and smaller frames in strips.
+        Arrays that are not C-contiguous, like arrays with a moved channel axis,
+        are written a tile or frame at a time instead of copying the whole array.
+
+        Args:
+            f: seekable binary file object
+            array (numpy.ndarray): array with the frames on the last two axes
+            metadata (dict): OME metadata with the axes of the array
+            name (str): name of the TIFF, as spooled temporary files have no name
+        """
+        height, width = array.shape[-2:]
+        tile = None
+        if self.tile_size is not None and max(height, width) > self.tile_size:
+            tile = (self.tile_size, self.tile_size)
+        compressionargs = None if self.level is None else {'level': self.level}
+        data = array
+        if not array.flags.c_contiguous:
+            data = iter_tiles(array, tile) if tile else iter_frames(array)
+        with TiffWriter(FileHandle(f, mode='wb', name=name), ome=True) as tif:
+            tif.write(
+                data,
+                shape=array.shape,
+                dtype=array.dtype,
+                photometric='minisblack',
+                compression=self.name,
+                compressionargs=compressionargs,
+                predictor=self.predictor and array.dtype.kind in 'iu' or None,
+                tile=tile,
+                maxworkers=self.workers,
+                metadata=metadata,
+            )
+
+
+def iter_frames(array):
+    """Yields each frame on the last two axes of an array."""
+    for index in np.ndindex(array.shape[:-2]):
+        yield np.ascontiguousarray(array[index])
+
+
+def iter_tiles(array, tile):
+    """Yields the tiles of each frame on the last two axes of an array, row by row."""
+    height, width = array.shape[-2:]
+    rows = range(0, height, tile[0])
+    columns = range(0, width, tile[1])
+    for index in np.ndindex(array.shape[:-2]):
+        frame = array[index]
+        for y, x in itertools.product(rows, columns):
+            yield np.ascontiguousarray(frame[y : y + tile[0], x : x + tile[1]])
+
+
+def spooled_file():
+    """Returns a temporary file kept in memory until it is larger than PROJECT_SPOOL_SIZE."""
+    return tempfile.SpooledTemporaryFile(max_size=PROJECT_SPOOL_SIZE * 1024 * 1024)
+
+
+def write_ome_tiff(zf, name, array, metadata, tiff_codec, zip_codec):
+    """
+    Writes an array to an OME TIFF member of a zip file.
+
+    TiffWriter seeks back to write offsets, so it cannot write into the zip,
+    and writes to a spooled temporary file that is copied into the zip instead.
+
+    Args:
+        zf (zipfile.ZipFile): zip file open for writing
+        name (str): name of the member, like X.ome.tiff
+        array (numpy.ndarray): array with the frames on the last two axes
+        metadata (dict): OME metadata with the axes of the array
+        tiff_codec (TiffCodec): compression of the TIFF
+        zip_codec (Codec): compression of the zip
+    """
+    with spooled_file() as f:
+        tiff_codec.write(f, array, metadata, name)
+        zip_codec.write_file(zf, name, f)
+
+
+def default_image_codec(valid_codecs=None):
+    """Returns the TiffCodec for raw images from the TIFF_* settings."""
+    return TiffCodec(
+        TIFF_COMPRESSION,
+        TIFF_COMPRESSION_LEVEL or None,
+        TIFF_PREDICTOR,
+        TIFF_TILE_SIZE or None,
+        TIFF_WRITE_WORKERS or None,
+        valid_codecs,
+    )
+
+
+def default_label_codec(valid_codecs=None):
+    """Returns the TiffCodec for label images from the LABEL_TIFF_* settings."""
+    return TiffCodec(
+        LABEL_TIFF_COMPRESSION,
+        LABEL_TIFF_COMPRESSION_LEVEL or None,
+        LABEL_TIFF_PREDICTOR,
+        TIFF_TILE_SIZE or None,
+        TIFF_WRITE_WORKERS or None,
+        valid_codecs,
+    )
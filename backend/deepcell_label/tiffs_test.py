@@ -0,0 +1,96 @@
+"""Tests for tiffs.py"""
+
+import io
+import zipfile
+
+import numpy as np
+import pytest
+from tifffile import TiffFile
+
+from deepcell_label.compression import Codec
+from deepcell_label.tiffs import (
+    PROJECT_TIFF_CODECS,
+    TiffCodec,
+    default_image_codec,
+    default_label_codec,
+    write_ome_tiff,
+)
+
+
+@pytest.mark.parametrize(
+    'codec',
+    [
+        TiffCodec('zlib', 1, True, 32, 2),
+        TiffCodec('zlib', None, False, 32),
+        TiffCodec('lzw', None, True),
+        TiffCodec('zstd', 3, False, 16),
+    ],
+)
+@pytest.mark.parametrize('contiguous', [True, False])
+def test_write(codec, contiguous):
+    rng = np.random.default_rng(0)
+    array = rng.integers(0, 1000, (2, 40, 50, 3)).astype(np.int32)
+    # Move the channel axis like Loader
+    array = np.moveaxis(array, -1, 1)
+    if contiguous:
+        array = np.ascontiguousarray(array)
+    f = io.BytesIO()
+    codec.write(f, array, {'axes': 'ZCYX'})
+
+    f.seek(0)
+    with TiffFile(f) as tiff:
+        page = tiff.pages[0]
+        assert page.is_tiled == (codec.tile_size is not None)
+        assert page.predictor == (2 if codec.predictor else 1)
+        np.testing.assert_array_equal(
+            tiff.asarray(squeeze=False).reshape(array.shape), array
+        )
+
+
+def test_write_small_frames_in_strips():
+    """Does not pad frames smaller than a tile."""
+    f = io.BytesIO()
+    TiffCodec('zlib', tile_size=256).write(
+        f, np.zeros((1, 1, 10, 10)), {'axes': 'ZCYX'}
+    )
+    f.seek(0)
+    with TiffFile(f) as tiff:
+        assert not tiff.pages[0].is_tiled
+        # Floating point images are written without a predictor
+        assert tiff.pages[0].predictor == 1
+
+
+def test_write_ome_tiff():
+    array = np.arange(2 * 20 * 30).reshape((2, 1, 20, 30)).astype(np.uint16)
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, 'w') as zf:
+        write_ome_tiff(
+            zf, 'X.ome.tiff', array, {'axes': 'ZCYX'}, TiffCodec(), Codec('deflate')
+        )
+
+    with zipfile.ZipFile(f) as zf:
+        assert zf.getinfo('X.ome.tiff').compress_type == zipfile.ZIP_STORED
+        with TiffFile(zf.open('X.ome.tiff')) as tiff:
+            np.testing.assert_array_equal(
+                tiff.asarray(squeeze=False).reshape(array.shape), array
+            )
+
+
+def test_invalid_tiff_codec():
+    with pytest.raises(ValueError):
+        TiffCodec('jpeg')
+    with pytest.raises(ValueError):
+        TiffCodec('zstd', valid_codecs=PROJECT_TIFF_CODECS)
+    with pytest.raises(ValueError):
+        TiffCodec('lzw', 1)
+    with pytest.raises(ValueError):
+        TiffCodec('zlib', 10)
+    with pytest.raises(ValueError):
+        TiffCodec('zlib', 'high')
+    with pytest.raises(ValueError):
+        TiffCodec('zlib', tile_size=100)
+
+
+def test_default_codecs():
+    assert default_image_codec(PROJECT_TIFF_CODECS).name in PROJECT_TIFF_CODECS
+    assert default_label_codec(PROJECT_TIFF_CODECS).name in PROJECT_TIFF_CODECS